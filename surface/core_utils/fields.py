@@ -1,4 +1,5 @@
 import netaddr
+from django import forms
 from django.conf import settings
 from django.core import exceptions, validators
 from django.db import models
@@ -33,21 +34,82 @@ class UnsignedIntegerField(fields.IntegerField):
             raise exceptions.ValidationError("This value must be an unsigned integer.")
 
 
+class IPIntegerField(fields.Field):
+    """
+    unsigned integer up to 2^128 (any IPv4 or IPv6 address as integer)
+
+    stored as a fixed width (zero padded) decimal string, so it sorts and compares (lt, gte, etc)
+    as a number in every database, and can be indexed
+    """
+
+    WIDTH = 39
+    MAX_VALUE = 2**128 - 1
+    default_validators = [validators.MinValueValidator(0), validators.MaxValueValidator(MAX_VALUE)]
+
+    def __init__(self, *args, **kwargs):
+        kwargs["max_length"] = self.WIDTH
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs["max_length"]
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "CharField"
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError("This value must be an unsigned integer.")
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def get_prep_value(self, value):
+        value = self.to_python(super().get_prep_value(value))
+        if value is None:
+            return value
+        if not 0 <= value <= self.MAX_VALUE:
+            raise ValueError(f"{value} does not fit in {self.__class__.__name__}")
+        return f"{value:0{self.WIDTH}d}"
+
+    def formfield(self, **kwargs):
+        return super().formfield(
+            **{"form_class": forms.IntegerField, "min_value": 0, "max_value": self.MAX_VALUE, **kwargs}
+        )
+
+
+def parse_range(value):
+    """
+    :param value: CIDR (or single IP) or dash range ("first-last"), IPv4 or IPv6
+    :return: tuple with first and last IP of the range (as integers)
+    :raises: ValueError if `value` is not valid
+    """
+    try:
+        if "-" in value:
+            first, second = value.split("-")
+            _x = netaddr.IPRange(first.strip(), second.strip())
+        else:
+            _x = netaddr.IPNetwork(value.strip())
+    except (netaddr.AddrFormatError, ValueError, TypeError, AttributeError) as e:
+        raise ValueError(f"invalid range {value!r}: {e}")
+    return _x.first, _x.last
+
+
 class RangeModel(models.Model):
     range = models.CharField(max_length=100)
-    range_min = UnsignedIntegerField(null=True, blank=True)
-    range_max = UnsignedIntegerField(null=True, blank=True)
+    # IPv4 and IPv6 ranges, IP version is only in `range` (":" for IPv6)
+    range_min = IPIntegerField(null=True, blank=True)
+    range_max = IPIntegerField(null=True, blank=True)
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         try:
-            if "-" in self.range:
-                first, second = self.range.split("-")
-                _x = netaddr.IPRange(first, second)
-            else:
-                _x = netaddr.IPNetwork(self.range)
-            self.range_min = _x.first
-            self.range_max = _x.last
-        except Exception:
+            self.range_min, self.range_max = parse_range(self.range)
+        except ValueError:
             self.range_min = None
             self.range_max = None
         return super().save(force_insert, force_update, using, update_fields)
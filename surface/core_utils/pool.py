@@ -29,6 +29,14 @@ def optional_pool(processes=None, only_threads=False, initializer=None):
     return p
 
 
+def is_multi(pool):
+    """
+    :param pool: a pool returned by optional_pool
+    :return: True if it runs the work in other threads or processes, False if it is a FakePool
+    """
+    return getattr(pool, '_optional_multi', False)
+
+
 class _FakePool:
     _optional_multi = False
 
@@ -50,5 +58,36 @@ class _FakePool:
     def starmap(self, *a, **b):
         return itertools.starmap(*a, **b)
 
+    def apply_async(self, func, args=(), kwds=None):
+        # run it right away, result is ready by the time it is returned
+        try:
+            return _FakeResult(func(*args, **(kwds or {})))
+        except Exception as e:
+            return _FakeResult(e, success=False)
+
     def terminate(self):
         pass
+
+
+class _FakeResult:
+    """
+    mimics multiprocessing.pool.AsyncResult for _FakePool.apply_async
+    """
+
+    def __init__(self, value, success=True):
+        self._value = value
+        self._success = success
+
+    def ready(self):
+        return True
+
+    def successful(self):
+        return self._success
+
+    def wait(self, timeout=None):
+        pass
+
+    def get(self, timeout=None):
+        if self._success:
+            return self._value
+        raise self._value
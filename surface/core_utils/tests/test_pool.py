@@ -0,0 +1,11 @@
+from django.test import SimpleTestCase
+
+from core_utils import pool
+
+
+class Test(SimpleTestCase):
+    def test_is_multi(self):
+        with pool.optional_pool(1) as p:
+            self.assertFalse(pool.is_multi(p))
+        with pool.optional_pool(2, only_threads=True) as p:
+            self.assertTrue(pool.is_multi(p))
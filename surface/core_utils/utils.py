@@ -34,6 +34,30 @@ def array_split(array, parts):
         i += s
 
 
+def keyset_iterator(queryset, field, page_size=1000):
+    """
+    iterate over `queryset` ordered by (`field`, pk) one page at a time, seeking with WHERE instead of OFFSET
+    (and without relying on server-side cursors), so memory stays flat however big the table is
+
+    `field` must not be null
+    """
+    from django.db.models import Q
+
+    qs = queryset.order_by(field, 'pk')
+    last = None
+    while True:
+        page = qs
+        if last is not None:
+            page = page.filter(Q(**{f'{field}__gt': last[0]}) | Q(**{field: last[0], 'pk__gt': last[1]}))
+        page = list(page[:page_size])
+        if not page:
+            return
+        yield from page
+        if len(page) < page_size:
+            return
+        last = (getattr(page[-1], field), page[-1].pk)
+
+
 def admin_reverse(
     obj,
     action: Literal["changelist", "add", "history", "delete", "change"],
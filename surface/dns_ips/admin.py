@@ -1,4 +1,3 @@
-import netaddr
 from django.contrib import admin
 from django.db.models.query import QuerySet
 from django.http import HttpResponseRedirect
@@ -57,13 +56,9 @@ class IPRangeAdmin(DefaultFilterMixin, DefaultModelAdmin):
     def get_search_results(self, request, queryset, search_term):
         q, d = super().get_search_results(request, queryset, search_term)
         search_term = search_term.strip()
-        if search_term.count(".") == 3:
-            try:
-                val = netaddr.IPAddress(search_term)
-                q |= queryset.filter(range_min__lte=val, range_max__gte=val)
-            except Exception:
-                # just ignore, it is not an IP
-                pass
+        # netaddr also takes integers as IPs
+        if "." in search_term or ":" in search_term:
+            q |= queryset.filter(pk__in=models.IPRange.objects.index.containing(search_term))
         return q, d
 
     def get_queryset(self, request):
@@ -83,13 +78,14 @@ class IPAddress(DefaultFilterMixin, DefaultModelAdmin):
         "name",
         "organisation",
         "organisation_ip_owner",
+        "ip_range",
         "get_tags",
         "notes",
     )
     list_display_links = ("name",)
     search_fields = ("=name",)
     list_filter = ("source", "active", "tags")
-    list_select_related = ("source", "organisation", "organisation_ip_owner")
+    list_select_related = ("source", "organisation", "organisation_ip_owner", "ip_range")
 
     slack_display_name = True
 
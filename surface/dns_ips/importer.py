@@ -0,0 +1,380 @@
+import ipaddress
+import json
+import re
+import time
+from collections import namedtuple
+
+from django.utils import timezone
+
+from dns_ips import models
+from dns_ips.signals import bulk_changed
+
+DNSEntry = namedtuple('DNSEntry', 'name rtype ttl value')
+
+RTYPES = frozenset(models.DNSRecordValue.RecordType.values)
+# values are stored as IPAddress (DNSRecordValue.ips), one DNSRecordValue per record and type
+IP_RTYPES = frozenset(('A', 'AAAA'))
+# value is a single domain name, relative to $ORIGIN in zone files
+NAME_RTYPES = frozenset(('CNAME', 'NS', 'PTR'))
+# value ends with a domain name (after preference, or priority weight port), relative to $ORIGIN as well
+TARGET_RTYPES = {'MX': 2, 'SRV': 4}
+CLASSES = frozenset(('IN', 'CH', 'HS', 'CS'))
+NAME_MAX_LENGTH = models.DNSRecord._meta.get_field('name').max_length
+
+_TOKEN_RE = re.compile(r'\S+')
+# TTL in seconds or with units (BIND), such as 1h30m
+_TTL_RE = re.compile(r'^(?:\d+[smhdw]?)+$', re.IGNORECASE)
+_TTL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+class InvalidEntry(ValueError):
+    pass
+
+
+def normalize_name(name, origin=None):
+    """
+    lowercase, without trailing dot, `origin` appended to relative names ("@" is the origin itself)
+    """
+    name = name.strip().lower()
+    if origin is not None:
+        if name == '@':
+            name = origin
+        elif not name.endswith('.'):
+            name = f'{name}.{origin}'
+    return name.rstrip('.')
+
+
+def read_ndjson(lines):
+    """
+    one JSON object per line, with "name", "rtype", "value" and (optional) "ttl"
+
+    :return: generator of DNSEntry or InvalidEntry (for lines that cannot be parsed)
+    """
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+            yield DNSEntry(normalize_name(data['name']), data['rtype'].upper(), data.get('ttl'), data.get('value'))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield InvalidEntry(f'line {n}: {e}')
+
+
+def parse_ttl(value):
+    """
+    :return: TTL in seconds or None if `value` is not a TTL
+    """
+    if not _TTL_RE.match(value):
+        return None
+    return sum(int(n) * _TTL_UNITS[u.lower()] for n, u in re.findall(r'(\d+)([smhdw]?)', value, re.IGNORECASE))
+
+
+def _strip_comment(line):
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"' and (i == 0 or line[i - 1] != '\\'):
+            quoted = not quoted
+        elif c == ';' and not quoted:
+            return line[:i]
+    return line
+
+
+def _logical_lines(lines):
+    """
+    zone file lines without comments, entries split across lines with parentheses joined
+    """
+    pending = None
+    for n, line in enumerate(lines, 1):
+        line = _strip_comment(line.rstrip('\n'))
+        if pending is not None:
+            pending[1] += ' ' + line.replace('(', ' ').replace(')', ' ')
+            if ')' in line:
+                yield pending
+                pending = None
+            continue
+        if '(' in line and ')' not in line:
+            pending = [n, line.replace('(', ' ')]
+            continue
+        if line.strip():
+            yield [n, line.replace('(', ' ').replace(')', ' ') if '(' in line else line]
+    if pending is not None:
+        yield pending
+
+
+def read_zone(lines, origin=None, ttl=None):
+    """
+    master (zone) file format (RFC 1035), streamed: $ORIGIN and $TTL directives, relative names,
+    owner carried over from the previous entry, multi-line entries (parentheses)
+
+    entries without TTL get the $TTL default (RFC 2308), or the TTL of the previous entry if there is none
+
+    :param ttl: default TTL, same as a $TTL directive
+    :return: generator of DNSEntry or InvalidEntry (for lines that cannot be parsed)
+    """
+    if origin is not None:
+        origin = normalize_name(origin)
+    owner = None
+    last_ttl = None
+    for n, line in _logical_lines(lines):
+        tokens = list(_TOKEN_RE.finditer(line))
+        first = tokens[0].group()
+        if first.startswith('$'):
+            directive = first.upper()
+            if directive == '$ORIGIN' and len(tokens) > 1:
+                origin = normalize_name(tokens[1].group())
+            elif directive == '$TTL' and len(tokens) > 1 and parse_ttl(tokens[1].group()) is not None:
+                ttl = parse_ttl(tokens[1].group())
+            else:
+                yield InvalidEntry(f'line {n}: unsupported directive {first}')
+            continue
+
+        i = 0
+        if not line[0].isspace():
+            owner = normalize_name(first, origin)
+            i = 1
+        entry_ttl = None
+        rtype = None
+        while i < len(tokens):
+            token = tokens[i].group()
+            i += 1
+            if parse_ttl(token) is not None:
+                entry_ttl = parse_ttl(token)
+            elif token.upper() not in CLASSES:
+                rtype = token.upper()
+                break
+        if owner is None or rtype is None or i >= len(tokens):
+            yield InvalidEntry(f'line {n}: cannot parse {line.strip()!r}')
+            continue
+        value = line[tokens[i].start() :].strip()
+        if rtype != 'TXT':
+            # multi-line entries
+            value = ' '.join(value.split())
+        if rtype in NAME_RTYPES:
+            value = normalize_name(value, origin)
+        elif rtype in TARGET_RTYPES:
+            fields = value.split(' ')
+            if len(fields) == TARGET_RTYPES[rtype]:
+                fields[-1] = normalize_name(fields[-1], origin)
+                value = ' '.join(fields)
+        if entry_ttl is None:
+            # RFC 1035: same as the previous one, without $TTL
+            entry_ttl = last_ttl if ttl is None else ttl
+        last_ttl = entry_ttl
+        yield DNSEntry(owner, rtype, entry_ttl, value)
+
+
+class DNSImporter:
+    """
+    bulk upsert of DNS entries (DNSRecord, DNSRecordValue and their IPAddress) of one source
+
+    entries are processed in batches, each batch takes a fixed number of queries (no matter its size):
+    records, IPs and values are created with bulk_create and the existing ones updated in bulk
+    (`last_seen`, `active`, `ttl`), M2M through rows (DNSRecordValue.ips) are bulk created as well
+
+    IPs of a value are only added, never removed (import might not include all of them, such as split feeds),
+    links to IPs not seen anymore are left to the last_seen sweep
+    """
+
+    COUNTERS = (
+        'entries',
+        'invalid',
+        'records_created',
+        'records_seen',
+        'values_created',
+        'values_seen',
+        'ips_created',
+        'ips_seen',
+        'ip_links',
+    )
+
+    def __init__(self, source, batch_size=5000, logger=None, progress_every=100000):
+        self.source = source
+        self.batch_size = batch_size
+        self.logger = logger
+        self.progress_every = progress_every
+        self.started = timezone.now()
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+        self.invalid = []
+        self._monotonic = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self._monotonic
+
+    def rate(self):
+        """
+        :return: entries imported per second (including reading and parsing them)
+        """
+        elapsed = self.elapsed()
+        return self.counts['entries'] / elapsed if elapsed else 0
+
+    def _invalid(self, error, keep=100):
+        self.counts['invalid'] += 1
+        # only a sample, there might be millions
+        if len(self.invalid) < keep:
+            self.invalid.append(error)
+
+    def validate(self, entry):
+        """
+        :return: DNSEntry ready to store (IPs normalized)
+        :raises: InvalidEntry
+        """
+        if not entry.name or len(entry.name) > NAME_MAX_LENGTH:
+            raise InvalidEntry(f'invalid name {entry.name!r}')
+        if entry.rtype not in RTYPES:
+            raise InvalidEntry(f'{entry.name}: unsupported type {entry.rtype}')
+        ttl = entry.ttl
+        if ttl is not None:
+            try:
+                ttl = int(ttl)
+            except (TypeError, ValueError):
+                raise InvalidEntry(f'{entry.name}: invalid TTL {ttl!r}')
+        value = entry.value
+        if entry.rtype in IP_RTYPES:
+            try:
+                ip = ipaddress.ip_address(str(value).strip())
+            except ValueError:
+                raise InvalidEntry(f'{entry.name}: invalid {entry.rtype} {value!r}')
+            if ip.version != (4 if entry.rtype == 'A' else 6):
+                raise InvalidEntry(f'{entry.name}: invalid {entry.rtype} {value!r}')
+            value = str(ip)
+        return entry._replace(ttl=ttl, value=value)
+
+    def run(self, entries):
+        """
+        :param entries: iterable of DNSEntry (or InvalidEntry), such as from `read_zone` or `read_ndjson`
+        :return: `counts`
+        """
+        batch = []
+        last_progress = 0
+        for entry in entries:
+            if isinstance(entry, InvalidEntry):
+                self._invalid(str(entry))
+                continue
+            try:
+                batch.append(self.validate(entry))
+            except InvalidEntry as e:
+                self._invalid(str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self.save_batch(batch)
+                batch = []
+                if self.logger is not None and self.counts['entries'] - last_progress >= self.progress_every:
+                    last_progress = self.counts['entries']
+                    self.logger.info('%d entries imported (%.0f rows/s)', last_progress, self.rate())
+        if batch:
+            self.save_batch(batch)
+        return self.counts
+
+    def _upsert_records(self, names):
+        """
+        :return: dict of name to DNSRecord pk
+        """
+        qs = models.DNSRecord.objects.filter(source=self.source)
+        # duplicates already in the table: oldest one is used
+        existing = {}
+        for pk, name in qs.filter(name__in=names).order_by('-pk').values_list('pk', 'name'):
+            existing[name] = pk
+        missing = names - existing.keys()
+        models.DNSRecord.objects.bulk_create(
+            [models.DNSRecord(source=self.source, name=name, last_seen=self.started) for name in missing],
+            batch_size=self.batch_size,
+        )
+        models.DNSRecord.objects.filter(pk__in=existing.values()).update(last_seen=self.started, active=True)
+        if missing:
+            # pks are not returned by bulk_create in every database
+            existing.update(qs.filter(name__in=missing).values_list('name', 'pk'))
+        self.counts['records_created'] += len(missing)
+        self.counts['records_seen'] += len(names) - len(missing)
+        return existing
+
+    def _upsert_ips(self, ips):
+        """
+        :return: dict of IP to IPAddress pk
+        """
+        if not ips:
+            return {}
+        qs = models.IPAddress.objects.filter(source=self.source)
+        existing = dict(qs.filter(name__in=ips).values_list('name', 'pk'))
+        missing = ips - existing.keys()
+        # (source, name) is unique, concurrent imports of the same source do not fail
+        models.IPAddress.objects.bulk_create(
+            [models.IPAddress(source=self.source, name=ip, last_seen=self.started) for ip in missing],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        models.IPAddress.objects.filter(pk__in=existing.values()).update(last_seen=self.started, active=True)
+        if missing:
+            existing.update(qs.filter(name__in=missing).values_list('name', 'pk'))
+        self.counts['ips_created'] += len(missing)
+        self.counts['ips_seen'] += len(ips) - len(missing)
+        return existing
+
+    def _upsert_values(self, wanted):
+        """
+        :param wanted: dict of (record pk, rtype, value) to TTL
+        :return: dict of (record pk, rtype, value) to DNSRecordValue pk
+        """
+        qs = models.DNSRecordValue.objects.filter(record_id__in={k[0] for k in wanted})
+        existing = {}
+        ttl_changed = []
+        for pk, record_id, rtype, value, ttl in qs.order_by('-pk').values_list(
+            'pk', 'record_id', 'rtype', 'value', 'ttl'
+        ):
+            key = (record_id, rtype, value)
+            if key in wanted:
+                existing[key] = pk
+                if ttl != wanted[key]:
+                    ttl_changed.append(models.DNSRecordValue(pk=pk, ttl=wanted[key]))
+        missing = wanted.keys() - existing.keys()
+        models.DNSRecordValue.objects.bulk_create(
+            [
+                models.DNSRecordValue(
+                    record_id=key[0], rtype=key[1], value=key[2], ttl=wanted[key], last_seen=self.started
+                )
+                for key in missing
+            ],
+            batch_size=self.batch_size,
+        )
+        models.DNSRecordValue.objects.bulk_update(ttl_changed, ['ttl'], batch_size=self.batch_size)
+        models.DNSRecordValue.objects.filter(pk__in=existing.values()).update(last_seen=self.started, active=True)
+        if missing:
+            for pk, record_id, rtype, value in qs.exclude(pk__in=existing.values()).values_list(
+                'pk', 'record_id', 'rtype', 'value'
+            ):
+                key = (record_id, rtype, value)
+                if key in missing:
+                    existing[key] = pk
+        self.counts['values_created'] += len(missing)
+        self.counts['values_seen'] += len(wanted) - len(missing)
+        return existing
+
+    def save_batch(self, batch):
+        records = self._upsert_records({e.name for e in batch})
+        ips = self._upsert_ips({e.value for e in batch if e.rtype in IP_RTYPES})
+
+        wanted = {}
+        links = set()
+        for e in batch:
+            # IP values are in DNSRecordValue.ips, not in value
+            key = (records[e.name], e.rtype, None if e.rtype in IP_RTYPES else e.value)
+            wanted[key] = e.ttl
+            if e.rtype in IP_RTYPES:
+                links.add((key, ips[e.value]))
+        values = self._upsert_values(wanted)
+
+        through = models.DNSRecordValue.ips.through
+        # existing links are ignored (unique)
+        through.objects.bulk_create(
+            [through(dnsrecordvalue_id=values[key], ipaddress_id=ip_pk) for key, ip_pk in links],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        self.counts['ip_links'] += len(links)
+
+        # denormalized data (such as scanner targets) depends on records, their values and IPs
+        bulk_changed.send(sender=models.DNSRecord, pks=list(records.values()))
+        if ips:
+            bulk_changed.send(sender=models.IPAddress, pks=list(ips.values()))
+
+        self.counts['entries'] += len(batch)
@@ -0,0 +1,78 @@
+from dns_ips import models
+from dns_ips.ranges import parse_ip
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Link every IPAddress to the most specific (narrowest) IPRange containing it, such as after a range import.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=1000, type=int, help='IPAddresses read and updated per batch')
+        parser.add_argument(
+            '--include-inactive', action='store_true', help='Also link to inactive ranges (default is active only)'
+        )
+        parser.add_argument('-d', '--dry', action='store_true', help='Dry run, only report changes')
+
+    def load_ips(self, batch_size):
+        """
+        :return: dict of IP version to list of (IP as integer, pk, current ip_range_id), unsorted
+        """
+        ips = {4: [], 6: []}
+        last_pk = 0
+        while True:
+            batch = list(
+                models.IPAddress.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'name', 'ip_range_id')[:batch_size]
+            )
+            if not batch:
+                break
+            for pk, name, current in batch:
+                parsed = parse_ip(name)
+                if parsed is None:
+                    # not an IP, should not be linked to anything
+                    ips[4].append((-1, pk, current))
+                else:
+                    ips[parsed[0]].append((parsed[1], pk, current))
+            last_pk = batch[-1][0]
+        return ips
+
+    def sweep(self, ips, segments, allowed=None):
+        """
+        merge IPs (sorted by value) with the range segments, in a single pass
+
+        :param allowed: set of range pks that can be linked, None for all
+        :return: dict of new ip_range_id to list of IPAddress pks (only the ones that changed)
+        """
+        changes = {}
+        ips.sort()
+        for (_, pk, current), pks in zip(ips, segments.lookup_sorted(value for value, _, _ in ips)):
+            best = next((x for x in pks if allowed is None or x in allowed), None)
+            if best != current:
+                changes.setdefault(best, []).append(pk)
+        return changes
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # rebuilt now, ranges might have been imported in bulk
+        segments = models.IPRange.objects.index.segments(max_age=0)
+        allowed = None
+        if not options['include_inactive']:
+            allowed = set(models.IPRange.objects.filter(active=True).values_list('pk', flat=True))
+
+        ips = self.load_ips(batch_size)
+        changed = 0
+        for version, values in ips.items():
+            for range_id, pks in self.sweep(values, segments[version], allowed=allowed).items():
+                changed += len(pks)
+                self.log_debug('%d IPv%d addresses now in range %s', len(pks), version, range_id)
+                if options['dry']:
+                    continue
+                for i in range(0, len(pks), batch_size):
+                    models.IPAddress.objects.filter(pk__in=pks[i : i + batch_size]).update(ip_range_id=range_id)
+        self.log(
+            '%s %d out of %d IP addresses',
+            'Would update' if options['dry'] else 'Updated',
+            changed,
+            sum(len(v) for v in ips.values()),
+        )
@@ -0,0 +1,77 @@
+import gzip
+import sys
+
+from django.core.management.base import CommandError
+
+from dns_ips import importer, models, sweep
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Import DNS records (records, values and IPs) of a source from a zone file or NDJSON feed, in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', metavar='SOURCE', help='Source name (must exist)')
+        parser.add_argument('file', metavar='FILE', help='File to import ("-" for stdin), gzipped if ending in .gz')
+        parser.add_argument(
+            '-f',
+            '--format',
+            choices=('zone', 'ndjson'),
+            help='FILE format, default based on its extension (.json/.ndjson for ndjson, zone otherwise)',
+        )
+        parser.add_argument('--origin', help='Zone $ORIGIN, if not in FILE')
+        parser.add_argument('--batch-size', default=5000, type=int, help='Entries imported per batch')
+        parser.add_argument(
+            '--sweep',
+            action='store_true',
+            help='FILE is the complete source, deactivate its records, values and IPs not in it',
+        )
+
+    def open(self, path):
+        if path == '-':
+            return sys.stdin
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt')
+        return open(path)
+
+    def handle(self, *args, **options):
+        try:
+            source = models.Source.objects.get(name=options['source'])
+        except models.Source.DoesNotExist:
+            raise CommandError(f'source {options["source"]} does not exist')
+
+        path = options['file']
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'ndjson' if path.removesuffix('.gz').endswith(('.json', '.ndjson')) else 'zone'
+
+        job = importer.DNSImporter(source, batch_size=options['batch_size'], logger=self.logger)
+        with self.open(path) as f:
+            if fmt == 'ndjson':
+                entries = importer.read_ndjson(f)
+            else:
+                entries = importer.read_zone(f, origin=options['origin'])
+            counts = job.run(entries)
+
+        for error in job.invalid:
+            self.log_warning('skipped %s', error)
+        self.log(
+            '%s: %d entries in %.1fs (%.0f rows/s), %d invalid - records %d created/%d seen, '
+            'values %d created/%d seen, IPs %d created/%d seen',
+            source.name,
+            counts['entries'],
+            job.elapsed(),
+            job.rate(),
+            counts['invalid'],
+            counts['records_created'],
+            counts['records_seen'],
+            counts['values_created'],
+            counts['values_seen'],
+            counts['ips_created'],
+            counts['ips_seen'],
+        )
+        if options['sweep']:
+            deactivated = sweep.sweep_source(
+                source, job.started, only=(models.DNSRecord, models.DNSRecordValue, models.IPAddress)
+            )
+            self.log('%s: deactivated %s', source.name, ', '.join(f'{v} {k}' for k, v in deactivated.items()))
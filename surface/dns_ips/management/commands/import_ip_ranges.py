@@ -0,0 +1,51 @@
+import csv
+
+from django.core.management.base import CommandError
+
+from dns_ips import models
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Load the IP ranges of a source from a CSV file (such as an IPAM export), in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', metavar='SOURCE', help='Source name (must exist)')
+        parser.add_argument(
+            'file',
+            metavar='FILE',
+            help=f'CSV file with header, "range" column required, optional {", ".join(models.IPRange.INGEST_FIELDS)}',
+        )
+        parser.add_argument('--batch-size', default=1000, type=int, help='Ranges created/updated per batch')
+        parser.add_argument(
+            '--keep-missing',
+            action='store_true',
+            help='Do not deactivate ranges of SOURCE missing from FILE (partial file)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = models.Source.objects.get(name=options['source'])
+        except models.Source.DoesNotExist:
+            raise CommandError(f'source {options["source"]} does not exist')
+
+        with open(options['file'], newline='') as f:
+            reader = csv.DictReader(f)
+            if 'range' not in (reader.fieldnames or []):
+                raise CommandError('"range" column is missing')
+            result = models.IPRange.objects.ingest(
+                source, reader, batch_size=options['batch_size'], deactivate_missing=not options['keep_missing']
+            )
+
+        for _, error in result.invalid:
+            self.log_warning('skipped %s', error)
+        self.log(
+            '%s: %d created, %d updated, %d unchanged, %d deactivated, %d duplicated, %d invalid',
+            source.name,
+            result.created,
+            result.updated,
+            result.unchanged,
+            result.deactivated,
+            result.duplicated,
+            len(result.invalid),
+        )
@@ -0,0 +1,52 @@
+from django.core.management.base import CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from dns_ips import models, sweep
+from logbasecommand.base import LogBaseCommand
+
+
+class Command(LogBaseCommand):
+    help = 'Deactivate the records of a source not reported by its last sync (last_seen older than the sync start).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', metavar='SOURCE', help='Source name')
+        parser.add_argument(
+            '--since',
+            required=True,
+            help='Sync start time (ISO 8601), rows not seen since are stale. Use the start of the import that covered '
+            'all the rows of the models swept, such as import_dns for the DNS ones',
+        )
+        parser.add_argument(
+            '-m',
+            '--model',
+            action='append',
+            choices=[m.__name__ for m in sweep.MODELS],
+            help='Only MODEL (default is all)',
+        )
+        parser.add_argument('--chunk-size', default=10000, type=int, help='Primary key range updated per transaction')
+        parser.add_argument('-d', '--dry', action='store_true', help='Dry run, only count the stale rows')
+
+    def handle(self, *args, **options):
+        try:
+            source = models.Source.objects.get(name=options['source'])
+        except models.Source.DoesNotExist:
+            raise CommandError(f'source {options["source"]} does not exist')
+
+        since = parse_datetime(options['since'])
+        if since is None:
+            raise CommandError(f'invalid date {options["since"]}')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+        only = sweep.MODELS
+        if options['model']:
+            only = [m for m in sweep.MODELS if m.__name__ in options['model']]
+        counts = sweep.sweep_source(source, since, only=only, chunk_size=options['chunk_size'], dry_run=options['dry'])
+        self.log(
+            '%s %s rows not seen since %s: %s',
+            'Would deactivate' if options['dry'] else 'Deactivated',
+            source.name,
+            since.isoformat(),
+            ', '.join(f'{v} {k}' for k, v in counts.items()),
+        )
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:17
+
+import core_utils.fields
+import netaddr
+from django.db import migrations, models
+
+
+def store_padded(apps, schema_editor):
+    # converted columns have the old (unpadded) values, which do not compare correctly as strings
+    # historical models do not have RangeModel.save(), same parsing here
+    iprange = apps.get_model("dns_ips", "IPRange")
+    batch = []
+    for rng in iprange.objects.exclude(range_min__isnull=True).only("range").iterator():
+        try:
+            if "-" in rng.range:
+                first, second = rng.range.split("-")
+                _x = netaddr.IPRange(first, second)
+            else:
+                _x = netaddr.IPNetwork(rng.range)
+            rng.range_min, rng.range_max = _x.first, _x.last
+        except Exception:
+            rng.range_min, rng.range_max = None, None
+        batch.append(rng)
+        if len(batch) >= 1000:
+            iprange.objects.bulk_update(batch, ["range_min", "range_max"])
+            batch = []
+    iprange.objects.bulk_update(batch, ["range_min", "range_max"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dns_ips', '0007_remove_unused_fields'),
+        ('inventory', '0004_alter_finding_related_to'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='iprange',
+            name='range_max',
+            field=core_utils.fields.IPIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='iprange',
+            name='range_min',
+            field=core_utils.fields.IPIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(store_padded, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='iprange',
+            index=models.Index(fields=['range_min', 'range_max'], name='dns_ips_ipr_range_m_e5081d_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dns_ips', '0008_iprange_128bit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ipaddress',
+            name='ip_range',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='ip_addresses',
+                to='dns_ips.iprange',
+            ),
+        ),
+    ]
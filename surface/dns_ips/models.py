@@ -1,10 +1,14 @@
 import functools
+from collections import namedtuple
 
 from bulk_update_or_create import BulkUpdateOrCreateQuerySet
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
-from core_utils.fields import RangeModel
+from core_utils.fields import RangeModel, parse_range
+from dns_ips.ranges import RangeIndex
 
 
 def default_source_unknown():
@@ -73,7 +77,165 @@ class Organisation(models.Model):
         verbose_name_plural = "Organisations"
 
 
+class IndexVersion(models.Model):
+    """
+    version of an in-memory index (such as IPRange.objects.index), changed with the data it indexes
+    so every process rebuilds its own copy
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+IngestResult = namedtuple("IngestResult", "created updated unchanged deactivated duplicated invalid")
+
+
+class IPRangeIngest:
+    """
+    bulk load of the ranges of one source (such as an IPAM export), see IPRangeManager.ingest
+    """
+
+    def __init__(self, model, source, batch_size=1000):
+        self.model = model
+        self.source = source
+        self.batch_size = batch_size
+        self.started = timezone.now()
+        self.counts = dict.fromkeys(("created", "updated", "unchanged", "duplicated"), 0)
+        self.invalid = []
+
+    def parse(self, entries):
+        """
+        :return: dict of normalized range to (first, last, fields), without invalid entries (kept in `invalid`),
+                 fields are only the INGEST_FIELDS in the entry (others are left as they are)
+        """
+        parsed = {}
+        for entry in entries:
+            rng = entry.get("range") or ""
+            try:
+                first, last = parse_range(rng)
+            except ValueError as e:
+                self.invalid.append((rng, str(e)))
+                continue
+            # same range written in different ways (spaces) is the same entry
+            rng = "-".join(x.strip() for x in rng.split("-"))
+            if rng in parsed:
+                self.counts["duplicated"] += 1
+            # duplicates: last one wins
+            # values as given (empty or 0 included)
+            parsed[rng] = (first, last, {f: entry[f] for f in self.model.INGEST_FIELDS if f in entry})
+        return parsed
+
+    def save_batch(self, batch):
+        """
+        :param batch: dict of range to (first, last, fields), as returned by `parse`
+        """
+        existing = {}
+        for obj in self.model.objects.filter(source=self.source, range__in=batch.keys()).order_by("-pk"):
+            # duplicates already in the table: oldest one is kept up to date
+            existing[obj.range] = obj
+        to_create = []
+        # tuple of fields to update => objects
+        to_update = {}
+        seen = []
+        for rng, (first, last, fields) in batch.items():
+            obj = existing.get(rng)
+            if obj is None:
+                to_create.append(
+                    self.model(
+                        source=self.source,
+                        range=rng,
+                        range_min=first,
+                        range_max=last,
+                        last_seen=self.started,
+                        **fields,
+                    )
+                )
+                continue
+            values = {"range_min": first, "range_max": last, "active": True, **fields}
+            if all(getattr(obj, k) == v for k, v in values.items()):
+                seen.append(obj.pk)
+                continue
+            for k, v in values.items():
+                setattr(obj, k, v)
+            obj.last_seen = self.started
+            to_update.setdefault(tuple(fields), []).append(obj)
+
+        self.model.objects.bulk_create(to_create, batch_size=self.batch_size)
+        for fields, objs in to_update.items():
+            self.model.objects.bulk_update(
+                objs, ["range_min", "range_max", "active", "last_seen", *fields], batch_size=self.batch_size
+            )
+        if seen:
+            self.model.objects.filter(pk__in=seen).update(last_seen=self.started)
+        self.counts["created"] += len(to_create)
+        self.counts["updated"] += sum(len(x) for x in to_update.values())
+        self.counts["unchanged"] += len(seen)
+
+    def deactivate_missing(self):
+        """
+        deactivate ranges of the source not in this load (`last_seen` older than its start)
+        """
+        # dns_ips.sweep needs this module loaded
+        from dns_ips.sweep import sweep_model
+
+        return sweep_model(self.model, self.source, self.started, chunk_size=self.batch_size)
+
+
+class IPRangeManager(models.Manager):
+    @functools.cached_property
+    def index(self):
+        return RangeIndex(self.model, IndexVersion)
+
+    def containing(self, ip):
+        """
+        :return: queryset of the ranges containing `ip` (IPv4 or IPv6), none if it is not a valid IP
+        """
+        return self.filter(pk__in=self.index.containing(ip))
+
+    def containing_many(self, ips, queryset=None):
+        """
+        ranges containing each of `ips`, all looked up at once (and ranges fetched in a single query)
+
+        :param queryset: only ranges in this queryset (such as active ones), default is all
+        :return: dict of each of `ips` to list of IPRange containing it, narrowest range first
+        """
+        found = self.index.containing_many(ips)
+        if queryset is None:
+            queryset = self.all()
+        ranges = queryset.in_bulk({pk for pks in found.values() for pk in pks})
+        return {ip: [ranges[pk] for pk in pks if pk in ranges] for ip, pks in found.items()}
+
+    def ingest(self, source, entries, batch_size=1000, deactivate_missing=True):
+        """
+        bulk create/update the ranges of `source`, keyed on (source, range), such as from an IPAM export
+
+        ranges are parsed (CIDR or dash ranges, IPv4 or IPv6) and their bounds computed here, in batches,
+        instead of one RangeModel.save() per range
+
+        :param entries: iterable of dicts with "range" and (optionally) any of IPRange.INGEST_FIELDS
+        :param deactivate_missing: deactivate ranges of `source` not in `entries` (so `entries` must be complete)
+        :return: IngestResult with counts, `invalid` is a list of (range, error) not loaded
+        """
+        ingest = IPRangeIngest(self.model, source, batch_size=batch_size)
+        parsed = ingest.parse(entries)
+        keys = list(parsed)
+        for i in range(0, len(keys), batch_size):
+            ingest.save_batch({k: parsed[k] for k in keys[i : i + batch_size]})
+        deactivated = ingest.deactivate_missing() if deactivate_missing else 0
+        # bulk operations do not send signals
+        self.index.invalidate()
+        return IngestResult(deactivated=deactivated, invalid=ingest.invalid, **ingest.counts)
+
+
 class IPRange(RangeModel):
+    # fields set by IPRange.objects.ingest
+    INGEST_FIELDS = ("vlan", "zone", "datacenter", "description")
+
+    objects = IPRangeManager()
+
     source = models.ForeignKey("Source", on_delete=models.CASCADE, default=default_source_unknown)
     active = models.BooleanField(default=True, db_index=True)
     last_seen = models.DateTimeField(default=timezone.now, editable=False, null=True, blank=True, db_index=True)
@@ -97,6 +259,13 @@ class IPRange(RangeModel):
     class Meta:
         verbose_name = "IP Range"
         verbose_name_plural = "IP Ranges"
+        indexes = [models.Index(fields=["range_min", "range_max"])]
+
+
+@receiver(post_save, sender=IPRange)
+@receiver(post_delete, sender=IPRange)
+def iprange_changed(sender, **kwargs):
+    IPRange.objects.index.invalidate()
 
 
 class IPAddress(models.Model):
@@ -122,6 +291,10 @@ class IPAddress(models.Model):
     )
     tags = models.ManyToManyField("dns_ips.Tag", blank=True)
     notes = models.TextField(null=True, blank=True)
+    # most specific (narrowest) active range containing this IP, set by enrich_ips_with_ranges
+    ip_range = models.ForeignKey(
+        "IPRange", blank=True, null=True, on_delete=models.SET_NULL, related_name="ip_addresses", editable=False
+    )
 
     def __str__(self):
         return str(self.name) or ""
@@ -0,0 +1,165 @@
+import bisect
+import threading
+import time
+
+import netaddr
+from django.db import transaction
+from django.db.models import F
+
+
+def parse_ip(ip):
+    """
+    :return: tuple with IP version and IP as integer, or None if `ip` is not valid
+    """
+    try:
+        ip = netaddr.IPAddress(str(ip).strip())
+    except (netaddr.AddrFormatError, ValueError, TypeError):
+        return None
+    return ip.version, int(ip)
+
+
+class _Segments:
+    """
+    IP ranges of one IP version flattened into sorted, non overlapping segments
+
+    each segment starts at `starts[i]` (up to the next one) and is covered by the ranges in `pks[i]`
+    (narrowest range first), adjacent segments covered by the same ranges are merged
+    """
+
+    def __init__(self, ranges):
+        """
+        :param ranges: iterable of (pk, first, last)
+        """
+        events = {}
+        sizes = {}
+        for pk, first, last in ranges:
+            sizes[pk] = last - first
+            events.setdefault(first, ([], []))[0].append(pk)
+            events.setdefault(last + 1, ([], []))[1].append(pk)
+
+        self.starts = []
+        self.pks = []
+        active = set()
+        # same set of ranges in many segments (nested ranges), share the tuple
+        interned = {(): ()}
+        for point in sorted(events):
+            added, removed = events[point]
+            active.difference_update(removed)
+            active.update(added)
+            key = tuple(sorted(active, key=lambda pk: (sizes[pk], pk)))
+            key = interned.setdefault(key, key)
+            if self.pks and self.pks[-1] is key:
+                continue
+            self.starts.append(point)
+            self.pks.append(key)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, value):
+        i = bisect.bisect_right(self.starts, value) - 1
+        return self.pks[i] if i >= 0 else ()
+
+    def lookup_sorted(self, values):
+        """
+        same as `lookup` for each of `values` (sorted), in a single pass over the segments
+        """
+        i = -1
+        last = len(self.starts) - 1
+        for value in values:
+            while i < last and self.starts[i + 1] <= value:
+                i += 1
+            yield self.pks[i] if i >= 0 else ()
+
+
+class RangeIndex:
+    """
+    in-memory containment index of IPRange (IPv4 and IPv6), built on first use
+
+    invalidated by IPRange signals, locally and in every other process (version stored in `version_model`,
+    checked every `version_check` seconds), rebuilt anyway after `max_age` seconds to pick up changes
+    that do not send signals (such as queryset.update)
+    """
+
+    max_age = 300
+    version_check = 5
+
+    def __init__(self, model, version_model):
+        self.model = model
+        self.version_model = version_model
+        self.name = model._meta.label
+        self._lock = threading.Lock()
+        # (version, built_at, {ip_version: _Segments})
+        self._index = None
+        # (checked_at, version)
+        self._version = None
+
+    def invalidate(self):
+        self._index = None
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        if not self.version_model.objects.filter(name=self.name).update(version=F('version') + 1):
+            self.version_model.objects.get_or_create(name=self.name, defaults={'version': 1})
+
+    def _shared_version(self):
+        checked = self._version
+        if checked is not None and time.monotonic() - checked[0] < self.version_check:
+            return checked[1]
+        version = self.version_model.objects.filter(name=self.name).values_list('version', flat=True).first()
+        self._version = (time.monotonic(), version)
+        return version
+
+    def _build(self, version):
+        ranges = {4: [], 6: []}
+        qs = self.model.objects.filter(range_min__isnull=False, range_max__isnull=False)
+        for pk, rng, first, last in qs.values_list('pk', 'range', 'range_min', 'range_max').iterator():
+            ranges[6 if ':' in rng else 4].append((pk, first, last))
+        return version, time.monotonic(), {k: _Segments(v) for k, v in ranges.items()}
+
+    def _outdated(self, index, version, max_age):
+        return index is None or index[0] != version or time.monotonic() - index[1] > max_age
+
+    def segments(self, max_age=None):
+        """
+        :param max_age: override `max_age`, 0 to rebuild now
+        :return: dict of IP version to _Segments, rebuilt if outdated
+        """
+        if max_age is None:
+            max_age = self.max_age
+        version = self._shared_version()
+        index = self._index
+        if self._outdated(index, version, max_age):
+            with self._lock:
+                index = self._index
+                if self._outdated(index, version, max_age):
+                    index = self._index = self._build(version)
+        return index[2]
+
+    def containing(self, ip):
+        """
+        :return: tuple with pks of the ranges containing `ip`, narrowest first
+        """
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return ()
+        return self.segments()[parsed[0]].lookup(parsed[1])
+
+    def containing_many(self, ips):
+        """
+        :return: dict of each of `ips` to tuple with pks of the ranges containing it, narrowest first
+        """
+        segments = self.segments()
+        result = {}
+        by_version = {4: [], 6: []}
+        for ip in ips:
+            parsed = parse_ip(ip)
+            if parsed is None:
+                result[ip] = ()
+            else:
+                by_version[parsed[0]].append((parsed[1], ip))
+        for version, values in by_version.items():
+            values.sort(key=lambda x: x[0])
+            for (_, ip), pks in zip(values, segments[version].lookup_sorted(v for v, _ in values)):
+                result[ip] = pks
+        return result
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# sent after bulk changes (no post_save/post_delete per object) to DNSRecord, DNSRecordValue (as their record)
+# or IPAddress, with sender=model and pks=list of the objects changed, so denormalized data can be updated
+bulk_changed = Signal()
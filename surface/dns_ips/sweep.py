@@ -0,0 +1,73 @@
+from django.db import transaction
+from django.db.models import Max, Min, Q
+
+from dns_ips import models
+from dns_ips.signals import bulk_changed
+
+# in dependency order, DNSRecordValue after DNSRecord (cascade)
+MODELS = (models.IPRange, models.IPAddress, models.DNSDomain, models.DNSRecord, models.DNSRecordValue)
+
+
+def stale(model, source, since):
+    """
+    :return: queryset of the active rows of `model` from `source` not seen since `since`
+    """
+    if model is models.DNSRecordValue:
+        # no source of its own, values of stale (or already inactive) records are stale as well
+        return model.objects.filter(
+            Q(last_seen__lt=since) | Q(record__active=False) | Q(record__last_seen__lt=since),
+            record__source=source,
+            active=True,
+        )
+    return model.objects.filter(source=source, active=True, last_seen__lt=since)
+
+
+def _deactivate_chunk(model, qs):
+    """
+    :return: number of rows deactivated
+    """
+    is_value = model is models.DNSRecordValue
+    with transaction.atomic():
+        rows = list(qs.values_list('pk', 'record_id' if is_value else 'pk'))
+        if not rows:
+            return 0
+        # same conditions again, rows seen in the meantime are kept
+        count = qs.filter(pk__in=[pk for pk, _ in rows]).update(active=False)
+    # denormalized data (such as scanner targets) depends on the active flag of records, their values and IPs
+    if is_value or model in (models.DNSRecord, models.IPAddress):
+        bulk_changed.send(sender=models.DNSRecord if is_value else model, pks=list({host for _, host in rows}))
+    return count
+
+
+def sweep_model(model, source, since, chunk_size=10000, dry_run=False):
+    """
+    deactivate the stale rows of `model` (see `stale`) in chunks of primary key ranges,
+    one short transaction per chunk, so tables are never locked for long
+
+    :return: number of rows deactivated (or that would be, if `dry_run`)
+    """
+    qs = stale(model, source, since)
+    if dry_run:
+        return qs.count()
+    bounds = qs.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    count = 0
+    for low in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        count += _deactivate_chunk(model, qs.filter(pk__gte=low, pk__lt=low + chunk_size))
+    return count
+
+
+def sweep_source(source, since, only=MODELS, chunk_size=10000, dry_run=False):
+    """
+    deactivate the rows of `source` that a sync (started at `since`) did not report, that is,
+    active rows with `last_seen` older than `since`
+
+    :param only: models to sweep (default is every model with a source), always in dependency order
+    :return: dict of model name to number of rows deactivated (or that would be, if `dry_run`)
+    """
+    return {
+        model.__name__: sweep_model(model, source, since, chunk_size=chunk_size, dry_run=dry_run)
+        for model in MODELS
+        if model in only
+    }
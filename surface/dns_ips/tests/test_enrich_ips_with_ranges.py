@@ -0,0 +1,48 @@
+from io import StringIO
+
+from django.core import management
+from django.test import TestCase
+
+from dns_ips.models import IPAddress, IPRange
+
+
+class Test(TestCase):
+    def _call(self, **kwargs):
+        out = StringIO()
+        management.call_command('enrich_ips_with_ranges', stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_enrich(self):
+        wide = IPRange.objects.create(range='10.0.0.0/8', zone='wide')
+        narrow = IPRange.objects.create(range='10.1.0.0/16', zone='narrow')
+        inactive = IPRange.objects.create(range='10.1.1.0/24', active=False)
+        v6 = IPRange.objects.create(range='2001:db8::/32')
+        for name in ('10.1.1.1', '10.2.0.1', '10.1.0.1', '192.168.0.1', '2001:db8::1', '2001:db9::1'):
+            IPAddress.objects.create(name=name)
+
+        self.assertEqual(self._call(dry=True), 'Would update 4 out of 6 IP addresses\n')
+        self.assertFalse(IPAddress.objects.filter(ip_range__isnull=False).exists())
+
+        self.assertEqual(self._call(batch_size=2), 'Updated 4 out of 6 IP addresses\n')
+        linked = dict(IPAddress.objects.values_list('name', 'ip_range'))
+        self.assertEqual(
+            linked,
+            {
+                '10.1.1.1': narrow.pk,
+                '10.2.0.1': wide.pk,
+                '10.1.0.1': narrow.pk,
+                '192.168.0.1': None,
+                '2001:db8::1': v6.pk,
+                '2001:db9::1': None,
+            },
+        )
+        self.assertEqual(IPAddress.objects.get(name='10.2.0.1').ip_range.zone, 'wide')
+
+        # nothing changed, nothing updated
+        with self.assertNumQueries(4):
+            self.assertEqual(self._call(), 'Updated 0 out of 6 IP addresses\n')
+
+        narrow.delete()
+        self.assertEqual(self._call(include_inactive=True), 'Updated 2 out of 6 IP addresses\n')
+        self.assertEqual(IPAddress.objects.get(name='10.1.1.1').ip_range, inactive)
+        self.assertEqual(IPAddress.objects.get(name='10.1.0.1').ip_range, wide)
@@ -0,0 +1,147 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core import management
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from dns_ips import importer
+from dns_ips.models import DNSRecord, DNSRecordValue, IPAddress, Source
+
+ZONE = '''$ORIGIN example.com.
+$TTL 1h
+@       IN SOA ns1 hostmaster (
+            2024010101 ; serial
+            3600 )
+        IN NS ns1
+www     300 IN A 10.0.0.1
+        300 IN A 10.0.0.2
+ipv6    IN AAAA 2001:DB8::1
+alias   CNAME www
+mail.other.com. IN MX 10 mx.other.com.
+txt     IN TXT "v=spf1 ; -all"
+bad     IN A 10.0.0.300
+weird   IN HINFO "x" "y"
+'''
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='dns', function='dns', owner='net')
+
+    def test_read_zone(self):
+        entries = list(importer.read_zone(ZONE.splitlines(True)))
+        self.assertEqual(
+            entries[:8],
+            [
+                importer.DNSEntry('example.com', 'SOA', 3600, 'ns1 hostmaster 2024010101 3600'),
+                importer.DNSEntry('example.com', 'NS', 3600, 'ns1.example.com'),
+                importer.DNSEntry('www.example.com', 'A', 300, '10.0.0.1'),
+                importer.DNSEntry('www.example.com', 'A', 300, '10.0.0.2'),
+                # $TTL, not the previous entry TTL (RFC 2308)
+                importer.DNSEntry('ipv6.example.com', 'AAAA', 3600, '2001:DB8::1'),
+                importer.DNSEntry('alias.example.com', 'CNAME', 3600, 'www.example.com'),
+                importer.DNSEntry('mail.other.com', 'MX', 3600, '10 mx.other.com'),
+                importer.DNSEntry('txt.example.com', 'TXT', 3600, '"v=spf1 ; -all"'),
+            ],
+        )
+        # no $TTL, previous entry TTL (RFC 1035), MX and SRV targets relative to the origin
+        zone = ['www 300 IN A 10.0.0.1\n', '@ IN MX 10 mail\n', '_sip._tcp 60 IN SRV 10 5 5060 sip\n', '@ NS ns1\n']
+        self.assertEqual(
+            list(importer.read_zone(zone, origin='example.com')),
+            [
+                importer.DNSEntry('www.example.com', 'A', 300, '10.0.0.1'),
+                importer.DNSEntry('example.com', 'MX', 300, '10 mail.example.com'),
+                importer.DNSEntry('_sip._tcp.example.com', 'SRV', 60, '10 5 5060 sip.example.com'),
+                importer.DNSEntry('example.com', 'NS', 60, 'ns1.example.com'),
+            ],
+        )
+        self.assertEqual(importer.parse_ttl('1h30m'), 5400)
+        self.assertIsNone(importer.parse_ttl('IN'))
+
+    def test_read_ndjson(self):
+        entries = list(
+            importer.read_ndjson(['{"name": "A.com.", "rtype": "a", "value": "1.1.1.1", "ttl": 60}\n', '\n', '{"x"\n'])
+        )
+        self.assertEqual(entries[0], importer.DNSEntry('a.com', 'A', 60, '1.1.1.1'))
+        self.assertIsInstance(entries[1], importer.InvalidEntry)
+
+    def test_import(self):
+        old = timezone.now() - timedelta(days=1)
+        record = DNSRecord.objects.create(source=self.source, name='www.example.com', active=False)
+        IPAddress.objects.create(source=self.source, name='10.0.0.1')
+        DNSRecord.objects.update(last_seen=old)
+
+        job = importer.DNSImporter(self.source, batch_size=3)
+        counts = job.run(importer.read_zone(ZONE.splitlines(True)))
+        self.assertEqual(counts['entries'], 8)
+        self.assertEqual(counts['invalid'], 2)
+        self.assertEqual((counts['records_created'], counts['records_seen']), (5, 2))
+        self.assertEqual(counts['ips_created'], 2)
+        self.assertEqual(len(job.invalid), 2)
+
+        record.refresh_from_db()
+        self.assertTrue(record.active)
+        self.assertGreater(record.last_seen, old)
+        value = DNSRecordValue.objects.get(record=record)
+        self.assertEqual((value.rtype, value.ttl, value.value), ('A', 300, None))
+        self.assertEqual(sorted(value.ips.values_list('name', flat=True)), ['10.0.0.1', '10.0.0.2'])
+        self.assertEqual(DNSRecordValue.objects.get(record__name='ipv6.example.com').ips.get().name, '2001:db8::1')
+        self.assertEqual(DNSRecordValue.objects.get(rtype='CNAME').value, 'www.example.com')
+        self.assertEqual(DNSRecordValue.objects.count(), 7)
+
+        # same feed again, nothing new, TTL updated
+        job = importer.DNSImporter(self.source, batch_size=100)
+        counts = job.run(
+            [
+                importer.DNSEntry('www.example.com', 'A', 60, '10.0.0.1'),
+                importer.DNSEntry('www.example.com', 'A', 60, '10.0.0.3'),
+            ]
+        )
+        self.assertEqual((counts['records_created'], counts['values_created'], counts['ips_created']), (0, 0, 1))
+        value.refresh_from_db()
+        self.assertEqual(value.ttl, 60)
+        self.assertEqual(value.ips.count(), 3)
+        self.assertEqual(DNSRecordValue.objects.count(), 7)
+
+    def test_import_queries(self):
+        # fixed number of queries per batch, no matter the batch size
+        queries = []
+        for n in (10, 100):
+            entries = [importer.DNSEntry(f'h{i}.n{n}.com', 'A', 60, f'10.0.{n}.{i}') for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                importer.DNSImporter(self.source, batch_size=n).run(entries)
+            queries.append(len(ctx.captured_queries))
+        self.assertEqual(queries[0], queries[1])
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write('{"name": "a.com", "rtype": "A", "value": "1.1.1.1"}\n{"name": "a.com", "rtype": "X"}\n')
+        self.addCleanup(os.unlink, f.name)
+
+        out = StringIO()
+        err = StringIO()
+        management.call_command('import_dns', 'dns', f.name, stdout=out, stderr=err)
+        self.assertRegex(
+            out.getvalue(),
+            r'^dns: 1 entries in \d+\.\ds \(\d+ rows/s\), 1 invalid - records 1 created/0 seen, '
+            r'values 1 created/0 seen, IPs 1 created/0 seen\n$',
+        )
+        self.assertEqual(err.getvalue(), 'skipped a.com: unsupported type X\n')
+        self.assertEqual(DNSRecordValue.objects.get().ips.get().name, '1.1.1.1')
+
+    def test_command_sweep(self):
+        DNSRecord.objects.create(source=self.source, name='old.com')
+        DNSRecord.objects.update(last_seen=timezone.now() - timedelta(days=1))
+        with tempfile.NamedTemporaryFile('w', suffix='.zone', delete=False) as f:
+            f.write('new.com. 60 IN A 1.1.1.1\n')
+        self.addCleanup(os.unlink, f.name)
+
+        out = StringIO()
+        management.call_command('import_dns', 'dns', f.name, sweep=True, stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue().splitlines()[1], 'dns: deactivated 0 IPAddress, 1 DNSRecord, 0 DNSRecordValue')
+        self.assertEqual(list(DNSRecord.objects.filter(active=True).values_list('name', flat=True)), ['new.com'])
@@ -0,0 +1,101 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core import management
+from django.test import TestCase
+from django.utils import timezone
+
+from dns_ips.models import IPRange, Source
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='ipam', function='ranges', owner='net')
+
+    def test_ingest(self):
+        other = Source.objects.create(name='other', function='ranges', owner='net')
+        old = timezone.now() - timedelta(days=1)
+        IPRange.objects.create(source=self.source, range='10.0.0.0/8', zone='old')
+        IPRange.objects.create(source=self.source, range='10.1.0.0/16', zone='same')
+        IPRange.objects.create(source=self.source, range='10.2.0.0/16')
+        IPRange.objects.create(source=other, range='10.3.0.0/16')
+        IPRange.objects.update(last_seen=old)
+
+        result = IPRange.objects.ingest(
+            self.source,
+            [
+                {'range': '10.0.0.0/8', 'zone': 'new'},
+                {'range': '10.1.0.0/16', 'zone': 'same'},
+                {'range': '10.4.0.0 - 10.4.0.255', 'zone': 'dup'},
+                {'range': '10.4.0.0-10.4.0.255', 'zone': 'dash', 'vlan': ''},
+                {'range': '2001:db8::/32', 'vlan': 0},
+                {'range': '10.0.0.0/33'},
+                {'range': '10.0.0.9-10.0.0.1'},
+            ],
+            batch_size=2,
+        )
+        self.assertEqual(result[:5], (2, 1, 1, 1, 1))
+        self.assertEqual([x[0] for x in result.invalid], ['10.0.0.0/33', '10.0.0.9-10.0.0.1'])
+
+        ranges = {r.range: r for r in IPRange.objects.filter(source=self.source)}
+        self.assertEqual(ranges['10.0.0.0/8'].zone, 'new')
+        self.assertGreater(ranges['10.1.0.0/16'].last_seen, old)
+        self.assertFalse(ranges['10.2.0.0/16'].active)
+        self.assertEqual(ranges['10.4.0.0-10.4.0.255'].zone, 'dash')
+        # falsy values are kept
+        self.assertEqual(ranges['10.4.0.0-10.4.0.255'].vlan, '')
+        self.assertEqual(ranges['2001:db8::/32'].vlan, '0')
+        self.assertEqual(ranges['10.4.0.0-10.4.0.255'].range_max, ranges['10.4.0.0-10.4.0.255'].range_min + 255)
+        self.assertEqual(ranges['2001:db8::/32'].range_min, 0x20010DB8 << 96)
+        # other sources untouched
+        self.assertTrue(IPRange.objects.get(source=other).active)
+        # bulk created, still in the containment index
+        self.assertEqual(
+            IPRange.objects.index.containing('10.4.0.1'),
+            (ranges['10.4.0.0-10.4.0.255'].pk, ranges['10.0.0.0/8'].pk),
+        )
+
+        # back in the feed, re-activated
+        result = IPRange.objects.ingest(self.source, [{'range': '10.2.0.0/16'}], deactivate_missing=False)
+        self.assertEqual(result.updated, 1)
+        self.assertTrue(IPRange.objects.get(range='10.2.0.0/16').active)
+        self.assertEqual(IPRange.objects.filter(source=self.source, active=True).count(), 5)
+
+        # fields missing from the entries are kept
+        result = IPRange.objects.ingest(
+            self.source,
+            [{'range': '10.1.0.0/16', 'vlan': '7'}, {'range': '10.0.0.0/8', 'datacenter': 'dc1'}],
+            deactivate_missing=False,
+        )
+        self.assertEqual(result.updated, 2)
+        ranges = IPRange.objects.filter(range__in=['10.0.0.0/8', '10.1.0.0/16']).order_by('range')
+        self.assertEqual(
+            list(ranges.values_list('zone', 'vlan', 'datacenter')), [('new', None, 'dc1'), ('same', '7', None)]
+        )
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('range,zone,datacenter\n10.0.0.0/8,z1,dc1\nnope,,\n')
+        self.addCleanup(os.unlink, f.name)
+
+        out = StringIO()
+        err = StringIO()
+        management.call_command('import_ip_ranges', 'ipam', f.name, stdout=out, stderr=err)
+        self.assertEqual(
+            out.getvalue(), 'ipam: 1 created, 0 updated, 0 unchanged, 0 deactivated, 0 duplicated, 1 invalid\n'
+        )
+        self.assertIn('skipped invalid range', err.getvalue())
+        r = IPRange.objects.get()
+        self.assertEqual((r.source, r.zone, r.datacenter, r.vlan), (self.source, 'z1', 'dc1', None))
+
+        # columns not in the file are kept
+        with open(f.name, 'w') as csv_file:
+            csv_file.write('range,vlan\n10.0.0.0/8,12\n')
+        management.call_command('import_ip_ranges', 'ipam', f.name, stdout=out, stderr=err)
+        r.refresh_from_db()
+        self.assertEqual((r.zone, r.datacenter, r.vlan), ('z1', 'dc1', '12'))
+
+        with self.assertRaisesMessage(management.CommandError, 'source nope does not exist'):
+            management.call_command('import_ip_ranges', 'nope', f.name, stdout=out, stderr=err)
@@ -0,0 +1,65 @@
+from django.test import TestCase
+
+from dns_ips.models import IndexVersion, IPRange
+from dns_ips.ranges import RangeIndex
+
+
+class Test(TestCase):
+    def test_storage(self):
+        r1 = IPRange.objects.create(range='9.0.0.0/8')
+        r2 = IPRange.objects.create(range='10.0.0.0/8')
+        r3 = IPRange.objects.create(range='2001:db8::/32')
+        r3.refresh_from_db()
+        self.assertEqual(r3.range_min, 0x20010DB8 << 96)
+        self.assertEqual(r3.range_max, (0x20010DB9 << 96) - 1)
+        # compares as numbers, not strings
+        self.assertEqual(list(IPRange.objects.filter(range_min__gte=9 << 24).order_by('range_min')), [r1, r2, r3])
+        self.assertEqual(list(IPRange.objects.filter(range_min__lt=10 << 24)), [r1])
+
+    def test_containing(self):
+        wide = IPRange.objects.create(range='10.0.0.0/8')
+        narrow = IPRange.objects.create(range='10.1.0.0-10.1.0.255')
+        other = IPRange.objects.create(range='11.0.0.0/8', active=False)
+        v6 = IPRange.objects.create(range='2001:db8::/32')
+        IPRange.objects.create(range='invalid')
+
+        self.assertEqual(set(IPRange.objects.containing('10.1.0.1')), {wide, narrow})
+        self.assertEqual(list(IPRange.objects.containing('10.2.0.1')), [wide])
+        self.assertEqual(list(IPRange.objects.containing('11.255.255.255')), [other])
+        self.assertEqual(list(IPRange.objects.containing('12.0.0.0')), [])
+        self.assertEqual(list(IPRange.objects.containing('2001:db8::1')), [v6])
+        # same integer as 10.1.0.1, different IP version
+        self.assertEqual(list(IPRange.objects.containing('::a01:1')), [])
+        self.assertEqual(list(IPRange.objects.containing('not an ip')), [])
+
+        with self.assertNumQueries(1):
+            found = IPRange.objects.containing_many(
+                ['10.1.0.1', '11.0.0.1', '9.9.9.9', '2001:db8::1', 'x'], queryset=IPRange.objects.filter(active=True)
+            )
+        self.assertEqual(
+            found,
+            {'10.1.0.1': [narrow, wide], '11.0.0.1': [], '9.9.9.9': [], '2001:db8::1': [v6], 'x': []},
+        )
+
+    def test_invalidate(self):
+        r = IPRange.objects.create(range='10.0.0.0/8')
+        self.assertEqual(list(IPRange.objects.containing('10.0.0.1')), [r])
+        r.range = '11.0.0.0/8'
+        r.save()
+        self.assertEqual(list(IPRange.objects.containing('10.0.0.1')), [])
+        self.assertEqual(list(IPRange.objects.containing('11.0.0.1')), [r])
+        r.delete()
+        self.assertEqual(IPRange.objects.index.containing('11.0.0.1'), ())
+
+    def test_invalidate_shared(self):
+        r = IPRange.objects.create(range='10.0.0.0/8')
+        # index of another process
+        other = RangeIndex(IPRange, IndexVersion)
+        other.version_check = 0
+        self.assertEqual(other.containing('10.0.0.1'), (r.pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            r.range = '11.0.0.0/8'
+            r.save()
+        self.assertEqual(IndexVersion.objects.get(name='dns_ips.IPRange').version, 1)
+        self.assertEqual(other.containing('10.0.0.1'), ())
+        self.assertEqual(other.containing('11.0.0.1'), (r.pk,))
@@ -0,0 +1,79 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import management
+from django.test import TestCase
+from django.utils import timezone
+
+from dns_ips import sweep
+from dns_ips.models import DNSDomain, DNSRecord, DNSRecordValue, IPAddress, IPRange, Source
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.source = Source.objects.create(name='sync', function='dns', owner='net')
+        self.other = Source.objects.create(name='other', function='dns', owner='net')
+        self.since = timezone.now()
+        old = self.since - timedelta(days=1)
+        new = self.since + timedelta(seconds=1)
+
+        self.fresh = DNSRecord.objects.create(source=self.source, name='fresh.com')
+        self.gone = DNSRecord.objects.create(source=self.source, name='gone.com')
+        DNSRecord.objects.create(source=self.other, name='other.com')
+        self.fresh_value = DNSRecordValue.objects.create(record=self.fresh, rtype='A')
+        self.gone_value = DNSRecordValue.objects.create(record=self.fresh, rtype='TXT', value='x')
+        # seen, but its record is gone
+        self.orphan_value = DNSRecordValue.objects.create(record=self.gone, rtype='A')
+        IPAddress.objects.create(source=self.source, name='1.1.1.1')
+        IPAddress.objects.create(source=self.source, name='1.1.1.2')
+        IPRange.objects.create(source=self.source, range='10.0.0.0/8')
+        DNSDomain.objects.create(source=self.source, name='fresh.com')
+
+        for model in (DNSRecord, IPAddress, IPRange, DNSDomain):
+            model.objects.update(last_seen=old)
+        DNSRecordValue.objects.update(last_seen=old)
+        DNSRecord.objects.filter(pk=self.fresh.pk).update(last_seen=new)
+        DNSRecordValue.objects.exclude(pk=self.gone_value.pk).update(last_seen=new)
+        IPAddress.objects.filter(name='1.1.1.1').update(last_seen=new)
+
+    def test_sweep(self):
+        expected = {'IPRange': 1, 'IPAddress': 1, 'DNSDomain': 1, 'DNSRecord': 1, 'DNSRecordValue': 2}
+        self.assertEqual(sweep.sweep_source(self.source, self.since, dry_run=True), expected)
+        self.assertEqual(DNSRecord.objects.filter(active=False).count(), 0)
+
+        self.assertEqual(sweep.sweep_source(self.source, self.since, chunk_size=1), expected)
+        self.assertEqual(
+            set(DNSRecord.objects.filter(active=True).values_list('name', flat=True)), {'fresh.com', 'other.com'}
+        )
+        self.assertEqual(
+            set(DNSRecordValue.objects.filter(active=False).values_list('pk', flat=True)),
+            {self.gone_value.pk, self.orphan_value.pk},
+        )
+        self.assertEqual(list(IPAddress.objects.filter(active=True).values_list('name', flat=True)), ['1.1.1.1'])
+        self.assertFalse(IPRange.objects.get().active)
+
+        # already inactive, nothing else to do
+        self.assertEqual(sum(sweep.sweep_source(self.source, self.since).values()), 0)
+
+    def test_command(self):
+        out = StringIO()
+        management.call_command(
+            'sweep_stale_records',
+            'sync',
+            since=self.since.isoformat(),
+            model=['DNSRecordValue', 'DNSRecord'],
+            dry=True,
+            stdout=out,
+            stderr=StringIO(),
+        )
+        self.assertEqual(
+            out.getvalue(),
+            f'Would deactivate sync rows not seen since {self.since.isoformat()}: 1 DNSRecord, 2 DNSRecordValue\n',
+        )
+        self.assertFalse(DNSRecord.objects.filter(active=False).exists())
+
+    def test_command_since_required(self):
+        # no default (such as Source.last_sync), every import kind of the source would share it
+        with self.assertRaisesMessage(management.CommandError, 'the following arguments are required: --since'):
+            management.call_command('sweep_stale_records', 'sync', stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(IPAddress.objects.filter(active=False).exists())
@@ -2,6 +2,10 @@ import json
 import logging
 from pathlib import Path
 
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
 from scanners.parsers.base import BaseParser
 
 from scanners import models
@@ -13,6 +17,8 @@ logger = logging.getLogger(__name__)
 class Baseline(BaseParser):
     name = 'BASELINE_RESULTS'
     label = 'Baseline'
+    # number of result files parsed together (bulk queries), set to None to parse (and query) one file at a time
+    batch_size = 1000
 
     def _parse_headers(self, data):
         redirects = []
@@ -40,7 +46,10 @@ class Baseline(BaseParser):
             logger.error('cannot create livehost with invalid host: %s', hostname)
         return obj
 
-    def _parse_record(self, obj, rootbox, scanner, baseline_data):
+    def _record_defaults(self, rootbox, scanner, baseline_data):
+        """
+        :return: tuple with active flag and dict of LiveHost fields to update
+        """
         redirects, cookies, headers = self._parse_headers(baseline_data)
         active = not baseline_data.get('failed', False)
         defaults = {
@@ -55,6 +64,10 @@ class Baseline(BaseParser):
             defaults['cookies'] = '\n'.join(cookies)
             defaults['redirects'] = '\n'.join(redirects) or None
             defaults['body_response'] = baseline_data.get('response-body')
+        return active, defaults
+
+    def _parse_record(self, obj, rootbox, scanner, baseline_data):
+        active, defaults = self._record_defaults(rootbox, scanner, baseline_data)
 
         rec, created = models.LiveHost.objects.update_or_create(
             host=obj,
@@ -78,26 +91,158 @@ class Baseline(BaseParser):
             return
         rec = self._parse_record(obj, rootbox, scanner, baseline_data)
         self._parse_tech(rec, baseline_data)
+        self.records += 1
+
+    def _get_technologies(self, techs):
+        """
+        :return: list of Technology objects for names in `techs`, creating the missing ones
+        """
+        tech_objs = list(models.Technology.objects.filter(name__in=techs))
+        # create new ones, if any
+        _s = {x.name for x in tech_objs}
+        new = [models.Technology(name=x) for x in set(techs) if x not in _s]
+        if new:
+            new_objs = models.Technology.objects.bulk_create(new)
+            # PK might not be returned... if so, extra query...
+            if new_objs:
+                if new_objs[0].pk is None:
+                    tech_objs = list(models.Technology.objects.filter(name__in=techs))
+                else:
+                    tech_objs.extend(new_objs)
+        return tech_objs
 
     def _parse_tech(self, rec, baseline_data):
         techs = baseline_data.get('technologies', [])
         if techs:
-            tech_objs = list(models.Technology.objects.filter(name__in=techs))
-            # create new ones, if any
-            _s = {x.name for x in tech_objs}
-            new = [models.Technology(name=x) for x in techs if x not in _s]
-            if new:
-                new_objs = models.Technology.objects.bulk_create(new)
-                # PK might not be returned... if so, extra query...
-                if new_objs:
-                    if new_objs[0].pk is None:
-                        tech_objs = list(models.Technology.objects.filter(name__in=techs))
-                    else:
-                        tech_objs.extend(new_objs)
-            rec.technologies.set(tech_objs)
+            rec.technologies.set(self._get_technologies(techs))
         else:
             rec.technologies.clear()
 
+    def _find_host_records(self, hostnames):
+        """
+        bulk version of _find_host_record
+
+        :return: dict of {hostname: (content_type_id, object_id)} for the hostnames found
+        """
+        return self.resolve_hosts(hostnames)
+
+    def _host_tags(self, hosts):
+        """
+        bulk version of LiveHost.get_host_values (tags part)
+
+        :param hosts: iterable of (content_type_id, object_id)
+        :return: dict of {(content_type_id, object_id): set of tag names in LiveHost.HOST_TAG_FLAGS}
+        """
+        by_ct = {}
+        for ct, pk in hosts:
+            by_ct.setdefault(ct, set()).add(pk)
+        tags = {}
+        for ct, pks in by_ct.items():
+            model = ContentType.objects.get_for_id(ct).model_class()
+            for pk, tag in model.objects.filter(pk__in=pks, tags__name__in=models.LiveHost.HOST_TAG_FLAGS).values_list(
+                'pk', 'tags__name'
+            ):
+                tags.setdefault((ct, pk), set()).add(tag)
+        return tags
+
+    def _parse_batch(self, rootbox, scanner, filepaths):
+        """
+        parse `filepaths` with bulk queries: hosts resolved at once, LiveHost rows bulk created/updated
+        on (host_content_type, host_object_id, port) and technologies diffed on the through table
+        """
+        entries = [json.loads(f.read_text()) for f in filepaths]
+        found = self._find_host_records(x['domain'] for x in entries)
+
+        # (content_type_id, object_id, port) => (active, defaults, technologies, hostname), last one wins
+        records = {}
+        for baseline_data in entries:
+            host = found.get(baseline_data['domain'])
+            if host is None:
+                logger.error('cannot create livehost with invalid host: %s', baseline_data['domain'])
+                continue
+            active, defaults = self._record_defaults(rootbox, scanner, baseline_data)
+            # port is a string in baseline output
+            records[host + (int(baseline_data['port']),)] = (
+                active,
+                defaults,
+                baseline_data.get('technologies', []),
+                baseline_data['domain'],
+            )
+        if not records:
+            return
+
+        host_tags = self._host_tags(k[:2] for k in records)
+        existing = {}
+        for ct in {k[0] for k in records}:
+            # only what is needed for lookup, fields not in defaults are not updated
+            for rec in models.LiveHost.objects.filter(
+                host_content_type_id=ct, host_object_id__in={k[1] for k in records if k[0] == ct}
+            ).only('pk', 'host_object_id', 'port'):
+                existing[(ct, rec.host_object_id, rec.port)] = rec
+
+        now = timezone.now()
+        to_create = []
+        # tuple of fields to update => LiveHost objects
+        to_update = {}
+        livehosts = {}
+        for key, (active, defaults, _, hostname) in records.items():
+            rec = existing.get(key)
+            if rec is None:
+                # new ones are always active, same as update_or_create
+                rec = models.LiveHost(host_content_type_id=key[0], host_object_id=key[1], port=key[2], **defaults)
+                to_create.append(rec)
+            else:
+                for k, v in defaults.items():
+                    setattr(rec, k, v)
+                rec.active = active
+                # auto_now is not applied by bulk_update
+                rec.last_seen = now
+                to_update.setdefault(tuple(defaults), []).append(rec)
+            for k, v in models.LiveHost.host_values(hostname, host_tags.get(key[:2], ())).items():
+                setattr(rec, k, v)
+            livehosts[key] = rec
+
+        with transaction.atomic():
+            if to_create:
+                models.LiveHost.objects.bulk_create(to_create, batch_size=self.batch_size)
+                if to_create[0].pk is None:
+                    # PK might not be returned... if so, extra query...
+                    for ct in {k[0] for k in records}:
+                        for oid, port, pk in models.LiveHost.objects.filter(
+                            host_content_type_id=ct, host_object_id__in={k[1] for k in records if k[0] == ct}
+                        ).values_list('host_object_id', 'port', 'pk'):
+                            if (ct, oid, port) in livehosts:
+                                livehosts[(ct, oid, port)].pk = pk
+            for fields, objs in to_update.items():
+                models.LiveHost.objects.bulk_update(
+                    objs,
+                    list(fields) + ['active', 'last_seen', 'host_name'] + list(models.LiveHost.HOST_TAG_FLAGS.values()),
+                    batch_size=self.batch_size,
+                )
+            self._set_technologies_batch({livehosts[k].pk: v[2] for k, v in records.items()})
+        self.records += len(records)
+
+    def _set_technologies_batch(self, techs_by_livehost):
+        """
+        :param techs_by_livehost: dict of {livehost pk: list of technology names}
+        """
+        through = models.LiveHost.technologies.through
+        all_techs = {t for techs in techs_by_livehost.values() for t in techs}
+        tech_ids = {x.name: x.pk for x in self._get_technologies(all_techs)} if all_techs else {}
+        wanted = {(lh, tech_ids[t]) for lh, techs in techs_by_livehost.items() for t in techs}
+        current = {
+            (lh, t): pk
+            for pk, lh, t in through.objects.filter(livehost_id__in=techs_by_livehost).values_list(
+                'pk', 'livehost_id', 'technology_id'
+            )
+        }
+        to_delete = [pk for k, pk in current.items() if k not in wanted]
+        if to_delete:
+            through.objects.filter(pk__in=to_delete).delete()
+        to_add = [through(livehost_id=lh, technology_id=t) for lh, t in wanted if (lh, t) not in current]
+        if to_add:
+            through.objects.bulk_create(to_add, batch_size=self.batch_size)
+
     def parse(self, rootbox, scanner, timestamp, filepath):
         """
         handler for baseline results
@@ -111,8 +256,19 @@ class Baseline(BaseParser):
 
         filepath = Path(filepath)
 
+        if not self.batch_size:
+            for _sf in filepath.glob('*'):
+                self._parse_file(rootbox, scanner, _sf)
+            return
+
+        batch = []
         for _sf in filepath.glob('*'):
-            self._parse_file(rootbox, scanner, _sf)
+            batch.append(_sf)
+            if len(batch) >= self.batch_size:
+                self._parse_batch(rootbox, scanner, batch)
+                batch = []
+        if batch:
+            self._parse_batch(rootbox, scanner, batch)
 
     def save_results(self, name, file_src):
         """
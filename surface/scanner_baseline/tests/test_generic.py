@@ -1,10 +1,12 @@
 import tempfile
 from pathlib import Path
+from unittest import mock
 
 from django.test import TestCase
 
 from scanners.tests import ScannerTestMixin
 from scanners import models as scanner_models
+from scanner_baseline.scanners import Baseline
 
 
 class Test(ScannerTestMixin, TestCase):
@@ -96,3 +98,16 @@ AWSALBCORS=O5iHoWdpWQwUeBnkzHu/x75n5Xy5ReJI8ohJ2jmTn3Vv4CNxZ8+cywVF8WoTrxU6y0zIt
         self.assertEqual(scanner_models.LiveHost.objects.filter(port=443, active=False).count(), 1)
         self._run_it()
         self.assertEqual(scanner_models.LiveHost.objects.filter(port=443, active=True).count(), 1)
+
+    @mock.patch.object(Baseline, 'batch_size', None)
+    def test_parser_technologies_no_batch(self):
+        self.test_parser_technologies()
+
+    @mock.patch.object(Baseline, 'batch_size', None)
+    def test_parser_inactive_no_batch(self):
+        self.test_parser_inactive()
+
+    def test_parser_third_party(self):
+        self._create_dnsrecord(name='www.winzip.com').tags.add(self._create_tag(name='is_third_party'))
+        self._run_it()
+        self.assertEqual(scanner_models.LiveHost.objects.filter(third_party=True).count(), 2)
@@ -1,16 +1,22 @@
 import json
+import re
 from datetime import datetime
 
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib import admin, messages
 from django.contrib.admin.templatetags.admin_urls import admin_urlname
 from django.contrib.admin.utils import unquote
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.http.response import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.html import format_html, format_html_join
 from django.utils.text import capfirst
 from core_utils.admin_filters import DropdownFilter
@@ -21,6 +27,22 @@ from dkron.utils import run_async
 from scanners import models, utils
 
 
+def _parse_timestamp(value):
+    """
+    :return: aware datetime from ISO `value` (naive ones in the current timezone)
+    :raise ValueError: if `value` is not valid
+    """
+    value = datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def _output_stream_enabled(request):
+    # streamed responses (async iterator) are only sent as they go under ASGI
+    return settings.SCANNERS_OUTPUT_STREAM and isinstance(request, ASGIRequest)
+
+
 class FinalHTTPFilter(DropdownFilter):
     title = "Final HTTP"
     parameter_name = "final_http"
@@ -89,7 +111,7 @@ class ExitCodeFilter(DropdownFilter):
 
 @admin.register(models.Rootbox)
 class RootboxAdmin(DefaultFilterMixin, DefaultModelAdmin):
-    list_display = ("active", "name", "ip", "ssh_user", "ssh_port", "location", "notes")
+    list_display = ("active", "name", "ip", "ssh_user", "ssh_port", "location", "get_scanner_load", "notes")
     list_display_links = ("name",)
     search_fields = ("name", "ip", "ssh_user", "ssh_port", "location", "notes")
     list_filter = ("active", "location")
@@ -120,6 +142,13 @@ class RootboxAdmin(DefaultFilterMixin, DefaultModelAdmin):
     def get_default_filters(self, request):
         return {"active__exact": 1}
 
+    @admin.display(description="Scanners", ordering="running_scanners")
+    def get_scanner_load(self, obj):
+        # as seen by run_scanners_continuously
+        slots = obj.scanner_slots()
+        running = "?" if obj.running_scanners is None else obj.running_scanners
+        return f"{running} / {slots}" if slots is not None else running
+
 
 @admin.register(models.ScannerImage)
 class ScannerImageAdmin(DefaultModelAdmin):
@@ -149,6 +178,7 @@ class ScannerAdmin(DefaultModelAdmin):
         "input",
         "parser",
         "continous_running",
+        "queued_since",
         "logs_link",
         "notes",
     )
@@ -188,6 +218,33 @@ class ScannerAdmin(DefaultModelAdmin):
     logs_link.short_description = "Logs"
 
 
+@admin.register(models.ScanRun)
+class ScanRunAdmin(DefaultModelAdmin):
+    list_display = ("id", "name", "scanner", "shards", "first_seen", "logs_link")
+    list_display_links = ("id",)
+    search_fields = ("name", "scanner__scanner_name")
+    list_filter = ("scanner",)
+
+    def logs_link(self, obj):
+        return format_html(
+            '<a href="{}?run__id__exact={}"><i class="fas fa-file-alt"></i></a>',
+            reverse("admin:scanners_scanlog_changelist"),
+            obj.pk,
+        )
+
+    logs_link.short_description = "Logs"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+# single range only, such as "bytes=100-" or "bytes=100-199"
+_RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
 @admin.register(models.ScanLog)
 class ScanLogAdmin(DefaultModelAdmin):
     list_display = ("id", "name", "scanner", "rootbox", "first_seen", "get_runtime", "get_state", "view_logs")
@@ -235,20 +292,72 @@ class ScanLogAdmin(DefaultModelAdmin):
                 "<path:object_id>/output/", self.admin_site.admin_view(self.output_view), name="scanners_scanlog_output"
             ),
         )
+        # async view, admin_view does not support those (permissions checked in the view)
+        urls.insert(
+            0,
+            path("<path:object_id>/output/stream/", self.output_stream_view, name="scanners_scanlog_output_stream"),
+        )
         return urls
 
+    def _check_output_permission(self, request, object_id):
+        if not self.admin_site.has_permission(request):
+            raise PermissionDenied
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            raise Http404
+        # check that user has permissions on ScanOutput model as well
+        if not self.has_view_permission(request) or not (
+            request.user.has_perm("scanners.view_scanoutput") or request.user.has_perm("scanners.change_scanoutput")
+        ):
+            raise PermissionDenied
+        return obj
+
+    async def output_stream_view(self, request, object_id):
+        """
+        live tail as server-sent events: one "line" event per output line (id is the line timestamp, to resume),
+        "state" when the state changes and "end" once it is no longer running
+
+        only with SCANNERS_OUTPUT_STREAM enabled and served by ASGI
+        """
+        if not _output_stream_enabled(request):
+            # viewer falls back to polling
+            raise Http404
+        obj = await sync_to_async(self._check_output_permission)(request, object_id)
+
+        cursor = None
+        try:
+            _c = request.headers.get("Last-Event-ID") or request.GET.get("cursor")
+            if _c:
+                cursor = _parse_timestamp(_c)
+        except (ValueError, TypeError):
+            pass
+
+        async def _events():
+            async for event, value in utils.output_broadcaster.subscribe(obj, cursor=cursor):
+                if event == "ping":
+                    yield ": ping\n\n"
+                elif event == "line":
+                    data = json.dumps((value.timestamp.strftime("%d-%m-%Y %H:%M:%S"), value.line))
+                    yield f"id: {value.timestamp.isoformat()}\nevent: line\ndata: {data}\n\n"
+                else:
+                    yield f"event: {event}\ndata: {json.dumps(value)}\n\n"
+
+        response = StreamingHttpResponse(_events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # do not buffer in nginx
+        response["X-Accel-Buffering"] = "no"
+        return response
+
     def _output_view_json(self, request, obj):
-        qs = obj.output_lines.order_by("timestamp")
         cursor = None
         if request.GET.get("cursor"):
             try:
-                cursor = datetime.fromisoformat(request.GET.get("cursor"))
-                qs = qs.filter(timestamp__gt=cursor)
+                cursor = _parse_timestamp(request.GET.get("cursor"))
             except (ValueError, TypeError):
                 pass
         lines = []
         last_time = None
-        for line in qs:
+        for line in obj.iter_output(since=cursor):
             lines.append((line.timestamp.strftime("%d-%m-%Y %H:%M:%S"), line.line))
             last_time = line.timestamp
         if last_time:
@@ -261,6 +370,68 @@ class ScanLogAdmin(DefaultModelAdmin):
             }
         )
 
+    def _output_view_raw(self, request, obj):
+        """
+        full log in raw plain/text, oldest first
+
+        * `since` and `until` (ISO timestamps, current timezone if naive) limit the time window
+        * `format=gz` downloads it gzipped, otherwise it is gzipped on the fly if the client accepts it
+        * single byte Range requests are supported once the scanner is no longer running (content is final)
+        """
+        window = {}
+        for k in ("since", "until"):
+            if request.GET.get(k):
+                try:
+                    window[k] = _parse_timestamp(request.GET[k])
+                except ValueError:
+                    return HttpResponseBadRequest(f"invalid {k}")
+        download = request.GET.get("format") == "gz"
+
+        def _content():
+            chunks = obj.export_output(**window)
+            if download:
+                return utils.gzip_chunks(chunks)
+            return chunks
+
+        final = obj.state is not None and obj.state != models.ScanLog.States.RUNNING
+        etag = None
+        if final:
+            last = obj.output_segments.order_by("-pk").values_list("pk", flat=True).first()
+            _w = ",".join(f"{k}={v.isoformat()}" for k, v in sorted(window.items()))
+            etag = f'"{obj.pk}-{last}-{obj.output_lines.count()}-{int(download)}-{_w}"'
+
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        m = _RANGE_RE.match(range_header or "")
+        if final and m and (not if_range or if_range == etag):
+            # size is only known after going through it once...
+            total = sum(len(x) for x in _content())
+            start = int(m.group(1))
+            end = min(int(m.group(2)), total - 1) if m.group(2) else total - 1
+            if start >= total or start > end:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{total}"
+                return response
+            response = StreamingHttpResponse(utils.byte_range(_content(), start, end), status=206)
+            response["Content-Range"] = f"bytes {start}-{end}/{total}"
+            response["Content-Length"] = str(end - start + 1)
+        elif not download and "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = StreamingHttpResponse(utils.gzip_chunks(_content()))
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = StreamingHttpResponse(_content())
+
+        if download:
+            response["Content-Type"] = "application/gzip"
+            response["Content-Disposition"] = f'attachment; filename="{obj.name}.log.gz"'
+        else:
+            response["Content-Type"] = "text/plain; charset=utf-8"
+        response["Vary"] = "Accept-Encoding"
+        if etag:
+            response["ETag"] = etag
+            response["Accept-Ranges"] = "bytes"
+        return response
+
     def output_view(self, request, object_id, extra_context=None):
         # ref: ModelAdmin.history_view
         # First check if the user can see this output.
@@ -278,18 +449,11 @@ class ScanLogAdmin(DefaultModelAdmin):
         if request.GET.get("mode") == "json":
             return self._output_view_json(request, obj)
 
-        output_list = obj.output_lines.order_by("-timestamp")
         raw_mode = request.GET.get("mode") == "raw"
         if raw_mode:
-            # return full log in raw plain/text
-            return StreamingHttpResponse(
-                streaming_content=(f"[{x.timestamp}] {x.line}\n" for x in output_list), content_type="text/plain"
-            )
+            return self._output_view_raw(request, obj)
         # otherwise show only last 100 lines
-        output_list = output_list[:100]
-
-        # evaluate queryset to make sure secondary queries are made in the template
-        output_list = list(output_list)
+        output_list = obj.tail_output(100)
 
         opts = model._meta
         context = {
@@ -303,6 +467,7 @@ class ScanLogAdmin(DefaultModelAdmin):
             "preserved_filters": self.get_preserved_filters(request),
             "has_view_permission": True,
             "full_mode": len(output_list) < 100,
+            "stream_output": _output_stream_enabled(request),
             **(extra_context or {}),
         }
         request.current_app = self.admin_site.name
@@ -382,9 +547,18 @@ class LiveHostAdmin(DefaultModelAdmin):
 class RawResultAdmin(DefaultFilterMixin, DefaultModelAdmin):
     list_display = ("file_name", "scanner", "rootbox", "last_seen", "notes")
     list_display_links = ("file_name",)
-    search_fields = ("raw_results", "file_name")
+    # content is compressed, search by name or (exact) digest
+    search_fields = ("file_name", "=blob__digest")
     list_filter = ("rootbox", "scanner")
-    readonly_fields = [field.name for field in models.RawResult._meta.fields if field.name not in ("id")]
+    readonly_fields = [
+        field.name for field in models.RawResult._meta.fields if field.name not in ("id", "raw_results")
+    ] + ["content"]
+    exclude = ("raw_results",)
+    list_select_related = ("scanner", "rootbox")
+
+    @admin.display(description="Raw results")
+    def content(self, obj):
+        return format_html("<pre>{}</pre>", obj.content or "")
 
     def get_default_filters(self, request):
         return {"active__exact": 1}
@@ -11,12 +11,48 @@ APP_SETTINGS = dict(
     DOCKER_CLIENT_KEY_PATH=None,
     DOCKER_CLIENT_CERT=None,
     DOCKER_CLIENT_CERT_PATH=None,
+    # seconds before a cached docker client is health checked (ping) before being re-used
+    DOCKER_CLIENT_HEALTH_CHECK=60,
+    # seconds before an unused cached docker client is closed
+    DOCKER_CLIENT_IDLE_TIMEOUT=300,
     PROXY_USERNAME=None,
     PROXY_PASSWORD=None,
     HELPER_IMAGE='ghcr.io/surface-security/scanner-helper',
     HELPER_IMAGE_TAG='1',
     PROXY_IMAGE='ghcr.io/surface-security/scanner-proxy',
     PROXY_IMAGE_TAG='latest',
+    # scanner input is kept in memory up to this size (bytes) before spilling to disk
+    INPUT_SPOOL_SIZE=16 * 1024 * 1024,
+    # log collector (resync_rootbox --follow-logs) writes lines when this many are pending...
+    LOG_BATCH_SIZE=500,
+    # ...or when the oldest pending is older than this (seconds)
+    LOG_FLUSH_INTERVAL=2,
+    # result files are only downloaded from rootboxes once they have not been modified for this long (seconds)
+    RESULTS_SETTLE_TIME=10,
+    # scanner output is stored in compressed segments of up to this many lines...
+    OUTPUT_SEGMENT_LINES=1000,
+    # ...or spanning up to this many seconds
+    OUTPUT_SEGMENT_SECONDS=300,
+    # live tail scanner output with server-sent events instead of polling, only used when served by ASGI
+    # (WSGI servers buffer the whole streamed response, holding a worker while the scanner runs)
+    OUTPUT_STREAM=False,
+    # live tail (output stream) checks for new lines every this many seconds, once per ScanLog being viewed
+    OUTPUT_STREAM_INTERVAL=2,
+    # continuous scanners running at the same time per rootbox, unless set in the rootbox (None for unlimited)
+    ROOTBOX_MAX_SCANNERS=None,
+    # seconds before checking again (registry digest) that an image pulled in a rootbox is up to date,
+    # per process unless CACHES is shared (such as redis or memcached), the default local memory cache is not
+    IMAGE_DIGEST_TTL=300,
+    # generated inputs are shared by scanners (with the same input) starting within this many seconds, 0 to disable
+    INPUT_SNAPSHOT_TTL=0,
+    # where input snapshots are stored (default is "surface_inputs" in the system temporary directory)
+    INPUT_SNAPSHOT_DIR=None,
+    # running containers per rootbox (check_scanners) are re-used (FleetSnapshot) for this many seconds
+    FLEET_SNAPSHOT_TTL=15,
+    # seconds to wait for each rootbox when checking running containers (slower ones are reported as failed)
+    FLEET_CHECK_TIMEOUT=10,
+    # preloaded host indexes (parsers) with more names than this use sorted arrays instead of a dict
+    HOST_INDEX_COMPACT_SIZE=500000,
 )
 
 
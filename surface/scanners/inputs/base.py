@@ -7,6 +7,8 @@ CHOICES = []
 class BaseInput(metaclass=ABCMeta):
     name = None
     label = None
+    # rows fetched per round-trip when iterating querysets (server-side cursor where supported)
+    chunk_size = 2000
 
     __CACHE__ = {}
     CHOICES = []
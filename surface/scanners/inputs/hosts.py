@@ -12,7 +12,15 @@ class Hosts(BaseInput):
         :return: iterator with all Hosts/DNS Records (A, LB, CNAME)
         """
         from dns_ips.models import DNSRecord
+        from scanners.models import ScanTarget
 
+        if ScanTarget.objects.built(ScanTarget.Kinds.HOST):
+            yield from ScanTarget.objects.targets(ScanTarget.Kinds.HOST, internal=internal).iterator(
+                chunk_size=self.chunk_size
+            )
+            return
+
+        # not built yet (refresh_scan_targets)
         tag_internal_or_external = 'is_external'
         if internal:
             tag_internal_or_external = 'is_internal'
@@ -21,11 +29,12 @@ class Hosts(BaseInput):
             .filter(
                 active=True,
                 dnsrecordvalue__active=True,
-                dnsrecordvalue__rtype__in=['A', 'LB', 'CNAME'],
+                dnsrecordvalue__rtype__in=ScanTarget.HOST_RTYPES,
                 tags__name=tag_internal_or_external,
             )
             .values_list('name', flat=True)
             .distinct()
+            .iterator(chunk_size=self.chunk_size)
         )
 
 
@@ -12,6 +12,15 @@ class IPs(BaseInput):
         :param internal: if it's exposed internally or externally.
         :return: iterator with all IPs
         """
+        from scanners.models import ScanTarget
+
+        if ScanTarget.objects.built(ScanTarget.Kinds.IP):
+            yield from ScanTarget.objects.targets(ScanTarget.Kinds.IP, internal=internal).iterator(
+                chunk_size=self.chunk_size
+            )
+            return
+
+        # not built yet (refresh_scan_targets)
         tag_internal_or_external = 'is_external'
         if internal:
             tag_internal_or_external = 'is_internal'
@@ -20,6 +29,7 @@ class IPs(BaseInput):
             .filter(active=True, tags__name=tag_internal_or_external)
             .values_list('name', flat=True)
             .distinct()
+            .iterator(chunk_size=self.chunk_size)
         )
 
 
@@ -1,6 +1,5 @@
 import logging
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Q
 from django.utils import timezone
 from scanners import models
@@ -36,16 +35,20 @@ class LiveIPsHosts(BaseInput):
         tag_filter = 'is_internal' if internal else 'is_external'
 
         # A Host is live if was responding to requests in the last 7 days
-        for host in (
+        rows = (
             self._queryset(ports, tag_filter)
             .exclude(final_url='https://aws.amazon.com/s3/')
-            .prefetch_related('host')
-            .all()
-        ):
-            try:
-                yield str(host)
-            except (ObjectDoesNotExist, AttributeError):
-                logger.error('livehost with invalid host: %d', host.pk)
+            .order_by('pk')
+            .values_list('host_name', 'host_content_type_id', 'host_object_id', 'port')
+            # server-side cursor where supported, only these columns and no model instances
+            .iterator(chunk_size=self.chunk_size)
+        )
+        for name, ct, oid, port in rows:
+            if name is None:
+                # host no longer exists, same as str(LiveHost) without host
+                yield f'{oid}/{ct}:{port}'
+            else:
+                yield models.LiveHost.format_url(name, port)
 
 
 class LiveIPsHostsInt(LiveIPsHosts):
@@ -0,0 +1,70 @@
+from io import BytesIO
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from logbasecommand.base import LogBaseCommand
+from scanners import models
+
+
+class Command(LogBaseCommand):
+    help = 'Move legacy RawResult content (raw_results) to compressed, deduplicated blobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=500, type=int, help='Rows converted per transaction')
+        parser.add_argument(
+            '--dedupe',
+            action='store_true',
+            help='Merge results with the same scanner, file name and content into the oldest one (keeping last_seen)',
+        )
+
+    def backfill(self, batch_size):
+        converted = 0
+        blobs = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                models.RawResult.objects.filter(pk__gt=last_pk, blob__isnull=True, raw_results__isnull=False)
+                .only('pk', 'raw_results')
+                .order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                for rec in batch:
+                    rec.blob, created = models.RawResultBlob.objects.store(BytesIO(rec.raw_results.encode()))
+                    rec.raw_results = None
+                    blobs += created
+                models.RawResult.objects.bulk_update(batch, ['blob', 'raw_results'])
+            converted += len(batch)
+            last_pk = batch[-1].pk
+            self.log_debug('converted %d results (up to %d)', converted, last_pk)
+        return converted, blobs
+
+    def dedupe(self):
+        removed = 0
+        dupes = (
+            models.RawResult.objects.filter(blob__isnull=False)
+            .values('scanner_id', 'file_name', 'blob_id')
+            .annotate(first=Min('pk'), last_seen_max=Max('last_seen'))
+            .filter(first__lt=Max('pk'))
+        )
+        for dupe in dupes.iterator():
+            with transaction.atomic():
+                n, _ = (
+                    models.RawResult.objects.filter(
+                        scanner_id=dupe['scanner_id'], file_name=dupe['file_name'], blob_id=dupe['blob_id']
+                    )
+                    .exclude(pk=dupe['first'])
+                    .delete()
+                )
+                # update() does not apply auto_now
+                models.RawResult.objects.filter(pk=dupe['first']).update(last_seen=dupe['last_seen_max'])
+            removed += n
+        return removed
+
+    def handle(self, *args, **options):
+        converted, blobs = self.backfill(options['batch_size'])
+        self.log('Converted %d results into %d new blobs', converted, blobs)
+        if options['dedupe']:
+            self.log('Removed %d duplicated results', self.dedupe())
@@ -10,11 +10,19 @@ class Command(LogBaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('-r', '--rootbox', help='Check only ROOTBOX')
+        parser.add_argument(
+            '--cached', action='store_true', help='Use recently cached results (SCANNERS_FLEET_SNAPSHOT_TTL)'
+        )
 
     def handle(self, *args, **options):
-        out = utils.check_scanners([options['rootbox']] if options['rootbox'] else None)
+        out = utils.check_scanners(
+            [options['rootbox']] if options['rootbox'] else None, max_age=None if options['cached'] else 0
+        )
 
-        for _ob, _oo in out:
-            self.log(f'## BOX: {_ob}')
-            self.log(json.dumps(_oo, indent=4))
+        for box in out:
+            self.log(f'## BOX: {box.name}')
+            if box.error:
+                self.log_error('failed checking %s: %s', box.name, box.error)
+            self.log(json.dumps(box.containers, indent=4))
             self.log('')
+        self.log_debug('Docker clients: %s', utils.docker_clients.stats())
@@ -0,0 +1,32 @@
+from django.db import transaction
+
+from logbasecommand.base import LogBaseCommand
+from scanners import models
+
+
+class Command(LogBaseCommand):
+    help = 'Convert legacy ScanOutput rows (one per line) into compressed output segments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-l', '--log', nargs='+', type=int, help='Convert only these ScanLog IDs')
+
+    def convert(self, scan_log):
+        lines = scan_log.output_lines.order_by('timestamp', 'pk').values_list('timestamp', 'line')
+        with transaction.atomic():
+            segments = models.ScanOutputSegment.objects.bulk_create(
+                models.ScanOutputSegment.objects.build(scan_log, lines.iterator()), batch_size=50
+            )
+            n, _ = scan_log.output_lines.all().delete()
+        return n, len(segments)
+
+    def handle(self, *args, **options):
+        logs = models.ScanLog.objects.filter(output_lines__isnull=False).distinct().order_by('pk')
+        if options['log']:
+            logs = logs.filter(pk__in=options['log'])
+        total_lines = total_segments = 0
+        for scan_log in logs:
+            n, s = self.convert(scan_log)
+            self.log_debug('%s: %d lines into %d segments', scan_log, n, s)
+            total_lines += n
+            total_segments += s
+        self.log('Converted %d lines into %d segments', total_lines, total_segments)
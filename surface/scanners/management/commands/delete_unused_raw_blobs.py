@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from logbasecommand.base import LogBaseCommand
+from scanners import models
+
+
+class Command(LogBaseCommand):
+    help = 'Delete raw result blobs (RawResultBlob) no longer used by any RawResult.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', default=24, type=int, help='Only blobs not stored or re-used for this many hours'
+        )
+        parser.add_argument('--chunk-size', default=1000, type=int, help='Blobs deleted per query')
+        parser.add_argument('-d', '--dry', action='store_true', help='Dry run, only count the unused blobs')
+
+    def handle(self, *args, **options):
+        count = models.RawResultBlob.objects.delete_unreferenced(
+            timedelta(hours=options['min_age']), chunk_size=options['chunk_size'], dry_run=options['dry']
+        )
+        self.log('%s %d unused blobs', 'Would delete' if options['dry'] else 'Deleted', count)
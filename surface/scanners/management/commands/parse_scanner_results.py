@@ -1,6 +1,12 @@
 import os
+import time
+import traceback
+from functools import partial
 
-from scanners import models
+from django import db
+
+from core_utils.pool import optional_pool
+from scanners import models, utils
 from scanners.parsers.base import query
 from logbasecommand.base import LogBaseCommand
 
@@ -9,7 +15,18 @@ class ParseException(Exception):
     """error parsing scanner results"""
 
 
-def parse_results(res_dir, scanner=None, rootbox=None):
+def _timestamp_key(name):
+    # timestamp directories sorted numerically, shards of the same run after each other
+    ts, shard = utils.split_shard(name)
+    return (int(ts) if ts.isdigit() else 0, ts, -1 if shard is None else shard)
+
+
+def parse_results(res_dir, scanner=None, rootbox=None, stats=None):
+    """
+    parse every timestamp directory of a scanner results directory, in order
+
+    :param stats: optional dict updated with {parser label: [files, records, seconds]}
+    """
     fulldir = os.path.abspath(res_dir)
     _sn = os.path.basename(fulldir)
     _ss = None
@@ -33,16 +50,76 @@ def parse_results(res_dir, scanner=None, rootbox=None):
             raise ParseException(f'ERROR-SCANNER: invalid scanner id: {_sid} ({_sn})')
 
     parse = query(_ss.parser)
-    for _st in os.listdir(fulldir):
+    for _st in sorted(os.listdir(fulldir), key=_timestamp_key):
         _sp = os.path.join(fulldir, _st)
         if not os.listdir(_sp):
             # extra check to avoid useless logging
             continue
         yield f'Processing results for {_ss} - {_sp}'
+        # shards of the same run share the timestamp, parsers see them as the same run
+        _ts, _ = utils.split_shard(_st)
+        started = time.monotonic()
         try:
-            parse(rootbox=rootbox, scanner=_ss, timestamp=_st, filepath=_sp)
+            p = parse(rootbox=rootbox, scanner=_ss, timestamp=_ts, filepath=_sp)
         except Exception as ex:
             raise ParseException(f'ERROR-SCANNER: error when parsing {_sn} ({ex})')
+        if stats is not None:
+            _stat = stats.setdefault(parse.get_label(), [0, 0, 0.0])
+            _stat[0] += p.files
+            _stat[1] += p.records
+            _stat[2] += time.monotonic() - started
+
+
+def _parse_task(res_dir, rootbox=None):
+    stats = {}
+    messages = []
+    error = None
+    try:
+        for m in parse_results(res_dir, rootbox=rootbox, stats=stats):
+            messages.append(m)
+    except ParseException:
+        error = traceback.format_exc()
+    return res_dir, messages, error, stats
+
+
+def parse_directories(res_dirs, pool, rootbox=None):
+    """
+    parse scanner results directories using `pool` (see `core_utils.pool.optional_pool`)
+
+    each scanner directory is a single task so its timestamps are still parsed in order
+    (and LiveHost state is correct), while different scanners are parsed concurrently
+
+    :return: iterator of (res_dir, messages, error traceback or None, stats), in completion order
+    """
+    return pool.imap_unordered(partial(_parse_task, rootbox=rootbox), res_dirs)
+
+
+def parse_pool(workers):
+    """
+    process pool for `parse_directories`
+    """
+    if workers not in (0, 1):
+        # do not share database connections with forked workers
+        db.connections.close_all()
+    return optional_pool(workers)
+
+
+def merge_stats(total, stats):
+    for label, (files, records, seconds) in stats.items():
+        _stat = total.setdefault(label, [0, 0, 0.0])
+        _stat[0] += files
+        _stat[1] += records
+        _stat[2] += seconds
+    return total
+
+
+def format_stats(stats):
+    for label, (files, records, seconds) in sorted(stats.items()):
+        seconds = seconds or 1e-9
+        yield (
+            f'{label}: {files} files ({files / seconds:.1f} files/s), '
+            f'{records} records ({records / seconds:.1f} records/s) in {seconds:.2f}s'
+        )
 
 
 class Command(LogBaseCommand):
@@ -51,12 +128,27 @@ class Command(LogBaseCommand):
     def add_arguments(self, parser):
         super().add_arguments(parser)
         parser.add_argument(
-            'directory', type=str, help='Directory containing scanner results - subdirectories should be timestamps'
+            'directory',
+            type=str,
+            nargs='+',
+            help='Directories containing scanner results - subdirectories should be timestamps',
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            default=1,
+            type=int,
+            help='Number of processes to parse different directories (default: 1)',
         )
 
     def handle(self, *args, **options):
-        try:
-            for m in parse_results(options['directory']):
-                self.log(m)
-        except ParseException:
-            self.log_exception('parser failed')
+        stats = {}
+        with parse_pool(options['workers']) as pool:
+            for _, messages, error, _stats in parse_directories(options['directory'], pool):
+                for m in messages:
+                    self.log(m)
+                if error:
+                    self.log_error('parser failed\n%s', error)
+                merge_stats(stats, _stats)
+        for m in format_stats(stats):
+            self.log(m)
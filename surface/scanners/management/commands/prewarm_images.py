@@ -0,0 +1,65 @@
+from django.conf import settings
+
+from core_utils.pool import optional_pool
+from logbasecommand.base import LogBaseCommand
+from scanners import models, utils
+
+
+class Command(LogBaseCommand):
+    help = 'Pull scanner images (and the proxy image) to the rootboxes ahead of time, only the ones that changed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--rootbox', action='append', help='Only ROOTBOX (default is every active rootbox)')
+        parser.add_argument('-i', '--image', action='append', help='Only IMAGE (ScannerImage name)')
+        parser.add_argument('-w', '--workers', default=8, type=int, help='Number of pulls running concurrently')
+        parser.add_argument(
+            '-f', '--force', action='store_true', help='Check every image, even if recently checked (digest cache)'
+        )
+
+    def images(self, names=None):
+        """
+        :return: list of (image, tag) used by the scanners (every tag), plus the proxy image
+        """
+        qs = models.ScannerImage.objects.all()
+        if names:
+            qs = qs.filter(name__in=names)
+        images = set()
+        for image in qs.prefetch_related('scanner_set'):
+            tags = {s.docker_tag for s in image.scanner_set.all()} or {'latest'}
+            images.update((image.image, tag) for tag in tags)
+        if not names:
+            images.add((settings.SCANNERS_PROXY_IMAGE, settings.SCANNERS_PROXY_IMAGE_TAG))
+        return sorted(images)
+
+    def _prewarm(self, args):
+        box, image, tag, ttl = args
+        try:
+            client = utils.get_docker_client(box.ip, box.dockerd_port, use_tls=box.dockerd_tls)
+            return box, image, tag, utils.ensure_image(client, box, image, tag, ttl=ttl), None
+        except Exception as e:
+            return box, image, tag, None, e
+
+    def handle(self, *args, **options):
+        boxes = models.Rootbox.objects.filter(active=True).order_by('name')
+        if options['rootbox']:
+            boxes = boxes.filter(name__in=options['rootbox'])
+        boxes = list(boxes)
+        images = self.images(options['image'])
+        ttl = 0 if options['force'] else None
+        tasks = [(box, image, tag, ttl) for box in boxes for image, tag in images]
+
+        counts = {}
+        with optional_pool(options['workers'], only_threads=True) as pool:
+            for box, image, tag, status, error in pool.imap_unordered(self._prewarm, tasks):
+                if error is not None:
+                    self.log_error('failed to pull %s:%s in %s: %s', image, tag, box.name, error)
+                    status = 'failed'
+                else:
+                    self.log_debug('%s:%s in %s: %s', image, tag, box.name, status)
+                counts[status] = counts.get(status, 0) + 1
+        self.log(
+            'Checked %d images in %d rootboxes: %s',
+            len(images),
+            len(boxes),
+            ', '.join(f'{v} {k}' for k, v in sorted(counts.items())) or 'nothing to do',
+        )
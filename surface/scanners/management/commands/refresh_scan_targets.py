@@ -0,0 +1,41 @@
+from django.utils import timezone
+
+from dns_ips import models as dns_models
+from logbasecommand.base import LogBaseCommand
+from scanners import models
+
+
+class Command(LogBaseCommand):
+    help = 'Rebuild ScanTargets (HOSTS/IPS inputs) from DNSRecords and IPAddresses, such as after bulk changes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-k', '--kind', choices=models.ScanTarget.Kinds.values, action='append', help='Only KIND (default is all)'
+        )
+        parser.add_argument('--batch-size', default=1000, type=int, help='Records checked per batch')
+
+    def refresh(self, kind, model, batch_size):
+        started = timezone.now()
+        totals = [0, 0, 0]
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            for i, n in enumerate(models.ScanTarget.objects.refresh(kind, pks, batch_size=batch_size)):
+                totals[i] += n
+            last_pk = pks[-1]
+            self.log_debug('checked %s up to %d', kind, last_pk)
+        # objects deleted without signals
+        orphans = models.ScanTarget.objects.filter(kind=kind).exclude(object_id__in=model.objects.values('pk'))
+        totals[2] += orphans.delete()[0]
+        # complete, inputs can use it (changes since `started` were handled by the signals)
+        models.ScanTargetBuild.objects.update_or_create(kind=kind, defaults={'built_at': started})
+        return totals
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or models.ScanTarget.Kinds.values
+        for kind in kinds:
+            model = dns_models.DNSRecord if kind == models.ScanTarget.Kinds.HOST else dns_models.IPAddress
+            created, updated, deleted = self.refresh(kind, model, options['batch_size'])
+            self.log('%s targets: %d created, %d updated, %d deleted', kind, created, updated, deleted)
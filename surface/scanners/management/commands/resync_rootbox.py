@@ -4,20 +4,23 @@ import tempfile
 import time
 import re
 import tarfile
-from datetime import datetime, timedelta
+from io import BytesIO
 
 from django.conf import settings
 from django import db
 
+from core_utils.pool import is_multi, optional_pool
 from database_locks import locked
 from scanners import models, utils
 from logbasecommand.base import LogBaseCommand
-from scanners.management.commands.parse_scanner_results import parse_results, ParseException
+from scanners.management.commands import parse_scanner_results
 
 
 @locked
 class Command(LogBaseCommand):
     help = 'Run sync of data from rootbox.'
+    log_collector = None
+    _parse_pool = None
 
     def __init__(self, *a, **b):
         super().__init__(*a, **b)
@@ -38,6 +41,26 @@ class Command(LogBaseCommand):
         parser.add_argument(
             '-r', '--rootbox', nargs='+', type=str, help='Specify rootboxes to resync (defaults to all active)'
         )
+        parser.add_argument(
+            '--follow-logs',
+            action='store_true',
+            help='Keep a log stream open per running container instead of polling logs every loop',
+        )
+        parser.add_argument(
+            '-w', '--workers', default=1, type=int, help='Number of rootboxes to process concurrently (default: 1)'
+        )
+        parser.add_argument(
+            '--box-timeout',
+            default=300,
+            type=int,
+            help='Stop waiting for a rootbox after this many seconds (default: 300)',
+        )
+        parser.add_argument(
+            '--parse-workers',
+            default=1,
+            type=int,
+            help='Number of processes to parse results of different scanners (default: 1)',
+        )
 
     def run_helper(self, rootbox, command, remove=True, **kwargs):
         docker = utils.get_docker_client(rootbox.ip, port=rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
@@ -54,65 +77,135 @@ class Command(LogBaseCommand):
 
         return out[5:]
 
-    def _process_files(self, rootbox, tempdir):
-        docker = utils.get_docker_client(rootbox.ip, port=rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
+    def list_output(self, rootbox):
+        """
+        list files in rootbox output directory
 
-        # download tarball with files from docker host
-        c = docker.containers.create(
-            self._helper, volumes={f'/scanners_{settings.AVZONE}/output/': {'bind': '/output', 'mode': 'ro'}}
+        :return: tuple with rootbox current time (epoch) and dict of {path: (size, mtime)}, None if listing failed
+        """
+        out = self.run_helper(
+            rootbox,
+            ['-c', 'echo MARK; date +%s; find /output -type f -exec stat -c "%s %Y %n" {} +'],
+            entrypoint='sh',
+            volumes={f'/scanners_{settings.AVZONE}/output/': {'bind': '/output', 'mode': 'ro'}},
         )
-        tar_name = os.path.join(tempdir, 'dl.tar')
-        strm, stat = c.get_archive('/output/')
-        with open(tar_name, 'wb') as outfile:
-            for d in strm:
-                outfile.write(d)
-        c.remove()
+        if out is None:
+            return None
+        now, *lines = out.decode(errors='replace').splitlines()
+        files = {}
+        for line in lines:
+            try:
+                size, mtime, path = line.split(' ', 2)
+                files[path] = (int(size), int(mtime))
+            except ValueError:
+                self.log_error('invalid output listing line: %s', line)
+        return int(now), files
+
+    def _fetch_files(self, container, wanted, tempdir):
+        """
+        download `wanted` files (dict of {path: (size, mtime)}), one archive per result directory,
+        extracting the tar stream on the fly
+
+        files that do not match the listed size (still being written) are skipped.
+        if a transfer is interrupted, files already extracted are kept (and the others are retried next loop)
+
+        :return: list of paths downloaded
+        """
+        groups = {}
+        for path in wanted:
+            # /output/SCANNER/TIMESTAMP
+            groups.setdefault('/'.join(path.split('/')[:4]), set()).add(path)
+
+        done = []
+        for group, paths in sorted(groups.items()):
+            # archive members are relative to the parent of the requested path
+            parent = os.path.dirname(group)
+            try:
+                strm, _ = container.get_archive(group)
+                with tarfile.open(fileobj=utils.IterStream(strm), mode='r|') as tar:
+                    for member in tar:
+                        if not member.isfile():
+                            continue
+                        path = os.path.normpath(os.path.join(parent, member.name))
+                        if path not in paths or member.size != wanted[path][0]:
+                            continue
+                        target = os.path.join(tempdir, path.lstrip('/'))
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        with open(target, 'wb') as f:
+                            shutil.copyfileobj(tar.extractfile(member), f)
+                        done.append(path)
+            except Exception:
+                self.log_exception('failed downloading %s from %s', group, container.name)
+        return done
 
-        # untar and keep track of the downloaded files for next step
-        del_txt_name = os.path.join(tempdir, 'todel.txt')
-        with open(del_txt_name, 'w') as files_to_delete:
-            with tarfile.open(tar_name) as outfile:
-                for _x in outfile:
-                    if not _x.isdir():
-                        files_to_delete.write(f'/{_x.name}\n')
-                # TODO: trust docker API to not add the / prefix? or inspect beforehand?
-                outfile.extractall(tempdir)
-
-        # remove files from docker host
+    def _clean_files(self, rootbox, paths):
+        docker = utils.get_docker_client(rootbox.ip, port=rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
         c = docker.containers.create(
             self._helper,
             command=['clean', '/todel.txt'],
             volumes={f'/scanners_{settings.AVZONE}/output/': {'bind': '/output', 'mode': 'rw'}},
         )
-        del_tar_name = os.path.join(tempdir, 'todel.tar')
-        with tarfile.open(del_tar_name, "w:gz") as tar:
-            tar.add(del_txt_name, arcname='todel.txt')
-        with open(del_tar_name, "rb") as t:
-            c.put_archive('/', t)
+        todel = BytesIO(''.join(f'{path}\n' for path in paths).encode())
+        c.put_archive('/', utils.TarGzStream({'todel.txt': todel}))
         c.start()
         out = c.logs()
-        if out != b'MARK\n':
-            self.log_error('output cleanup weird output: %s', out.decode())
         c.wait()
         c.remove()
+        if out != b'MARK\n':
+            self.log_error('output cleanup weird output: %s', out.decode())
+            return False
+        return True
 
-        # TODO: this was already done after files were deleted, should it be done before? should we track per file?
-        out_dir = os.path.join(tempdir, 'output')
-        for _sn in os.listdir(out_dir):
+    def handle_results(self, rootbox, tempdir):
+        listing = self.list_output(rootbox)
+        if listing is None:
+            return
+        now, files = listing
+
+        # files downloaded before but not yet removed from the rootbox (cleanup failed)
+        fetched = self._fetched.setdefault(rootbox.pk, {})
+        for path in list(fetched):
+            if path not in files:
+                fetched.pop(path)
+
+        # only completed files: not modified for a while and not downloaded already
+        wanted = {
+            path: (size, mtime)
+            for path, (size, mtime) in files.items()
+            if now - mtime >= settings.SCANNERS_RESULTS_SETTLE_TIME and fetched.get(path) != (size, mtime)
+        }
+        if wanted:
+            docker = utils.get_docker_client(rootbox.ip, port=rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
+            c = docker.containers.create(
+                self._helper, volumes={f'/scanners_{settings.AVZONE}/output/': {'bind': '/output', 'mode': 'ro'}}
+            )
             try:
-                for m in parse_results(os.path.join(out_dir, _sn), rootbox=rootbox):
-                    self.log(m)
-            except ParseException:
-                self.log_exception('parser failed')
+                done = self._fetch_files(c, wanted, tempdir)
+            finally:
+                c.remove()
+            for path in done:
+                fetched[path] = wanted[path]
 
-    def handle_results(self, rootbox, tempdir):
-        out = self.run_helper(
-            rootbox, 'list', volumes={f'/scanners_{settings.AVZONE}/output/': {'bind': '/output', 'mode': 'ro'}}
-        )
-        if out:
-            # nothing done with "out", as we just want to get all we can
-            # and delete only the ones actually downloaded (which might be more than this output)
-            self._process_files(rootbox, tempdir)
+        if not fetched:
+            return
+        if self._clean_files(rootbox, sorted(fetched)):
+            fetched.clear()
+
+        out_dir = os.path.join(tempdir, 'output')
+        if not os.path.isdir(out_dir):
+            return
+        res_dirs = [os.path.join(out_dir, _sn) for _sn in os.listdir(out_dir)]
+        stats = {}
+        for _, messages, error, _stats in parse_scanner_results.parse_directories(
+            res_dirs, self._parse_pool, rootbox=rootbox
+        ):
+            for m in messages:
+                self.log(m)
+            if error:
+                self.log_error('parser failed\n%s', error)
+            parse_scanner_results.merge_stats(stats, _stats)
+        for m in parse_scanner_results.format_stats(stats):
+            self.log(f'{rootbox.name} {m}')
 
     def handle_running(self, rootbox):
         for c_name, c in utils.check_scanners_in_box(rootbox, all=True):
@@ -123,12 +216,20 @@ class Command(LogBaseCommand):
                     scanner = models.Scanner.objects.get(pk=m.group(1))
                 except models.Scanner.DoesNotExist:
                     scanner = None
+                run_name, shard = utils.split_shard(pk)
+                if shard is None:
+                    run = None
+                else:
+                    run, _ = models.ScanRun.objects.get_or_create(name=run_name, defaults={'scanner': scanner})
                 cont, created = models.ScanLog.objects.update_or_create(
                     name=pk,
                     defaults={
                         'scanner': scanner,
                         'rootbox': rootbox,
                         'state': getattr(models.ScanLog.States, c.status.upper(), None),
+                        'run': run,
+                        # sparse listing, labels set by run_scanner
+                        'input_hash': (c.attrs.get('Labels') or {}).get(utils.INPUT_HASH_LABEL),
                     },
                 )
                 self.handle_logs(c, cont)
@@ -143,30 +244,89 @@ class Command(LogBaseCommand):
                     c.remove()
 
     def handle_logs(self, container, scan_log):
-        last = scan_log.output_lines.order_by('-timestamp').first()
-        if last is not None:
-            # slight bump to avoid repeated (last) line
-            last = last.timestamp + timedelta(microseconds=1)
+        if self.log_collector is not None:
+            if scan_log.state == models.ScanLog.States.EXITED:
+                # stream ends once container exits, make sure everything is stored before it is removed
+                self.log_collector.wait(scan_log, timeout=60)
+                # and then poll whatever might be missing (such as exited before being followed)
+            else:
+                self.log_collector.follow(container, scan_log)
+                return
+
+        last = utils.last_log_cursor(scan_log)
         lines = container.logs(timestamps=True, since=last).splitlines()
         line_objs = []
         for line in lines:
-            line = line.decode()
-            sep = line.find(' ')
-            time = line[:sep]
-            text = line[sep + 1 :]
-            if time[-1] != 'Z' or len(time) != 30:
-                self.log_error('invalid time string', line)
+            parsed = utils.parse_log_line(line)
+            if parsed is None:
+                self.log_error('invalid time string: %s', line)
             else:
-                dt_time = datetime.fromisoformat(time[:-4] + '+00:00')
-                self.log(f'[{scan_log.scanner}] [{dt_time.strftime("%d-%m-%y %H:%M:%S")}] {text}')
-                line_objs.append(
-                    models.ScanOutput(
-                        log=scan_log,
-                        timestamp=dt_time,
-                        line=text,
-                    )
-                )
-        models.ScanOutput.objects.bulk_create(line_objs, batch_size=100)
+                self.echo_line(scan_log, *parsed)
+                line_objs.append(parsed)
+        models.ScanOutputSegment.objects.append(scan_log, line_objs)
+
+    def echo_line(self, scan_log, dt_time, text):
+        self.log(f'[{scan_log.scanner}] [{dt_time.strftime("%d-%m-%y %H:%M:%S")}] {text}')
+
+    def process_rootbox(self, rootbox, just, threaded=False):
+        """
+        sync a single rootbox (running containers and/or results)
+
+        :return: time taken (in seconds)
+        """
+        started = time.monotonic()
+        self._started[rootbox.pk] = started
+        self.log_debug('Processing %s', rootbox.name)
+        tempdir = tempfile.mkdtemp()
+        try:
+            if 'running' in just:
+                self.handle_running(rootbox)
+
+            if 'results' in just:
+                self.handle_results(rootbox, tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+            if threaded:
+                # worker threads get their own DB connections, do not leave them behind
+                db.connections.close_all()
+        return time.monotonic() - started
+
+    def handle_loop(self, pool, rootboxes, just, box_timeout):
+        threaded = is_multi(pool)
+        loop_started = time.monotonic()
+        timings = {}
+        for rootbox in rootboxes:
+            if rootbox.pk in self._inflight:
+                # still processing from previous loop (timed out), do not pile up
+                timings[rootbox.name] = 'BUSY'
+                continue
+            self._started.pop(rootbox.pk, None)
+            self._inflight[rootbox.pk] = (rootbox, pool.apply_async(self.process_rootbox, (rootbox, just, threaded)))
+
+        while self._inflight:
+            now = time.monotonic()
+            for pk, (rootbox, res) in list(self._inflight.items()):
+                if res.ready():
+                    del self._inflight[pk]
+                    try:
+                        timings[rootbox.name] = f'{res.get():.2f}s'
+                    except Exception:
+                        timings[rootbox.name] = 'FAILED'
+                        self.log_exception('failed processing %s', rootbox.name)
+                elif rootbox.name not in timings and now - self._started.get(pk, now) > box_timeout:
+                    # thread cannot be killed, but stop waiting for it
+                    timings[rootbox.name] = 'TIMEOUT'
+                    self.log_warning('%s took longer than %d seconds, moving on', rootbox.name, box_timeout)
+            if all(rootbox.name in timings for rootbox, _ in self._inflight.values()):
+                break
+            time.sleep(0.1)
+
+        self.log(
+            'Resync loop took %.2fs: %s (docker clients: %s)',
+            time.monotonic() - loop_started,
+            ', '.join(f'{name} {timing}' for name, timing in timings.items()),
+            utils.docker_clients.stats(),
+        )
 
     def handle(self, *args, **options):
         if options['rootbox']:
@@ -174,24 +334,31 @@ class Command(LogBaseCommand):
         else:
             filter_kwargs = {}
 
-        while True:
-            db.close_old_connections()
-
-            rootboxes = models.Rootbox.objects.filter(active=True, **filter_kwargs)
-            for rootbox in rootboxes:
-                self.log_debug('Processing %s', rootbox.name)
-                tempdir = tempfile.mkdtemp()
+        # rootbox pk => (rootbox, AsyncResult) for the ones being processed
+        self._inflight = {}
+        # rootbox pk => time when processing (last) started
+        self._started = {}
+        # rootbox pk => {path: (size, mtime)} of result files downloaded but not yet removed from the rootbox
+        self._fetched = {}
 
-                if 'running' in options['just']:
-                    self.handle_running(rootbox)
+        self.log_collector = None
+        if options['follow_logs']:
+            self.log_collector = utils.LogCollector(echo=self.echo_line)
+            self.log_collector.start()
 
-                if 'results' in options['just']:
-                    self.handle_results(rootbox, tempdir)
+        # created first, as it closes database connections (before forking)
+        self._parse_pool = parse_scanner_results.parse_pool(options['parse_workers'])
+        with self._parse_pool, optional_pool(options['workers'], only_threads=True) as pool:
+            while True:
+                db.close_old_connections()
 
-                shutil.rmtree(tempdir)
+                rootboxes = list(models.Rootbox.objects.filter(active=True, **filter_kwargs))
+                self.handle_loop(pool, rootboxes, options['just'], options['box_timeout'])
 
-            db.close_old_connections()
-            if options['run_once']:
-                break
-            # Sleep for DELAY seconds
-            time.sleep(options['delay'])
+                db.close_old_connections()
+                if options['run_once']:
+                    if self.log_collector is not None:
+                        self.log_collector.stop()
+                    break
+                # Sleep for DELAY seconds
+                time.sleep(options['delay'])
@@ -1,17 +1,15 @@
 import json
-import os
 import tempfile
 import time
 import hvac
-import tarfile
+from contextlib import ExitStack
 from docker.errors import APIError
-from pathlib import Path
-from contextlib import contextmanager
 
 from django.conf import settings
 from django.core.management.base import CommandError
 from logbasecommand.base import LogBaseCommand
 
+from core_utils.utils import digital_sizer
 from scanners import models
 from scanners import utils
 from scanners.inputs.base import query as input_query
@@ -29,30 +27,34 @@ class Command(LogBaseCommand):
         parser.add_argument(
             '-r', '--rootbox', metavar='ROOTBOX', help='Use ROOTBOX instead of the one assigned to the scanner'
         )
+        parser.add_argument(
+            '-s', '--shards', type=int, default=1, help='Split input into SHARDS containers running in parallel'
+        )
+        parser.add_argument(
+            '--spread',
+            action='store_true',
+            help='Distribute shards across every active rootbox (default is to run all of them in the same rootbox)',
+        )
         parser.add_argument('scanner', metavar='SCANNER', help='Scanner name', nargs='?')
 
-    def prepare_input(self, scanner, temp_dir):
+    def prepare_input(self, scanner, fileobjs, snapshot=None):
+        """
+        write generated input into `fileobjs` (binary), one item per line
+        items are distributed round-robin, so shards are evenly sized without loading the whole input
+
+        :param snapshot: InputSnapshot to read the input from (instead of generating it)
+        :return: number of input records
+        """
+        if snapshot is None:
+            lines = (item.encode() + b'\n' for item in input_query(scanner.input)().generate())
+        else:
+            lines = iter(snapshot)
         count = 0
-        of = temp_dir / 'input.txt'
-        _m = input_query
-        _inp = scanner.input
-        with of.open('w') as fileobj:
-            for item in _m(_inp)().generate():
-                fileobj.write(item)
-                fileobj.write('\n')
-                count += 1
-        return of, count
-
-    def prepare_input_tar(self, scanner, scanner_args, temp_dir):
-        tar_name = temp_dir / 'input.tgz'
-        with tarfile.open(tar_name, 'w:gz') as tar:
-            _in, inp_count = self.prepare_input(scanner, temp_dir)
-            if os.stat(_in).st_size == 0:
-                self.log(f'Skipping {scanner.scanner_name} with empty input file')
-                return
-            scanner_args.append('/input/input.txt')
-            tar.add(_in, arcname='input/input.txt')
-        return tar_name, inp_count
+        shards = len(fileobjs)
+        for line in lines:
+            fileobjs[count % shards].write(line)
+            count += 1
+        return count
 
     def check_running(self, docker, cont_name):
         for c in docker.containers.list(sparse=True):
@@ -104,48 +106,110 @@ class Command(LogBaseCommand):
             vault_secrets = client.read(f'tla_surf/common/scanners/{scanner.scanner_name}')['data']
             env_vars.update(vault_secrets)
 
-        docker = utils.get_docker_client(rootbox.ip, rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
+        shards = options['shards']
+        if shards < 1:
+            raise CommandError('shards must be a positive number')
+        boxes = [rootbox]
+        if options['spread']:
+            boxes.extend(models.Rootbox.objects.filter(active=True).exclude(pk=rootbox.pk).order_by('name'))
+        # only the boxes that will actually get a shard
+        boxes = boxes[:shards]
 
         cont_name = f'scanner-{ settings.AVZONE }-{ scanner.id }-{ scanner.image.name }-'
-        if options['check'] and self.check_running(docker, cont_name):
-            return
+        dockers = {}
+        for box in boxes:
+            dockers[box.pk] = utils.get_docker_client(box.ip, box.dockerd_port, use_tls=box.dockerd_tls)
+            if options['check'] and self.check_running(dockers[box.pk], cont_name):
+                return
 
         # TODO: remove empty output directories? here or in resync_rootbox?
 
-        with temporary_path(prefix='scanner_input_') as temp_dir:
-            tar_out = self.prepare_input_tar(scanner, scanner_args, temp_dir)
-            if tar_out is None:
-                # no input
+        with ExitStack() as stack:
+            input_files = [
+                stack.enter_context(tempfile.SpooledTemporaryFile(max_size=settings.SCANNERS_INPUT_SPOOL_SIZE))
+                for _ in range(shards)
+            ]
+            started = time.monotonic()
+            # shared with other scanners using the same input (SCANNERS_INPUT_SNAPSHOT_TTL)
+            snapshot = stack.enter_context(utils.input_snapshot(scanner.input, input_query(scanner.input)().generate))
+            inp_count = self.prepare_input(scanner, input_files, snapshot=snapshot)
+            generate_elapsed = time.monotonic() - started
+            if inp_count == 0:
+                self.log(f'Skipping {scanner.scanner_name} with empty input file')
                 return
+            if scanner.skip_unchanged_input and scanner.input_unchanged(snapshot.digest):
+                self.log(f'Skipping {scanner.scanner_name}, input unchanged since last successful run')
+                return
+            scanner_args.append('/input/input.txt')
 
-            try:
-                docker.images.pull(scanner.image.image, scanner.docker_tag)
-            except APIError as e:
-                # log warning only, this is optional tag "refresh"
-                # registry might be down from time to time (maintenance, etc)
-                self.log_warning('failed to pull image: %s', str(e))
+            for box in boxes:
+                try:
+                    utils.ensure_image(dockers[box.pk], box, scanner.image.image, scanner.docker_tag)
+                except APIError as e:
+                    # log warning only, this is optional tag "refresh"
+                    # registry might be down from time to time (maintenance, etc)
+                    self.log_warning('failed to pull image: %s', str(e))
 
             scanner_timestamp = int(time.time())
-            c = docker.containers.create(
-                f'{scanner.image.image}:{scanner.docker_tag}',
-                name=f'{cont_name}{ scanner_timestamp }',
-                command=' '.join(scanner_args),
-                privileged=True,
-                environment=env_vars,
-                volumes={
-                    f'/scanners_{ settings.AVZONE }/output/{ scanner.id }_{ scanner.image.name }/{ scanner_timestamp }/': {
-                        'bind': '/output/',
-                        'mode': 'rw',
-                    }
-                },
-            )
-            with tar_out[0].open('rb') as t:
-                c.put_archive('/', t)
-            c.start()
-            self.log(f'{scanner} started on {rootbox}: {tar_out[1]} input records')
-
-
-@contextmanager
-def temporary_path(**kwargs):
-    with tempfile.TemporaryDirectory(**kwargs) as tmpdirname:
-        yield Path(tmpdirname)
+            if shards > 1:
+                models.ScanRun.objects.create(
+                    name=f'{ scanner.id }-{ scanner.image.name }-{ scanner_timestamp }', scanner=scanner, shards=shards
+                )
+
+            for shard, input_file in enumerate(input_files):
+                if input_file.tell() == 0:
+                    # fewer records than shards
+                    continue
+                box = boxes[shard % len(boxes)]
+                # round-robin distribution: first (inp_count % shards) shards get one extra record
+                shard_count = inp_count // shards + (1 if shard < inp_count % shards else 0)
+                if shards == 1:
+                    run_name, label = str(scanner_timestamp), str(scanner)
+                else:
+                    run_name, label = (
+                        utils.shard_name(scanner_timestamp, shard),
+                        f'{scanner} shard {shard + 1}/{shards}',
+                    )
+                archive = self.start_container(
+                    dockers[box.pk],
+                    scanner,
+                    f'{cont_name}{run_name}',
+                    run_name,
+                    scanner_args,
+                    env_vars,
+                    input_file,
+                    input_hash=snapshot.digest,
+                )
+                # pull and create not accounted, only input generation and upload
+                elapsed = generate_elapsed * shard_count / inp_count + archive.elapsed
+                self.log(
+                    f'{label} started on {box}: {shard_count} input records '
+                    f'({shard_count / elapsed if elapsed else 0:.0f} rows/s, {digital_sizer(archive.bytes_sent)} uploaded)'
+                )
+
+    def start_container(self, docker, scanner, name, output_dir, scanner_args, env_vars, input_file, input_hash=None):
+        """
+        create and start scanner container, uploading `input_file` as its input
+
+        :param input_hash: digest of the whole input (not just this shard), set as container label
+
+        :return: TarGzStream used for the upload (for its stats)
+        """
+        c = docker.containers.create(
+            f'{scanner.image.image}:{scanner.docker_tag}',
+            name=name,
+            command=' '.join(scanner_args),
+            privileged=True,
+            environment=env_vars,
+            labels={utils.INPUT_HASH_LABEL: input_hash} if input_hash else {},
+            volumes={
+                f'/scanners_{ settings.AVZONE }/output/{ scanner.id }_{ scanner.image.name }/{ output_dir }/': {
+                    'bind': '/output/',
+                    'mode': 'rw',
+                }
+            },
+        )
+        archive = utils.TarGzStream({'input/input.txt': input_file})
+        c.put_archive('/', archive)
+        c.start()
+        return archive
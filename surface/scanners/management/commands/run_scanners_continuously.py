@@ -1,12 +1,10 @@
-from time import sleep
-
 from django import db
 from django.core.management import call_command
-from django.conf import settings
 
 from database_locks import locked
-from scanners import models, utils
+from scanners import models
 from scanners.management.commands import run_scanner
+from scanners.scheduler import Scheduler
 from logbasecommand.base import LogBaseCommand
 
 
@@ -14,43 +12,55 @@ from logbasecommand.base import LogBaseCommand
 class Command(LogBaseCommand):
     help = 'Run scanners continuously.'
 
+    scheduler = None
+
     def add_arguments(self, parser):
-        parser.add_argument('--delay', default=60, type=int, help='Check (and re-run) interval (in seconds)')
+        parser.add_argument(
+            '--delay',
+            default=60,
+            type=int,
+            help='Check (and re-run) interval (in seconds), scanners exiting are restarted right away',
+        )
         parser.add_argument(
             '-r', '--rootbox', metavar='ROOTBOX', help='only manage scanners attached to this rootbox (default is all)'
         )
+        parser.add_argument(
+            '--no-events', action='store_true', help='Do not follow docker events, only check every DELAY seconds'
+        )
+
+    def start_scanner(self, scanner, rootbox=None):
+        if rootbox is None:
+            call_command(run_scanner.Command(), scanner)
+        else:
+            self.log('placing %s on %s', scanner.scanner_name, rootbox.name)
+            call_command(run_scanner.Command(), scanner, rootbox=rootbox.name)
+
+    def get_scheduler(self, delay=60):
+        if self.scheduler is None:
+            self.scheduler = Scheduler(self.start_scanner, retry_delay=delay, logger=self.logger)
+        return self.scheduler
 
     def handle_loop(self, rootbox_name=None):
-        running_scanners = {}
-        qs = models.Scanner.objects.filter(continous_running=True).select_related('rootbox', 'image').all()
-        if rootbox_name:
-            qs = qs.filter(rootbox__name=rootbox_name)
-
-        for scanner in qs:
-            # do not try to start scanners on disabled rootboxes
-            if not scanner.rootbox.active:
-                self.log_error(
-                    '%s cannot be started as rootbox %s is not active', scanner.scanner_name, scanner.rootbox.name
-                )
-                continue
-            # check if scanner is already running on that specific rootbox
-            # check here instead of "run_scanner -c" command to avoid "docker ps" multiple times on the same box
-            rootbox = scanner.rootbox.name
-            if rootbox not in running_scanners:
-                running_scanners[rootbox] = list(utils.check_scanners_in_box(scanner.rootbox))
-            cont_name = f'scanner-{settings.AVZONE}-{scanner.id}-{scanner.image.name}-'
-            for _c, _ in running_scanners[rootbox]:
-                if _c.startswith(cont_name):
-                    self.log_debug('%s already running', scanner.scanner_name)
-                    break
-            else:
-                call_command(run_scanner.Command(), scanner)
+        started = self.get_scheduler().run_once(rootbox_name=rootbox_name)
+        for scanner, rootbox in started:
+            self.log_debug('started %s on %s', scanner.scanner_name, rootbox.name)
+        return started
 
     def handle(self, *args, **options):
         self.stdout.write('Running scanners continuously...\n')
 
-        while True:
-            db.close_old_connections()
-            self.handle_loop(rootbox_name=options['rootbox'])
-            db.close_old_connections()
-            sleep(options['delay'])
+        scheduler = self.get_scheduler(delay=options['delay'])
+        try:
+            while True:
+                db.close_old_connections()
+                if not options['no_events']:
+                    boxes = models.Rootbox.objects.filter(active=True)
+                    if options['rootbox']:
+                        boxes = boxes.filter(name=options['rootbox'])
+                    scheduler.watch(boxes)
+                self.handle_loop(rootbox_name=options['rootbox'])
+                db.close_old_connections()
+                scheduler.wake.wait(options['delay'])
+                scheduler.wake.clear()
+        finally:
+            scheduler.stop()
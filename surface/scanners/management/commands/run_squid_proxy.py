@@ -42,7 +42,7 @@ class Command(LogBaseCommand):
         for rootbox in boxes:
             docker = utils.get_docker_client(rootbox.ip, rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
             try:
-                docker.images.pull(settings.SCANNERS_PROXY_IMAGE, settings.SCANNERS_PROXY_IMAGE_TAG)
+                utils.ensure_image(docker, rootbox, settings.SCANNERS_PROXY_IMAGE, settings.SCANNERS_PROXY_IMAGE_TAG)
             except APIError as e:
                 # log warning only, this is optional tag "refresh"
                 # registry might be down from time to time (maintenance, etc)
@@ -0,0 +1,35 @@
+from django.contrib.contenttypes.models import ContentType
+
+from logbasecommand.base import LogBaseCommand
+from scanners import models
+
+
+class Command(LogBaseCommand):
+    help = 'Update LiveHost fields copied from the host (host_name and tag flags), such as after bulk DNS/IP changes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', default=1000, type=int, help='LiveHosts updated per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        changed = 0
+        checked = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                models.LiveHost.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', 'host_content_type_id', 'host_object_id')[:batch_size]
+            )
+            if not batch:
+                break
+            by_ct = {}
+            for _, ct, oid in batch:
+                by_ct.setdefault(ct, set()).add(oid)
+            for ct, oids in by_ct.items():
+                model = ContentType.objects.get_for_id(ct).model_class()
+                changed += models.LiveHost.objects.sync_hosts(model, oids, batch_size=batch_size)
+            checked += len(batch)
+            last_pk = batch[-1][0]
+            self.log_debug('checked %d livehosts (up to %d)', checked, last_pk)
+        self.log('Updated %d out of %d livehosts', changed, checked)
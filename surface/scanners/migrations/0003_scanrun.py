@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0002_scannerimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('shards', models.IntegerField(blank=True, null=True)),
+                ('first_seen', models.DateTimeField(auto_now_add=True, db_index=True, null=True)),
+                (
+                    'scanner',
+                    models.ForeignKey(
+                        blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='scanners.scanner'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scanlog',
+            name='run',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='scan_logs',
+                to='scanners.scanrun',
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0003_scanrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawResultBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField(help_text='Content size (bytes)')),
+                ('compressed_size', models.BigIntegerField(help_text='Stored size (bytes)')),
+                ('data', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Scanner Result - Raw Blob',
+                'verbose_name_plural': 'Scanner Results - Raw Blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='rawresult',
+            name='blob',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='results',
+                to='scanners.rawresultblob',
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0004_rawresultblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanOutputSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('lines', models.IntegerField(default=0)),
+                ('data', models.BinaryField()),
+                (
+                    'log',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='output_segments',
+                        to='scanners.scanlog',
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [models.Index(fields=['log', 'last_timestamp'], name='scanners_sc_log_id_69198f_idx')],
+            },
+        ),
+    ]
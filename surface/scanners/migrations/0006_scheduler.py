@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0005_scanoutputsegment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rootbox',
+            name='max_scanners',
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text='Maximum continuous scanners running at the same time (empty to use the default setting)',
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name='rootbox',
+            name='running_scanners',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanner',
+            name='queued_since',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
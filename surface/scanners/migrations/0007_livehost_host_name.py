@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+# same as LiveHost.HOST_TAG_FLAGS (historical models do not have it)
+HOST_TAG_FLAGS = {
+    'is_external': 'host_external',
+    'is_internal': 'host_internal',
+    'is_third_party': 'third_party',
+}
+
+
+def copy_host_values(apps, schema_editor):
+    # existing rows would not match the filters rewritten to these fields (LiveHostQS._denormalized_q)
+    content_type = apps.get_model('contenttypes', 'ContentType')
+    livehost = apps.get_model('scanners', 'LiveHost')
+    fields = ['host_name', *HOST_TAG_FLAGS.values()]
+    for model_name in ('DNSRecord', 'IPAddress'):
+        ct = content_type.objects.filter(app_label='dns_ips', model=model_name.lower()).first()
+        if ct is None:
+            # no LiveHost can point to it
+            continue
+        model = apps.get_model('dns_ips', model_name)
+        qs = livehost.objects.filter(host_content_type=ct).order_by('pk').only('pk', 'host_object_id', *fields)
+        last = 0
+        while True:
+            batch = list(qs.filter(pk__gt=last)[:1000])
+            if not batch:
+                break
+            last = batch[-1].pk
+            ids = {x.host_object_id for x in batch}
+            names = dict(model.objects.filter(pk__in=ids).values_list('pk', 'name'))
+            tags = {}
+            for pk, tag in model.objects.filter(pk__in=ids, tags__name__in=HOST_TAG_FLAGS).values_list(
+                'pk', 'tags__name'
+            ):
+                tags.setdefault(pk, set()).add(tag)
+            for rec in batch:
+                name = names.get(rec.host_object_id)
+                rec.host_name = None if name is None else str(name)
+                for tag, field in HOST_TAG_FLAGS.items():
+                    setattr(rec, field, tag in tags.get(rec.host_object_id, ()))
+            livehost.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0006_scheduler'),
+        ('dns_ips', '0007_remove_unused_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livehost',
+            name='host_external',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='livehost',
+            name='host_internal',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='livehost',
+            name='host_name',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(copy_host_values, migrations.RunPython.noop),
+    ]
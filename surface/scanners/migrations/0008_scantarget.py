@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0007_livehost_host_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanTarget',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('host', 'Host'), ('ip', 'IP')], max_length=4)),
+                ('object_id', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+                ('active', models.BooleanField(default=True)),
+                ('external', models.BooleanField(default=False)),
+                ('internal', models.BooleanField(default=False)),
+                ('excluded', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        fields=['kind', 'external', 'active', 'excluded', 'name'], name='scanners_sc_kind_ac2af9_idx'
+                    ),
+                    models.Index(
+                        fields=['kind', 'internal', 'active', 'excluded', 'name'], name='scanners_sc_kind_a98b82_idx'
+                    ),
+                ],
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0008_scantarget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanlog',
+            name='input_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanner',
+            name='skip_unchanged_input',
+            field=models.BooleanField(
+                default=False, help_text='Do not run if the input is the same as in the last successful run'
+            ),
+        ),
+    ]
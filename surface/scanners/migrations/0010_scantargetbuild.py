@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0009_input_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanTargetBuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('host', 'Host'), ('ip', 'IP')], max_length=4, unique=True)),
+                ('built_at', models.DateTimeField()),
+            ],
+        ),
+    ]
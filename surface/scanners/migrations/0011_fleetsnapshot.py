@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0010_scantargetbuild'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FleetSnapshot',
+            fields=[
+                (
+                    'rootbox',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='fleet_snapshot',
+                        serialize=False,
+                        to='scanners.rootbox',
+                    ),
+                ),
+                ('containers', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+    ]
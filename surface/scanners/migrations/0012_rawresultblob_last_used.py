@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scanners', '0011_fleetsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawresultblob',
+            name='last_used',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,12 +1,23 @@
-from django.db import models
+import hashlib
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db.models.query_utils import Q
 from functools import lru_cache
 from django.db.models.expressions import Exists
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import is_naive, make_aware, now
 
 from core_utils.fields import TruncatingCharField
+from core_utils.utils import keyset_iterator
 from dns_ips import models as dns_models
+from dns_ips.signals import bulk_changed
 from scanners.inputs.base import BaseInput
 from scanners.parsers.base import BaseParser
 
@@ -22,10 +33,25 @@ class Rootbox(models.Model):
     dockerd_tls = models.BooleanField(default=True, help_text='Use TLS with dockerd', verbose_name='Dockerd TLS')
     location = models.CharField(max_length=255, default='')
     notes = models.TextField(null=True, blank=True)
+    max_scanners = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Maximum continuous scanners running at the same time (empty to use the default setting)',
+    )
+    # updated by run_scanners_continuously
+    running_scanners = models.IntegerField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def scanner_slots(self):
+        """
+        :return: maximum scanners running at the same time, None if unlimited
+        """
+        if self.max_scanners is not None:
+            return self.max_scanners
+        return settings.SCANNERS_ROOTBOX_MAX_SCANNERS
+
     def slack_display(self):
         return f'{self.name}, {self.ip} ({self.notes})'
 
@@ -34,6 +60,20 @@ class Rootbox(models.Model):
         permissions = (("check_scanners", "Can check scanners"),)
 
 
+class FleetSnapshot(models.Model):
+    """
+    last check of the containers running in a rootbox (see utils.fleet_snapshot), shared by every process
+    """
+
+    rootbox = models.OneToOneField(Rootbox, on_delete=models.CASCADE, primary_key=True, related_name='fleet_snapshot')
+    containers = models.JSONField(default=list)
+    error = models.TextField(null=True, blank=True)
+    checked_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.rootbox} at {self.checked_at}'
+
+
 class ScannerImage(models.Model):
     name = models.CharField(max_length=255, primary_key=True)
     image = models.CharField(
@@ -78,10 +118,48 @@ class Scanner(models.Model):
         null=True, blank=True, help_text='Environment variables in json format to be passed to ansible.'
     )
     notes = models.TextField(null=True, blank=True)
+    # continuous scanner waiting for a free rootbox slot (set by run_scanners_continuously)
+    queued_since = models.DateTimeField(null=True, blank=True, editable=False)
+    skip_unchanged_input = models.BooleanField(
+        default=False, help_text='Do not run if the input is the same as in the last successful run'
+    )
 
     def __str__(self):
         return self.scanner_name
 
+    def input_unchanged(self, digest):
+        """
+        :return: True if the last (finished) run of this scanner used input `digest` and was successful
+        (every shard, if sharded)
+        """
+        last = (
+            ScanLog.objects.filter(scanner=self, state=ScanLog.States.EXITED)
+            .order_by('-first_seen', '-pk')
+            .select_related('run')
+            .first()
+        )
+        if last is None or last.input_hash != digest or last.exit_code != 0:
+            return False
+        if last.run is not None:
+            if last.run.scan_logs.exclude(state=ScanLog.States.EXITED, exit_code=0).exists():
+                return False
+        return True
+
+
+class ScanRun(models.Model):
+    """
+    logical run of a scanner sharded across multiple containers (and possibly rootboxes)
+    each container still gets its own ScanLog, linked to this
+    """
+
+    name = models.CharField(max_length=128, unique=True)
+    scanner = models.ForeignKey('scanners.Scanner', blank=True, null=True, on_delete=models.SET_NULL)
+    shards = models.IntegerField(null=True, blank=True)
+    first_seen = models.DateTimeField(null=True, auto_now_add=True, editable=False, db_index=True)
+
+    def __str__(self):
+        return self.name
+
 
 class ScanLog(models.Model):
     class States(models.IntegerChoices):
@@ -101,12 +179,200 @@ class ScanLog(models.Model):
     last_seen = models.DateTimeField(null=True, auto_now=True, editable=False, db_index=True)
     state = models.IntegerField(null=True, blank=True, choices=States.choices, db_index=True)
     exit_code = models.IntegerField(null=True, blank=True, db_index=True)
+    run = models.ForeignKey(
+        'scanners.ScanRun', blank=True, null=True, on_delete=models.SET_NULL, related_name='scan_logs'
+    )
+    # sha256 of the (whole) input, from the container label set by run_scanner
+    input_hash = models.CharField(max_length=64, null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def iter_output(self, since=None, until=None, page_size=1000):
+        """
+        output lines (OutputLine), oldest first, walking the tables with keyset pagination
+
+        :param since: only lines after this timestamp
+        :param until: only lines up to this timestamp (included)
+
+        naive timestamps are in the current timezone (line timestamps are aware)
+        """
+        if since is not None and is_naive(since):
+            since = make_aware(since)
+        if until is not None and is_naive(until):
+            until = make_aware(until)
+        legacy = self.output_lines.all()
+        if since is not None:
+            legacy = legacy.filter(timestamp__gt=since)
+        if until is not None:
+            legacy = legacy.filter(timestamp__lte=until)
+        # not converted yet (see convert_scan_output), always older than segments
+        for x in keyset_iterator(legacy.only('timestamp', 'line'), 'timestamp', page_size=page_size):
+            yield OutputLine(x.timestamp, x.line)
+
+        segments = self.output_segments.all()
+        if since is not None:
+            segments = segments.filter(last_timestamp__gt=since)
+        if until is not None:
+            segments = segments.filter(first_timestamp__lte=until)
+        # segments are big already (up to SCANNERS_OUTPUT_SEGMENT_LINES lines each)
+        for segment in keyset_iterator(segments, 'first_timestamp', page_size=10):
+            for line in segment.decode():
+                if (since is None or line.timestamp > since) and (until is None or line.timestamp <= until):
+                    yield line
+
+    def export_output(self, since=None, until=None, chunk_size=64 * 1024):
+        """
+        raw output (one "[timestamp] line" per line) as bytes, in chunks of about `chunk_size`
+        """
+        buf = []
+        size = 0
+        for ts, line in self.iter_output(since=since, until=until):
+            data = f'[{ts}] {line}\n'.encode()
+            buf.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                yield b''.join(buf)
+                buf = []
+                size = 0
+        if buf:
+            yield b''.join(buf)
+
+    def tail_output(self, count=100):
+        """
+        last `count` output lines, newest first
+        """
+        lines = []
+        for segment in self.output_segments.order_by('-last_timestamp', '-pk').iterator(chunk_size=10):
+            lines.extend(reversed(segment.decode()))
+            if len(lines) >= count:
+                return lines[:count]
+        for x in self.output_lines.order_by('-timestamp')[: count - len(lines)]:
+            lines.append(OutputLine(x.timestamp, x.line))
+        return lines
+
+    def last_output_timestamp(self):
+        last = self.output_segments.aggregate(models.Max('last_timestamp'))['last_timestamp__max']
+        if last is None:
+            last = self.output_lines.aggregate(models.Max('timestamp'))['timestamp__max']
+        return last
+
+
+OutputLine = namedtuple('OutputLine', ['timestamp', 'line'])
+
+
+class ScanOutputSegmentManager(models.Manager):
+    def append(self, scan_log, lines):
+        """
+        append `lines` (list of (timestamp, text), ordered) to `scan_log` output
+
+        lines are added to the last segment until it has SCANNERS_OUTPUT_SEGMENT_LINES lines
+        or spans SCANNERS_OUTPUT_SEGMENT_SECONDS seconds, then a new segment is started
+        """
+        max_lines = settings.SCANNERS_OUTPUT_SEGMENT_LINES
+        max_span = timedelta(seconds=settings.SCANNERS_OUTPUT_SEGMENT_SECONDS)
+        lines = list(lines)
+        if not lines:
+            return 0
+        with transaction.atomic():
+            segment = self.select_for_update().filter(log=scan_log).order_by('-last_timestamp', '-pk').first()
+            current = []
+            if segment is not None and segment.lines < max_lines and lines[0][0] - segment.first_timestamp <= max_span:
+                current = segment.decode()
+            else:
+                segment = None
+            for ts, text in lines:
+                if current and (len(current) >= max_lines or ts - current[0].timestamp > max_span):
+                    self._save(segment, scan_log, current)
+                    segment = None
+                    current = []
+                current.append(OutputLine(ts, text))
+            if current:
+                self._save(segment, scan_log, current)
+        return len(lines)
+
+    def build(self, scan_log, lines):
+        """
+        new (unsaved) segments for `lines` (iterable of (timestamp, text), ordered), not touching existing ones
+        """
+        max_lines = settings.SCANNERS_OUTPUT_SEGMENT_LINES
+        max_span = timedelta(seconds=settings.SCANNERS_OUTPUT_SEGMENT_SECONDS)
+        current = []
+        for ts, text in lines:
+            if current and (len(current) >= max_lines or ts - current[0].timestamp > max_span):
+                segment = self.model(log=scan_log)
+                segment.encode(current)
+                yield segment
+                current = []
+            current.append(OutputLine(ts, text))
+        if current:
+            segment = self.model(log=scan_log)
+            segment.encode(current)
+            yield segment
+
+    def _save(self, segment, scan_log, lines):
+        if segment is None:
+            segment = self.model(log=scan_log)
+        segment.encode(lines)
+        segment.save()
+        return segment
+
+
+class ScanOutputSegment(models.Model):
+    """
+    chunk of ScanLog output lines, zlib compressed
+    """
+
+    EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    log = models.ForeignKey('ScanLog', on_delete=models.CASCADE, related_name='output_segments')
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    lines = models.IntegerField(default=0)
+    data = models.BinaryField()
+
+    objects = ScanOutputSegmentManager()
+
+    def __str__(self):
+        # do not use log.name to avoid second query
+        return f'{self.log_id} ({self.first_timestamp} - {self.last_timestamp})'
+
+    class Meta:
+        indexes = [
+            # range seeks are always for a specific ScanLog
+            models.Index(fields=['log', 'last_timestamp']),
+        ]
+
+    def encode(self, lines):
+        """
+        one line per output line: timestamp (microseconds since epoch) and text
+        text should not have newlines as output is split by them (replaced, just in case)
+        """
+        self.first_timestamp = lines[0].timestamp
+        self.last_timestamp = lines[-1].timestamp
+        self.lines = len(lines)
+        self.data = zlib.compress(
+            ''.join(
+                f'{(ts - self.EPOCH) // timedelta(microseconds=1)} {text.replace(chr(10), " ")}\n' for ts, text in lines
+            ).encode()
+        )
+
+    def decode(self):
+        """
+        :return: list of OutputLine
+        """
+        out = []
+        for line in zlib.decompress(bytes(self.data)).decode().split('\n')[:-1]:
+            ts, text = line.split(' ', 1)
+            out.append(OutputLine(self.EPOCH + timedelta(microseconds=int(ts)), text))
+        return out
+
 
 class ScanOutput(models.Model):
+    """
+    legacy output storage (one row per line), see ScanOutputSegment
+    """
+
     log = models.ForeignKey('ScanLog', on_delete=models.CASCADE, related_name='output_lines')
     # index on timestamp alone might be useful to check all scanners within a timeframe
     timestamp = models.DateTimeField(db_index=True)
@@ -203,6 +469,9 @@ class LiveHostQS(models.QuerySet):
             )
         if field.startswith('host__'):
             parts = field.split('__')
+            q = self._denormalized_q(parts, value)
+            if q is not None:
+                return q, True
             combined_q = Q()
             for model in self._filter_or_exclude_gfk_models(parts[1]):
                 if model in self.__validators:
@@ -226,6 +495,26 @@ class LiveHostQS(models.QuerySet):
             return combined_q, True
         return q_tuple, False
 
+    def _denormalized_q(self, parts, value):
+        """
+        filter on the fields copied from the host (LiveHost.host_name and tag flags) instead of a subquery per
+        ContentType, when the lookup allows it
+
+        :return: Q or None if this lookup needs the host tables
+        """
+        if len(parts) < 3:
+            return None
+        if parts[2] == 'name' and len(parts) <= 4:
+            q = Q(**{'__'.join(['host_name'] + parts[3:]): value})
+        elif parts[2:] in (['tags', 'name'], ['tags', 'name', 'exact']) and value in self.model.HOST_TAG_FLAGS:
+            q = Q(**{self.model.HOST_TAG_FLAGS[value]: True})
+        else:
+            return None
+        cts = self._filter_or_exclude_gfk_models(parts[1])
+        if len(cts) == 1:
+            q &= Q(host_content_type=ContentType.objects.get_for_model(cts[0]))
+        return q
+
     def _filter_or_exclude_q_obj(self, q_obj):
         if isinstance(q_obj, tuple):
             # tuple is the actual condition, handle it!
@@ -291,6 +580,44 @@ class LiveHostManager(models.Manager):
     def get_queryset(self):
         return LiveHostQS(model=self.model, using=self._db)
 
+    def sync_hosts(self, model, pks, batch_size=1000):
+        """
+        update the fields copied from the host (`host_name` and tag flags) of the LiveHosts pointing
+        to the `model` (DNSRecord or IPAddress) objects in `pks`, cleared if the host no longer exists
+
+        :return: number of LiveHosts changed
+        """
+        ct = ContentType.objects.get_for_model(model)
+        fields = ['host_name'] + list(self.model.HOST_TAG_FLAGS.values())
+        pks = list(pks)
+        changed = 0
+        for i in range(0, len(pks), batch_size):
+            chunk = pks[i : i + batch_size]
+            livehosts = list(
+                self.filter(host_content_type=ct, host_object_id__in=chunk).only('pk', 'host_object_id', *fields)
+            )
+            if not livehosts:
+                continue
+            ids = {x.host_object_id for x in livehosts}
+            names = dict(model.objects.filter(pk__in=ids).values_list('pk', 'name'))
+            tags = {}
+            for pk, tag in model.objects.filter(pk__in=ids, tags__name__in=self.model.HOST_TAG_FLAGS).values_list(
+                'pk', 'tags__name'
+            ):
+                tags.setdefault(pk, set()).add(tag)
+            to_update = []
+            for rec in livehosts:
+                # name is None if the host no longer exists
+                values = self.model.host_values(names.get(rec.host_object_id), tags.get(rec.host_object_id, ()))
+                if any(getattr(rec, k) != v for k, v in values.items()):
+                    for k, v in values.items():
+                        setattr(rec, k, v)
+                    to_update.append(rec)
+            if to_update:
+                self.bulk_update(to_update, fields)
+                changed += len(to_update)
+        return changed
+
     def limit_choices(self):
         if not self.__cts:
             raise ValueError('invalid choices')
@@ -326,25 +653,61 @@ class LiveHost(ScanResult):
     headers = models.TextField(null=True, blank=True)
     cookies = models.TextField(null=True, blank=True)
     technologies = models.ManyToManyField('Technology')
+    # copied from host, so filtering does not need to join (query) DNSRecord/IPAddress tables
+    # kept in sync by the signal handlers below (sync_livehost_hosts command after bulk changes without signals)
+    host_name = models.CharField(max_length=255, null=True, blank=True, db_index=True, editable=False)
+    host_external = models.BooleanField(default=False, db_index=True, editable=False)
+    host_internal = models.BooleanField(default=False, db_index=True, editable=False)
+
+    # host tag name => LiveHost flag field
+    HOST_TAG_FLAGS = {
+        'is_external': 'host_external',
+        'is_internal': 'host_internal',
+        'is_third_party': 'third_party',
+    }
+
+    @classmethod
+    def host_values(cls, name, tags):
+        """
+        :param tags: names of the host tags
+        :return: dict of the fields copied from the host
+        """
+        values = {'host_name': None if name is None else str(name)}
+        for tag, field in cls.HOST_TAG_FLAGS.items():
+            values[field] = tag in tags
+        return values
 
     def save(self, *args, **kwargs):
         self.final_url = self._meta.get_field('final_url').trim_length(self.final_url)
-        self.third_party = self.is_third_party()
+        for k, v in self.get_host_values().items():
+            setattr(self, k, v)
         super().save(*args, **kwargs)
 
+    def get_host_values(self):
+        host = self.host
+        if hasattr(host, 'tags'):
+            tags = set(host.tags.filter(name__in=self.HOST_TAG_FLAGS).values_list('name', flat=True))
+        else:
+            tags = set()
+        return self.host_values(getattr(host, 'name', None), tags)
+
     def is_third_party(self):
-        if hasattr(self.host, 'tags'):
-            # inneficient but only used by save()...? "third_party" flagging needs review/refactor
-            return self.host.tags.filter(name='is_third_party').exists()
-        return False
+        return self.get_host_values()['third_party']
+
+    @staticmethod
+    def format_url(name, port):
+        if port == 80:
+            return f'http://{name}'
+        elif port == 443:
+            return f'https://{name}'
+        return f'{name}:{port}'
 
     def __str__(self):
-        if self.host:
-            if self.port == 80:
-                return f'http://{self.host.name}'
-            elif self.port == 443:
-                return f'https://{self.host.name}'
-            return f'{self.host.name}:{self.port}'
+        name = self.host_name
+        if name is None and self.host:
+            name = self.host.name
+        if name is not None:
+            return self.format_url(name, self.port)
         return f'{self.host_object_id}/{self.host_content_type_id}:{self.port}'
 
     class Meta:
@@ -353,6 +716,81 @@ class LiveHost(ScanResult):
         unique_together = [('host_content_type', 'host_object_id', 'port')]
 
 
+@receiver(post_save, sender=dns_models.DNSRecord)
+@receiver(post_save, sender=dns_models.IPAddress)
+def livehost_host_post_save(sender, instance, created, **kwargs):
+    if created:
+        # no LiveHost pointing to it yet
+        return
+    LiveHost.objects.filter(
+        host_content_type=ContentType.objects.get_for_model(sender), host_object_id=instance.pk
+    ).exclude(host_name=str(instance.name)).update(host_name=str(instance.name))
+
+
+@receiver(m2m_changed, sender=dns_models.DNSRecord.tags.through)
+@receiver(m2m_changed, sender=dns_models.IPAddress.tags.through)
+def livehost_host_tags_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:
+        # instance is the Tag, pk_set the hosts
+        if instance.name not in LiveHost.HOST_TAG_FLAGS:
+            return
+        if action == 'pre_clear':
+            # hosts are gone by post_clear
+            instance._livehost_clear_pks = list(model.objects.filter(tags=instance).values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_livehost_clear_pks', ())
+        host_model = model
+    else:
+        pk_set = [instance.pk]
+        host_model = instance.__class__
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        LiveHost.objects.sync_hosts(host_model, pk_set)
+
+
+@receiver(post_delete, sender=dns_models.DNSRecord)
+@receiver(post_delete, sender=dns_models.IPAddress)
+def livehost_host_post_delete(sender, instance, **kwargs):
+    # LiveHosts are kept (generic relation), without the host values
+    LiveHost.objects.sync_hosts(sender, [instance.pk])
+
+
+@receiver(bulk_changed, sender=dns_models.DNSRecord)
+@receiver(bulk_changed, sender=dns_models.IPAddress)
+def livehost_bulk_changed(sender, pks, **kwargs):
+    LiveHost.objects.sync_hosts(sender, pks)
+
+
+def _livehost_tagged_pks(tag):
+    return {
+        dns_models.DNSRecord: list(dns_models.DNSRecord.objects.filter(tags=tag).values_list('pk', flat=True)),
+        dns_models.IPAddress: list(dns_models.IPAddress.objects.filter(tags=tag).values_list('pk', flat=True)),
+    }
+
+
+@receiver(pre_save, sender=dns_models.Tag)
+def livehost_tag_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+    if old_name != instance.name and (old_name in LiveHost.HOST_TAG_FLAGS or instance.name in LiveHost.HOST_TAG_FLAGS):
+        instance._livehost_pks = _livehost_tagged_pks(instance)
+
+
+@receiver(pre_delete, sender=dns_models.Tag)
+def livehost_tag_pre_delete(sender, instance, **kwargs):
+    if instance.name in LiveHost.HOST_TAG_FLAGS:
+        # relations are gone by post_delete
+        instance._livehost_pks = _livehost_tagged_pks(instance)
+
+
+@receiver(post_save, sender=dns_models.Tag)
+@receiver(post_delete, sender=dns_models.Tag)
+def livehost_tag_changed(sender, instance, **kwargs):
+    for host_model, pks in instance.__dict__.pop('_livehost_pks', {}).items():
+        LiveHost.objects.sync_hosts(host_model, pks)
+
+
 class Technology(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
@@ -373,9 +811,105 @@ class TechUsedResult(ScanResult):
         unique_together = (('host', 'application'),)
 
 
+class RawResultBlobManager(models.Manager):
+    def store(self, fileobj, chunk_size=64 * 1024):
+        """
+        hash and compress `fileobj` (binary) in chunks, re-using the existing blob if the content is already stored
+
+        :return: tuple with RawResultBlob and True if it was created
+        """
+        digest = hashlib.sha256()
+        compressor = zlib.compressobj(RawResultBlob.COMPRESS_LEVEL)
+        compressed = []
+        size = 0
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            if isinstance(data, str):
+                data = data.encode()
+            size += len(data)
+            digest.update(data)
+            compressed.append(compressor.compress(data))
+        compressed.append(compressor.flush())
+        data = b''.join(compressed)
+        while True:
+            blob, created = self.get_or_create(
+                digest=digest.hexdigest(), defaults={'size': size, 'compressed_size': len(data), 'data': data}
+            )
+            # re-used blobs are kept by delete_unreferenced for a while
+            if created or self.filter(pk=blob.pk).update(last_used=now()):
+                return blob, created
+            # deleted in the meantime, store it again
+
+    def delete_unreferenced(self, min_age, chunk_size=1000, dry_run=False):
+        """
+        delete blobs no RawResult points to, not used (stored or re-used) for `min_age` (timedelta)
+
+        :return: number of blobs deleted (or that would be, if `dry_run`)
+        """
+        qs = self.filter(results__isnull=True, last_used__lt=now() - min_age)
+        if dry_run:
+            return qs.count()
+        deleted = 0
+        while True:
+            pks = list(qs.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return deleted
+            try:
+                # same conditions again, blobs re-used in the meantime are kept
+                deleted += qs.filter(pk__in=pks).delete()[0]
+            except models.ProtectedError:
+                # re-used right after, excluded by last_used in the next chunk
+                continue
+
+
+class RawResultBlob(models.Model):
+    """
+    content of RawResult, zlib compressed and stored once (addressed by sha256 of the content)
+    """
+
+    COMPRESS_LEVEL = 6
+
+    digest = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(help_text='Content size (bytes)')
+    compressed_size = models.BigIntegerField(help_text='Stored size (bytes)')
+    data = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=now, db_index=True, editable=False)
+
+    objects = RawResultBlobManager()
+
+    class Meta:
+        verbose_name = 'Scanner Result - Raw Blob'
+        verbose_name_plural = 'Scanner Results - Raw Blobs'
+
+    def __str__(self):
+        return self.digest
+
+    def iter_content(self, chunk_size=64 * 1024):
+        """
+        decompressed content, in chunks
+        """
+        decompressor = zlib.decompressobj()
+        data = bytes(self.data)
+        for i in range(0, len(data), chunk_size):
+            out = decompressor.decompress(data[i : i + chunk_size])
+            if out:
+                yield out
+        out = decompressor.flush()
+        if out:
+            yield out
+
+    def text(self, errors='replace'):
+        return b''.join(self.iter_content()).decode(errors=errors)
+
+
 class RawResult(ScanResult):
     file_name = models.CharField(max_length=255, null=True, blank=True)
+    # legacy content, see `blob` (moved by backfill_raw_results)
     raw_results = models.TextField(null=True, blank=True)
+    blob = models.ForeignKey(RawResultBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='results')
 
     class Meta:
         verbose_name = 'Scanner Result - Raw'
@@ -383,3 +917,247 @@ class RawResult(ScanResult):
 
     def __str__(self):
         return str(self.last_seen)
+
+    @classmethod
+    def store(cls, fileobj, file_name, scanner=None, rootbox=None):
+        """
+        store `fileobj` content, if the same scanner already produced this same file (name and content)
+        only last_seen (and rootbox) of that result is updated
+
+        :return: tuple with RawResult and True if it was created
+        """
+        blob, blob_created = RawResultBlob.objects.store(fileobj)
+        if not blob_created:
+            rec = cls.objects.filter(scanner=scanner, file_name=file_name, blob=blob).order_by('-pk').first()
+            if rec is not None:
+                rec.rootbox = rootbox
+                rec.active = True
+                # auto_now updates last_seen
+                rec.save(update_fields=['rootbox', 'active', 'last_seen'])
+                return rec, False
+        return cls.objects.create(file_name=file_name, scanner=scanner, rootbox=rootbox, blob=blob), True
+
+    @property
+    def content(self):
+        if self.blob_id is not None:
+            return self.blob.text()
+        return self.raw_results
+
+
+class ScanTargetManager(models.Manager):
+    def _desired(self, kind, pks):
+        """
+        :return: dict of {object_id: dict of ScanTarget fields} for the objects in `pks` that should be targets
+        """
+        model = dns_models.DNSRecord if kind == ScanTarget.Kinds.HOST else dns_models.IPAddress
+        tags = {}
+        for pk, tag in model.objects.filter(pk__in=pks, tags__name__in=ScanTarget.TAGS).values_list('pk', 'tags__name'):
+            tags.setdefault(pk, set()).add(tag)
+        if not tags:
+            return {}
+        web = None
+        if kind == ScanTarget.Kinds.HOST:
+            web = set(
+                dns_models.DNSRecordValue.objects.filter(
+                    record_id__in=tags, active=True, rtype__in=ScanTarget.HOST_RTYPES
+                ).values_list('record_id', flat=True)
+            )
+        desired = {}
+        for pk, name, active in model.objects.filter(pk__in=tags).values_list('pk', 'name', 'active'):
+            t = tags[pk]
+            if name is None or not ({'is_external', 'is_internal'} & t):
+                continue
+            desired[pk] = {
+                'name': str(name),
+                'active': active and (web is None or pk in web),
+                'external': 'is_external' in t,
+                'internal': 'is_internal' in t,
+                'excluded': 'scan_excluded' in t,
+            }
+        return desired
+
+    def refresh(self, kind, pks, batch_size=1000):
+        """
+        create, update or delete the ScanTargets of `kind` for the DNSRecord/IPAddress in `pks`
+
+        :return: tuple with number of targets created, updated and deleted
+        """
+        pks = list(pks)
+        created = updated = deleted = 0
+        fields = ['name', 'active', 'external', 'internal', 'excluded']
+        for i in range(0, len(pks), batch_size):
+            chunk = pks[i : i + batch_size]
+            desired = self._desired(kind, chunk)
+            existing = {x.object_id: x for x in self.filter(kind=kind, object_id__in=chunk)}
+            to_create = []
+            to_update = []
+            for pk, values in desired.items():
+                rec = existing.get(pk)
+                if rec is None:
+                    to_create.append(ScanTarget(kind=kind, object_id=pk, **values))
+                elif any(getattr(rec, k) != v for k, v in values.items()):
+                    for k, v in values.items():
+                        setattr(rec, k, v)
+                    to_update.append(rec)
+            to_delete = [x.pk for pk, x in existing.items() if pk not in desired]
+            with transaction.atomic():
+                if to_create:
+                    self.bulk_create(to_create, batch_size=batch_size)
+                if to_update:
+                    self.bulk_update(to_update, fields, batch_size=batch_size)
+                if to_delete:
+                    self.filter(pk__in=to_delete).delete()
+            created += len(to_create)
+            updated += len(to_update)
+            deleted += len(to_delete)
+        return created, updated, deleted
+
+    def targets(self, kind, internal=False):
+        """
+        :return: queryset with the names of the active, not excluded, `kind` targets
+        """
+        qs = self.filter(kind=kind, active=True, excluded=False)
+        if internal:
+            qs = qs.filter(internal=True)
+        else:
+            qs = qs.filter(external=True)
+        return qs.values_list('name', flat=True).distinct()
+
+    def built(self, kind):
+        """
+        :return: True if targets of `kind` are complete (see ScanTargetBuild)
+        """
+        return ScanTargetBuild.objects.filter(kind=kind).exists()
+
+
+class ScanTarget(models.Model):
+    """
+    DNSRecords and IPAddresses tagged as external or internal, with what HOSTS/IPS inputs need to filter them
+    (instead of joining tags and record values every time a scanner starts)
+
+    kept up to date by the signal handlers below, refresh_scan_targets command rebuilds them
+    (such as after bulk changes, which do not send signals)
+    """
+
+    class Kinds(models.TextChoices):
+        HOST = 'host', 'Host'
+        IP = 'ip', 'IP'
+
+    # tags that matter
+    TAGS = ('is_external', 'is_internal', 'scan_excluded')
+    # hosts are only targets with an active value of one of these types
+    HOST_RTYPES = ('A', 'LB', 'CNAME')
+
+    objects = ScanTargetManager()
+
+    kind = models.CharField(max_length=4, choices=Kinds.choices)
+    # DNSRecord or IPAddress (depending on kind)
+    object_id = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    active = models.BooleanField(default=True)
+    external = models.BooleanField(default=False)
+    internal = models.BooleanField(default=False)
+    excluded = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [('kind', 'object_id')]
+        indexes = [
+            # same order as ScanTargetManager.targets filters, name included (index-only scan)
+            models.Index(fields=['kind', 'external', 'active', 'excluded', 'name']),
+            models.Index(fields=['kind', 'internal', 'active', 'excluded', 'name']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.kind})'
+
+
+class ScanTargetBuild(models.Model):
+    """
+    full refresh (refresh_scan_targets) completed for a kind, HOSTS/IPS inputs only use ScanTargets of built kinds
+    (signal handlers add targets as soon as the table exists, but only for the objects changing)
+    """
+
+    kind = models.CharField(max_length=4, choices=ScanTarget.Kinds.choices, unique=True)
+    built_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.kind} built at {self.built_at}'
+
+
+def _scan_target_kind(model):
+    return ScanTarget.Kinds.HOST if issubclass(model, dns_models.DNSRecord) else ScanTarget.Kinds.IP
+
+
+@receiver(post_save, sender=dns_models.DNSRecord)
+@receiver(post_save, sender=dns_models.IPAddress)
+@receiver(post_delete, sender=dns_models.DNSRecord)
+@receiver(post_delete, sender=dns_models.IPAddress)
+def scan_target_host_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # no tags yet
+        return
+    ScanTarget.objects.refresh(_scan_target_kind(sender), [instance.pk])
+
+
+@receiver(post_save, sender=dns_models.DNSRecordValue)
+@receiver(post_delete, sender=dns_models.DNSRecordValue)
+def scan_target_record_value_changed(sender, instance, **kwargs):
+    ScanTarget.objects.refresh(ScanTarget.Kinds.HOST, [instance.record_id])
+
+
+@receiver(bulk_changed, sender=dns_models.DNSRecord)
+@receiver(bulk_changed, sender=dns_models.IPAddress)
+def scan_target_bulk_changed(sender, pks, **kwargs):
+    ScanTarget.objects.refresh(_scan_target_kind(sender), pks)
+
+
+@receiver(m2m_changed, sender=dns_models.DNSRecord.tags.through)
+@receiver(m2m_changed, sender=dns_models.IPAddress.tags.through)
+def scan_target_tags_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:
+        # instance is the Tag, pk_set the hosts
+        if instance.name not in ScanTarget.TAGS:
+            return
+        if action == 'pre_clear':
+            # hosts are gone by post_clear
+            instance._scan_target_clear_pks = list(model.objects.filter(tags=instance).values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = instance.__dict__.pop('_scan_target_clear_pks', ())
+        host_model = model
+    else:
+        pk_set = [instance.pk]
+        host_model = instance.__class__
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        ScanTarget.objects.refresh(_scan_target_kind(host_model), pk_set)
+
+
+def _tagged_pks(tag):
+    return {
+        ScanTarget.Kinds.HOST: list(dns_models.DNSRecord.objects.filter(tags=tag).values_list('pk', flat=True)),
+        ScanTarget.Kinds.IP: list(dns_models.IPAddress.objects.filter(tags=tag).values_list('pk', flat=True)),
+    }
+
+
+@receiver(pre_save, sender=dns_models.Tag)
+def scan_target_tag_pre_save(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+    if old_name != instance.name and (old_name in ScanTarget.TAGS or instance.name in ScanTarget.TAGS):
+        instance._scan_target_pks = _tagged_pks(instance)
+
+
+@receiver(pre_delete, sender=dns_models.Tag)
+def scan_target_tag_pre_delete(sender, instance, **kwargs):
+    if instance.name in ScanTarget.TAGS:
+        # relations are gone by post_delete
+        instance._scan_target_pks = _tagged_pks(instance)
+
+
+@receiver(post_save, sender=dns_models.Tag)
+@receiver(post_delete, sender=dns_models.Tag)
+def scan_target_tag_changed(sender, instance, **kwargs):
+    for kind, pks in instance.__dict__.pop('_scan_target_pks', {}).items():
+        ScanTarget.objects.refresh(kind, pks)
@@ -1,5 +1,9 @@
+import logging
 import os
 from abc import ABCMeta
+from functools import cached_property
+
+logger = logging.getLogger(__name__)
 
 
 class BaseParser(metaclass=ABCMeta):
@@ -8,6 +12,9 @@ class BaseParser(metaclass=ABCMeta):
 
     __CACHE__ = {}
     CHOICES = []
+    # preload the whole DNSRecord/IPAddress inventory in `host_index`, instead of resolving (and caching) names
+    # as they are requested - worth it when results cover most of the inventory
+    host_index_preload = False
 
     @classmethod
     def __init_subclass__(cls):
@@ -34,8 +41,31 @@ class BaseParser(metaclass=ABCMeta):
         self.rootbox = rootbox
         self.timestamp = timestamp
         self.filepath = filepath
+        # throughput counters: files handled (raw results) and records parsed (updated by subclasses)
+        self.files = 0
+        self.records = 0
         self.parse(self.rootbox, self.scanner, self.timestamp, self.filepath)
         self.__raw_results()
+        if 'host_index' in self.__dict__:
+            logger.info('%s host index: %s', self.get_label(), self.host_index.stats())
+
+    @cached_property
+    def host_index(self):
+        """
+        hostname => (content_type_id, object_id) index for this parse run, see `scanners.utils.HostIndex`
+        """
+        from scanners import utils
+
+        index = utils.HostIndex()
+        if self.host_index_preload:
+            index.load()
+        return index
+
+    def resolve_hosts(self, names):
+        """
+        :return: dict of {name: (content_type_id, object_id)} for the names that match a DNSRecord or IPAddress
+        """
+        return self.host_index.resolve(names)
 
     def parse(self, rootbox, scanner, timestamp, filepath):
         """
@@ -51,17 +81,19 @@ class BaseParser(metaclass=ABCMeta):
         for _sf in os.listdir(self.filepath):
             target = os.path.join(self.filepath, _sf)
             if os.path.isfile(target):
+                self.files += 1
                 self.save_results(_sf, target)
             # :hammer!! support for baseline_browser results organised in folders, can be improved!
             elif os.path.isdir(target):
                 for _file in os.listdir(target):
+                    self.files += 1
                     self.save_results(_file, os.path.join(target, _file))
 
     def save_results(self, name, file_src):
         from scanners import models
 
-        with open(file_src) as f:
-            models.RawResult(file_name=name, rootbox=self.rootbox, scanner=self.scanner, raw_results=f.read()).save()
+        with open(file_src, 'rb') as f:
+            models.RawResult.store(f, name, scanner=self.scanner, rootbox=self.rootbox)
 
 
 def query(key):
@@ -0,0 +1,217 @@
+import heapq
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from scanners import models, utils
+
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    keeps continuous scanners running
+
+    * scanners that are not running are queued as due (priority queue ordered by due time)
+    * due scanners are placed on the least loaded active rootbox with a free slot (see `Rootbox.scanner_slots`),
+      preferring `Scanner.rootbox` and only using rootboxes in the same location as that one
+    * scanners that cannot be placed (no free slots) stay queued, `Scanner.queued_since` is set
+    * `watch` follows docker events of each rootbox so a container exit re-arms its scanner (and sets `wake`)
+      without waiting for the next poll
+    """
+
+    def __init__(self, start, retry_delay=60, logger=logger):
+        """
+        :param start: callable receiving (scanner, rootbox), rootbox is None when placed on the scanner rootbox
+        :param retry_delay: seconds before trying again a scanner that failed to start
+                            (or reconnecting to docker events)
+        :param logger: logger to use, such as the one from the management command
+        """
+        self.start = start
+        self.logger = logger
+        self.retry_delay = retry_delay
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        # heap of (due, scanner pk) and scanner pk => due, for the valid entries
+        self._heap = []
+        self._due = {}
+        # rootbox pk => watcher thread
+        self._watchers = {}
+        self._stop = threading.Event()
+        self._name_re = re.compile(rf'^scanner-{re.escape(settings.AVZONE)}-(\d+)-')
+        # from last run_once
+        self.slots = {}
+
+    def arm(self, scanner_pk, due=None):
+        """
+        queue scanner to be started at `due` (monotonic time, default is now), unless already queued earlier
+        """
+        if due is None:
+            due = time.monotonic()
+        with self._lock:
+            current = self._due.get(scanner_pk)
+            if current is not None and current <= due:
+                return
+            self._due[scanner_pk] = due
+            heapq.heappush(self._heap, (due, scanner_pk))
+
+    def disarm(self, scanner_pk):
+        with self._lock:
+            # heap entry is skipped when popped
+            self._due.pop(scanner_pk, None)
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._due)
+
+    def _pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, pk = heapq.heappop(self._heap)
+                if self._due.get(pk) == when:
+                    del self._due[pk]
+                    due.append(pk)
+        return due
+
+    def scanner_pk(self, container_name):
+        m = self._name_re.match(container_name)
+        return int(m.group(1)) if m else None
+
+    def _check_boxes(self, rootboxes):
+        """
+        :return: dict of rootbox => set of scanner pks running in it (None if rootbox could not be checked)
+        """
+        running = {}
+        # always checked (and refreshes the cached snapshot for everyone else)
+        for rootbox, box in zip(rootboxes, utils.fleet_snapshot(rootboxes, max_age=0)):
+            if box.error:
+                self.logger.error('failed checking %s: %s', rootbox, box.error)
+                running[rootbox] = None
+            else:
+                running[rootbox] = {pk for pk in (self.scanner_pk(c['name']) for c in box.containers) if pk}
+        return running
+
+    def place(self, scanner, running):
+        """
+        :param running: dict of rootbox => set of scanner pks running in it
+        :return: rootbox to run `scanner` on, None if there is no free slot
+        """
+        preferred = scanner.rootbox
+        candidates = []
+        for rootbox, pks in running.items():
+            if pks is None:
+                continue
+            if preferred is not None and rootbox.location != preferred.location:
+                continue
+            slots = rootbox.scanner_slots()
+            if slots is not None and len(pks) >= slots:
+                continue
+            # least loaded (ratio if limited), preferred first when tied
+            load = len(pks) / slots if slots else 0
+            candidates.append(((rootbox != preferred, load, len(pks), rootbox.name), rootbox))
+        if not candidates:
+            return None
+        # preferred rootbox whenever it has a free slot
+        return min(candidates, key=lambda x: x[0])[1]
+
+    def run_once(self, rootbox_name=None):
+        """
+        check rootboxes, queue continuous scanners that are not running and start the due ones where there are slots
+
+        :param rootbox_name: only manage scanners attached to this rootbox (and only use that rootbox)
+        :return: list of (scanner, rootbox) started
+        """
+        qs = models.Scanner.objects.filter(continous_running=True).select_related('rootbox', 'image')
+        boxes = models.Rootbox.objects.filter(active=True).order_by('name')
+        if rootbox_name:
+            qs = qs.filter(rootbox__name=rootbox_name)
+            boxes = boxes.filter(name=rootbox_name)
+        scanners = {s.pk: s for s in qs}
+        boxes = list(boxes)
+        # only check rootboxes (docker ps) if there is anything to manage
+        running = self._check_boxes(boxes) if scanners else {}
+        running_pks = set().union(*(x for x in running.values() if x))
+
+        for pk in list(self._due):
+            if pk not in scanners or pk in running_pks:
+                self.disarm(pk)
+        for pk in scanners:
+            # keep the due time of the ones already queued (such as retries)
+            if pk not in running_pks and pk not in self._due:
+                self.arm(pk)
+
+        started = []
+        waiting = []
+        now = time.monotonic()
+        for pk in self._pop_due(now):
+            scanner = scanners[pk]
+            rootbox = self.place(scanner, running)
+            if rootbox is None:
+                if scanner.rootbox is not None and not scanner.rootbox.active:
+                    self.logger.error(
+                        '%s cannot be started as rootbox %s is not active', scanner.scanner_name, scanner.rootbox.name
+                    )
+                waiting.append(pk)
+                continue
+            try:
+                self.start(scanner, None if rootbox == scanner.rootbox else rootbox)
+            except Exception:
+                self.logger.exception('failed to start %s on %s', scanner.scanner_name, rootbox)
+                self.arm(pk, now + self.retry_delay)
+                continue
+            running[rootbox].add(pk)
+            started.append((scanner, rootbox))
+        for pk in waiting:
+            self.arm(pk, now)
+
+        self.slots = {
+            rootbox.name: (None if pks is None else len(pks), rootbox.scanner_slots())
+            for rootbox, pks in running.items()
+        }
+        self._save_status(scanners, running, waiting)
+        return started
+
+    def _save_status(self, scanners, running, waiting):
+        for rootbox, pks in running.items():
+            count = None if pks is None else len(pks)
+            if rootbox.running_scanners != count:
+                models.Rootbox.objects.filter(pk=rootbox.pk).update(running_scanners=count)
+        models.Scanner.objects.filter(queued_since__isnull=False).exclude(pk__in=waiting).update(queued_since=None)
+        if waiting:
+            models.Scanner.objects.filter(pk__in=waiting, queued_since__isnull=True).update(queued_since=timezone.now())
+
+    def _watch(self, rootbox):
+        while not self._stop.is_set():
+            try:
+                client = utils.get_docker_client(rootbox.ip, port=rootbox.dockerd_port, use_tls=rootbox.dockerd_tls)
+                for event in client.events(decode=True, filters={'type': 'container', 'event': 'die'}):
+                    pk = self.scanner_pk(event.get('Actor', {}).get('Attributes', {}).get('name', ''))
+                    if pk is not None:
+                        self.logger.debug('scanner %d exited in %s', pk, rootbox)
+                        self.arm(pk)
+                        self.wake.set()
+                    if self._stop.is_set():
+                        return
+            except Exception:
+                self.logger.exception('docker events failed for %s', rootbox)
+            self._stop.wait(self.retry_delay)
+
+    def watch(self, rootboxes):
+        """
+        start (daemon) threads following container exits in `rootboxes` (the ones not followed already)
+        """
+        for rootbox in rootboxes:
+            t = self._watchers.get(rootbox.pk)
+            if t is not None and t.is_alive():
+                continue
+            t = threading.Thread(target=self._watch, args=(rootbox,), name=f'events-{rootbox.name}', daemon=True)
+            self._watchers[rootbox.pk] = t
+            t.start()
+
+    def stop(self):
+        self._stop.set()
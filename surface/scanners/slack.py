@@ -15,9 +15,11 @@ class ScannersProcessor(MessageProcessor):
                 try:
                     out = utils.check_scanners(models.Rootbox.objects.filter(active=True))
                     for r in out:
-                        self.post_message(
-                            channel=channel, text=f'*{r[0]}*\n```{json.dumps(r[1], indent=4)}```', thread_ts=ts
-                        )
+                        if r.error:
+                            text = f'*{r.name}*\n:exclamation: {r.error}'
+                        else:
+                            text = f'*{r.name}*\n```{json.dumps(r.containers, indent=4)}```'
+                        self.post_message(channel=channel, text=text, thread_ts=ts)
                 except Exception:
                     logging.exception('checking scanners on slack')
                     self.post_message(
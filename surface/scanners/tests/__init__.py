@@ -3,9 +3,11 @@ import os
 import shutil
 import sys
 import tarfile
+from unittest import mock
 
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 
 from dns_ips import models as ip_models
 from scanners import models
@@ -20,6 +22,8 @@ class ScannerTestMixin:
     rootbox = None
 
     def setUpScanner(self, input=None, parser=None, image='docker_image', name='scanner_name', extra_args=None):
+        # rootbox state (running containers, pulled images) is cached
+        cache.clear()
         self.scannerimage = models.ScannerImage.objects.create(name=image, image=f'registry.com/test/{image}')
         self.rootbox = models.Rootbox.objects.create(
             name='testvm', ip='1.1.1.1', ssh_user='yourmom', location='local', dockerd_tls=False
@@ -35,6 +39,14 @@ class ScannerTestMixin:
         self.user = get_user_model().objects.create_user('tester', 'tester@ppb.it', 'tester')
         self.site = AdminSite()
 
+    def _container(self, name, image='registry.com/test/docker_image'):
+        """
+        (name, container) as yielded by `utils.check_scanners_in_box`
+        """
+        return name, mock.Mock(
+            short_id=name[-6:], attrs={'Image': image, 'Created': 0, 'Status': 'Up 1 second'}, status='running'
+        )
+
     def _login(self):
         self.client.login(username='tester', password='tester')
 
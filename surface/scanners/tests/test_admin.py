@@ -0,0 +1,100 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from scanners import models
+from scanners.tests import ScannerTestMixin
+
+
+class TestScanLogOutput(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(self.user)
+        self.scan_log = models.ScanLog.objects.create(name='1-wtv-12345', state=models.ScanLog.States.EXITED)
+        self.base = datetime(2021, 5, 24, 14, 55, 51, tzinfo=timezone.utc)
+        # legacy rows (older) and segments
+        models.ScanOutput.objects.bulk_create(
+            [models.ScanOutput(log=self.scan_log, timestamp=self.base, line='line 0')]
+        )
+        with override_settings(SCANNERS_OUTPUT_SEGMENT_LINES=2):
+            models.ScanOutputSegment.objects.append(
+                self.scan_log, [(self.base + timedelta(seconds=i), f'line {i}') for i in range(1, 5)]
+            )
+        self.url = f'/scanners/scanlog/{self.scan_log.pk}/output/'
+        self.full = ''.join(f'[{self.base + timedelta(seconds=i)}] line {i}\n' for i in range(5)).encode()
+
+    def _get(self, **kwargs):
+        params = kwargs.pop('params', {})
+        r = self.client.get(self.url, {'mode': 'raw', **params}, **kwargs)
+        return r, b''.join(r.streaming_content)
+
+    def test_raw(self):
+        r, content = self._get()
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(content, self.full)
+        self.assertEqual(r['Accept-Ranges'], 'bytes')
+
+        r, content = self._get(HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(r['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(content), self.full)
+
+        r, content = self._get(params={'format': 'gz'})
+        self.assertEqual(r['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(content), self.full)
+
+    def test_window(self):
+        _, content = self._get(
+            params={
+                'since': (self.base + timedelta(seconds=1)).isoformat(),
+                'until': (self.base + timedelta(seconds=3)).isoformat(),
+            }
+        )
+        self.assertEqual(content.splitlines(), self.full.splitlines()[2:4])
+        # naive, current timezone (UTC)
+        _, content = self._get(params={'since': (self.base + timedelta(seconds=3)).replace(tzinfo=None).isoformat()})
+        self.assertEqual(content.splitlines(), self.full.splitlines()[4:])
+        self.assertEqual(len(list(self.scan_log.iter_output(until=self.base.replace(tzinfo=None)))), 1)
+        r = self.client.get(self.url, {'mode': 'raw', 'since': 'yesterday'})
+        self.assertEqual(r.status_code, 400)
+
+    def test_range(self):
+        r, content = self._get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(r.status_code, 206)
+        self.assertEqual(content, self.full[10:])
+        self.assertEqual(r['Content-Range'], f'bytes 10-{len(self.full) - 1}/{len(self.full)}')
+
+        # resume gzip download
+        r, gz = self._get(params={'format': 'gz'})
+        r, content = self._get(params={'format': 'gz'}, HTTP_RANGE='bytes=5-9', HTTP_IF_RANGE=r['ETag'])
+        self.assertEqual(content, gz[5:10])
+
+        r = self.client.get(self.url, {'mode': 'raw'}, HTTP_RANGE=f'bytes={len(self.full)}-')
+        self.assertEqual(r.status_code, 416)
+
+        # still running, content is not final
+        self.scan_log.state = models.ScanLog.States.RUNNING
+        self.scan_log.save()
+        r, content = self._get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(content, self.full)
+
+    def test_stream(self):
+        url = f'{self.url}stream/'
+        # polling by default
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(SCANNERS_OUTPUT_STREAM=True):
+            # WSGI would buffer it
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(SCANNERS_OUTPUT_STREAM=True)
+    async def test_stream_asgi(self):
+        # naive cursor (current timezone, UTC)
+        cursor = (self.base + timedelta(seconds=2)).replace(tzinfo=None).isoformat()
+        await self.async_client.aforce_login(self.user)
+        r = await self.async_client.get(f'{self.url}stream/', {'cursor': cursor})
+        self.assertEqual(r.status_code, 200)
+        content = b''.join([chunk async for chunk in r.streaming_content]).decode()
+        self.assertEqual(content.count('event: line'), 2)
+        self.assertIn('event: end', content)
@@ -1,9 +1,13 @@
-from io import StringIO
+import os
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
 from unittest import mock
 from docker.errors import APIError
 
 from django.core import management
 from django.test import TestCase
+from django.utils import timezone
 
 from scanners import models
 from scanners.management.commands import run_scanners_continuously, run_squid_proxy
@@ -37,7 +41,7 @@ class TestRunScannersContinuously(ScannerTestMixin, TestCase):
         self.setUpScanner()
         self.scanner.continous_running = True
         self.scanner.save()
-        check_mock.return_value = [(f'scanner-test-999-whatever-9990', None)]
+        check_mock.return_value = [self._container(f'scanner-test-999-whatever-9990')]
         self._cmd.handle_loop()
         self.assertEqual(self._out.getvalue(), '')
         self.assertEqual(self._err.getvalue(), '')
@@ -63,7 +67,9 @@ class TestRunScannersContinuously(ScannerTestMixin, TestCase):
         # already running
         check_mock.reset_mock()
         call_mock.reset_mock()
-        check_mock.return_value = iter([(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990', None)])
+        check_mock.return_value = iter(
+            [self._container(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990')]
+        )
         self._cmd.handle_loop()
         self.assertEqual(self._out.getvalue(), '')
         self.assertEqual(self._err.getvalue(), '')
@@ -103,7 +109,9 @@ class TestRunScannersContinuously(ScannerTestMixin, TestCase):
         # one running, start the other
         check_mock.reset_mock()
         call_mock.reset_mock()
-        check_mock.return_value = iter([(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990', None)])
+        check_mock.return_value = iter(
+            [self._container(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990')]
+        )
         self._cmd.handle_loop()
         self.assertEqual(self._out.getvalue(), '')
         self.assertEqual(self._err.getvalue(), '')
@@ -122,8 +130,8 @@ class TestRunScannersContinuously(ScannerTestMixin, TestCase):
             [
                 # reversed on purpose as self.scanner is checked first
                 # and would iterate over scanner2 - bug if not properly cast to list before
-                (f'scanner-test-{scanner2.pk}-{scanner2.image.name}-9990', None),
-                (f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990', None),
+                self._container(f'scanner-test-{scanner2.pk}-{scanner2.image.name}-9990'),
+                self._container(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990'),
             ]
         )
         self._cmd.handle_loop()
@@ -140,13 +148,133 @@ class TestRunScannersContinuously(ScannerTestMixin, TestCase):
         self.scanner.save()
         self.scanner.rootbox.active = False
         self.scanner.rootbox.save()
-        check_mock.return_value = [(f'scanner-test-999-whatever-9990', None)]
+        check_mock.return_value = [self._container(f'scanner-test-999-whatever-9990')]
         self._cmd.handle_loop()
         self.assertEqual(self._out.getvalue(), '')
         self.assertEqual(self._err.getvalue(), '')
         call_mock.assert_not_called()
         check_mock.assert_not_called()
 
+    def _clone_scanner(self, name):
+        scanner = self.scanner.__class__.objects.get(pk=self.scanner.pk)
+        scanner.pk = None
+        scanner.scanner_name = name
+        scanner.save()
+        return scanner
+
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    @mock.patch('scanners.management.commands.run_scanners_continuously.call_command')
+    @mock.patch('scanners.management.commands.run_scanner.Command')
+    def test_with_continous_max_scanners(self, run_mock, call_mock, check_mock):
+        self.setUpScanner()
+        self.scanner.continous_running = True
+        self.scanner.save()
+        scanner2 = self._clone_scanner('whatever')
+        self.rootbox.max_scanners = 1
+        self.rootbox.save()
+
+        # only one slot, other one queued
+        check_mock.return_value = []
+        self._cmd.handle_loop()
+        self.assertEqual(
+            call_mock.mock_calls,
+            [mock.call(run_mock.return_value, self.scanner)],
+        )
+        self.rootbox.refresh_from_db()
+        self.assertEqual(self.rootbox.running_scanners, 1)
+        scanner2.refresh_from_db()
+        self.assertIsNotNone(scanner2.queued_since)
+        self.assertEqual(self._cmd.scheduler.queue_depth(), 1)
+
+        # first one finished, start the queued one
+        call_mock.reset_mock()
+        check_mock.return_value = []
+        self._cmd.handle_loop()
+        self.assertEqual(len(call_mock.mock_calls), 1)
+        scanner2.refresh_from_db()
+        self.assertEqual(
+            models.Scanner.objects.filter(queued_since__isnull=False).count(),
+            1,
+        )
+
+        # both running (slots changed), nothing queued
+        call_mock.reset_mock()
+        self.rootbox.max_scanners = None
+        self.rootbox.save()
+        check_mock.return_value = [
+            self._container(f'scanner-test-{self.scanner.pk}-{self.scanner.image.name}-9990'),
+            self._container(f'scanner-test-{scanner2.pk}-{scanner2.image.name}-9990'),
+        ]
+        self._cmd.handle_loop()
+        call_mock.assert_not_called()
+        self.assertFalse(models.Scanner.objects.filter(queued_since__isnull=False).exists())
+        self.rootbox.refresh_from_db()
+        self.assertEqual(self.rootbox.running_scanners, 2)
+
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    @mock.patch('scanners.management.commands.run_scanners_continuously.call_command')
+    @mock.patch('scanners.management.commands.run_scanner.Command')
+    def test_with_continous_placement(self, run_mock, call_mock, check_mock):
+        self.setUpScanner()
+        self.scanner.continous_running = True
+        self.scanner.save()
+        scanner2 = self._clone_scanner('whatever')
+        scanner3 = self._clone_scanner('whatever2')
+        self.rootbox.max_scanners = 1
+        self.rootbox.save()
+        box2 = models.Rootbox.objects.create(name='testvm2', ip='1.1.1.2', location='local', max_scanners=1)
+        # other location, never used
+        models.Rootbox.objects.create(name='testvm3', ip='1.1.1.3', location='remote')
+
+        check_mock.return_value = []
+        self._cmd.handle_loop()
+        self.assertEqual(check_mock.call_count, 3)
+        calls = sorted(call_mock.call_args_list, key=lambda x: x[0][1].pk)
+        # preferred rootbox first
+        self.assertEqual(calls[0], mock.call(run_mock.return_value, self.scanner))
+        self.assertEqual(calls[1], mock.call(run_mock.return_value, scanner2, rootbox=box2.name))
+        self.assertEqual(len(calls), 2)
+        scanner3.refresh_from_db()
+        self.assertIsNotNone(scanner3.queued_since)
+
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    @mock.patch('scanners.management.commands.run_scanners_continuously.call_command')
+    def test_with_continous_start_failure(self, call_mock, check_mock):
+        self.setUpScanner()
+        self.scanner.continous_running = True
+        self.scanner.save()
+        check_mock.return_value = []
+        call_mock.side_effect = Exception('boom')
+        self._cmd.handle_loop()
+        call_mock.assert_called_once()
+        # retried later, not on next loop
+        call_mock.reset_mock()
+        self._cmd.handle_loop()
+        call_mock.assert_not_called()
+        self.assertEqual(self._cmd.scheduler.queue_depth(), 1)
+
+    def test_scheduler_events(self):
+        from scanners.scheduler import Scheduler
+
+        self.setUpScanner()
+        scheduler = Scheduler(mock.Mock())
+        self.assertEqual(scheduler.scanner_pk(f'scanner-test-{self.scanner.pk}-docker_image-9990'), self.scanner.pk)
+        self.assertIsNone(scheduler.scanner_pk(f'scanner-other-{self.scanner.pk}-docker_image-9990'))
+        self.assertIsNone(scheduler.scanner_pk('squid-proxy'))
+
+        client = mock.Mock()
+        client.events.return_value = [
+            {'Actor': {'Attributes': {'name': 'squid-proxy'}}},
+            {'Actor': {'Attributes': {'name': f'scanner-test-{self.scanner.pk}-docker_image-9990'}}},
+        ]
+        with mock.patch('scanners.utils.get_docker_client', return_value=client):
+            scheduler.retry_delay = 0.01
+            scheduler.watch([self.rootbox])
+            self.assertTrue(scheduler.wake.wait(5))
+            scheduler.stop()
+        self.assertEqual(scheduler.queue_depth(), 1)
+        client.events.assert_called_with(decode=True, filters={'type': 'container', 'event': 'die'})
+
 
 class TestRunSquidProxy(ScannerTestMixin, TestCase):
     def setUp(self):
@@ -227,3 +355,120 @@ class TestRunSquidProxy(ScannerTestMixin, TestCase):
         client_mock.images.pull.assert_called_once_with('registry.com/test/squid', 'latest')
         client_mock.api.remove_container.assert_called_once_with('squid-test')
         self.assertEqual(client_mock.containers.create.call_count, 2)
+
+
+class TestPrewarmImages(ScannerTestMixin, TestCase):
+    @mock.patch('scanners.utils.ensure_image')
+    @mock.patch('scanners.utils.get_docker_client')
+    def test_prewarm(self, client_mock, ensure_mock):
+        self.setUpScanner()
+        scanner2 = models.Scanner.objects.get(pk=self.scanner.pk)
+        scanner2.pk = None
+        scanner2.scanner_name = 'whatever'
+        scanner2.docker_tag = 'v2'
+        scanner2.save()
+        box2 = models.Rootbox.objects.create(name='testvm2', ip='1.1.1.2', location='local')
+        models.Rootbox.objects.create(name='inactive', ip='1.1.1.3', active=False)
+
+        # second rootbox fails
+        ensure_mock.side_effect = [
+            'pulled' if box.pk == self.rootbox.pk else APIError('wtv') for box in (self.rootbox, box2) for _ in range(3)
+        ]
+        management.call_command('prewarm_images', '-w', '1')
+        self.assertEqual(
+            sorted((c[0][1].name, c[0][2], c[0][3]) for c in ensure_mock.call_args_list),
+            [
+                ('testvm', 'registry.com/test/docker_image', 'latest'),
+                ('testvm', 'registry.com/test/docker_image', 'v2'),
+                ('testvm', 'registry.com/test/squid', 'latest'),
+                ('testvm2', 'registry.com/test/docker_image', 'latest'),
+                ('testvm2', 'registry.com/test/docker_image', 'v2'),
+                ('testvm2', 'registry.com/test/squid', 'latest'),
+            ],
+        )
+        self.assertEqual(ensure_mock.call_args_list[0][1], {'ttl': None})
+
+        # single rootbox and image, ignoring digest cache
+        ensure_mock.reset_mock()
+        ensure_mock.side_effect = None
+        ensure_mock.return_value = 'current'
+        management.call_command('prewarm_images', '-r', 'testvm2', '-i', 'docker_image', '--force')
+        self.assertEqual(
+            sorted((c[0][1].name, c[0][3], c[1]['ttl']) for c in ensure_mock.call_args_list),
+            [('testvm2', 'latest', 0), ('testvm2', 'v2', 0)],
+        )
+
+
+class TestParseScannerResults(ScannerTestMixin, TestCase):
+    def test_parse(self):
+        self.setUpScanner()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            res_dir = os.path.join(tmp_dir, f'{self.scanner.pk}_test')
+            # created out of order, timestamps (and shards) should be parsed in order
+            for ts in ('100', '99.1', '99.0', '1000'):
+                os.makedirs(os.path.join(res_dir, ts))
+                with open(os.path.join(res_dir, ts, f'{ts}.txt'), 'w') as f:
+                    f.write(ts)
+            out = StringIO()
+            management.call_command('parse_scanner_results', res_dir, stdout=out, stderr=StringIO())
+        self.assertEqual(
+            list(models.RawResult.objects.order_by('pk').values_list('file_name', flat=True)),
+            ['99.0.txt', '99.1.txt', '100.txt', '1000.txt'],
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertRegex(lines[-1], r'^scanners.BaseParser: 4 files \(\d+\.\d files/s\), 0 records ')
+
+
+class TestRawResults(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.setUpScanner()
+
+    def test_store(self):
+        rec, created = models.RawResult.store(BytesIO(b'x' * 1000), 'out.txt', scanner=self.scanner)
+        self.assertTrue(created)
+        self.assertEqual(rec.content, 'x' * 1000)
+        self.assertLess(rec.blob.compressed_size, rec.blob.size)
+
+        # same content, only last_seen is bumped
+        rec2, created = models.RawResult.store(BytesIO(b'x' * 1000), 'out.txt', scanner=self.scanner)
+        self.assertFalse(created)
+        self.assertEqual(rec2.pk, rec.pk)
+        self.assertGreater(rec2.last_seen, rec.last_seen)
+
+        # same content in another file re-uses blob
+        rec3, created = models.RawResult.store(BytesIO(b'x' * 1000), 'other.txt', scanner=self.scanner)
+        self.assertTrue(created)
+        self.assertEqual(rec3.blob, rec.blob)
+        self.assertEqual(models.RawResultBlob.objects.count(), 1)
+
+    def test_delete_unused_blobs(self):
+        used, _ = models.RawResult.store(BytesIO(b'used'), 'out.txt', scanner=self.scanner)
+        gone, _ = models.RawResult.store(BytesIO(b'gone'), 'out.txt', scanner=self.scanner)
+        recent, _ = models.RawResult.store(BytesIO(b'recent'), 'out.txt', scanner=self.scanner)
+        models.RawResult.objects.filter(pk__in=[gone.pk, recent.pk]).delete()
+        models.RawResultBlob.objects.exclude(pk=recent.blob_id).update(last_used=timezone.now() - timedelta(days=2))
+
+        out = StringIO()
+        management.call_command('delete_unused_raw_blobs', dry=True, stdout=out)
+        management.call_command('delete_unused_raw_blobs', chunk_size=1, stdout=out)
+        self.assertEqual(out.getvalue(), 'Would delete 1 unused blobs\nDeleted 1 unused blobs\n')
+        self.assertEqual(set(models.RawResultBlob.objects.values_list('pk', flat=True)), {used.blob_id, recent.blob_id})
+
+        # re-used blobs are kept for a while again
+        again, _ = models.RawResult.store(BytesIO(b'used'), 'again.txt', scanner=self.scanner)
+        models.RawResult.objects.filter(pk__in=[used.pk, again.pk]).delete()
+        self.assertEqual(models.RawResultBlob.objects.delete_unreferenced(timedelta(hours=1)), 0)
+
+    def test_backfill(self):
+        for i in range(3):
+            models.RawResult.objects.create(scanner=self.scanner, file_name='out.txt', raw_results='legacy')
+        models.RawResult.objects.create(scanner=self.scanner, file_name='out.txt', raw_results='other')
+        out = StringIO()
+        management.call_command('backfill_raw_results', batch_size=2, dedupe=True, stdout=out)
+        self.assertEqual(out.getvalue(), 'Converted 4 results into 2 new blobs\nRemoved 2 duplicated results\n')
+        self.assertEqual(
+            sorted(x.content for x in models.RawResult.objects.all()),
+            ['legacy', 'other'],
+        )
+        self.assertFalse(models.RawResult.objects.filter(raw_results__isnull=False).exists())
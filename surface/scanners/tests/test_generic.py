@@ -1,4 +1,6 @@
-from io import StringIO
+import os
+import tarfile
+from io import BytesIO, StringIO
 from unittest import mock
 
 from django.core import management
@@ -20,15 +22,191 @@ class Test(ScannerTestMixin, TestCase):
         self.assertEqual(out.getvalue(), 'Skipping nmap1 with empty input file\n')
         self.assertEqual(err.getvalue(), '')
 
+    @mock.patch('scanners.utils.get_docker_client')
+    def test_run_scanner(self, client_mock):
+        self.scanner.input = 'IPS'
+        self.scanner.save()
+        tag = self._create_tag()
+        for ip in ('1.1.1.1', '2.2.2.2'):
+            self._create_ipaddress(name=ip).tags.add(tag)
+
+        uploaded = BytesIO()
+
+        def _put_archive(path, data):
+            # consume the stream as docker-py would
+            for chunk in data:
+                uploaded.write(chunk)
+
+        container = client_mock.return_value.containers.create.return_value
+        container.put_archive.side_effect = _put_archive
+
+        out = StringIO()
+        management.call_command('run_scanner', self.scanner.scanner_name, stdout=out, stderr=StringIO())
+        self.assertRegex(
+            out.getvalue(), r'^nmap1 started on testvm: 2 input records \(\d+ rows/s, \d+\.\dB uploaded\)\n$'
+        )
+        self.assertEqual(
+            client_mock.return_value.containers.create.call_args[1]['command'], '-p 1,2,3 /input/input.txt'
+        )
+        container.start.assert_called_once_with()
+
+        uploaded.seek(0)
+        with tarfile.open(fileobj=uploaded, mode='r:gz') as tar:
+            self.assertEqual(tar.getnames(), ['input/input.txt'])
+            self.assertEqual(sorted(tar.extractfile('input/input.txt').read().splitlines()), [b'1.1.1.1', b'2.2.2.2'])
+
+    @mock.patch('scanners.utils.get_docker_client')
+    def test_run_scanner_shards(self, client_mock):
+        self.scanner.input = 'IPS'
+        self.scanner.save()
+        models.Rootbox.objects.create(name='testvm2', ip='2.2.2.2', dockerd_tls=False)
+        tag = self._create_tag()
+        for ip in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            self._create_ipaddress(name=ip).tags.add(tag)
+
+        out = StringIO()
+        management.call_command(
+            'run_scanner', self.scanner.scanner_name, shards=3, spread=True, stdout=out, stderr=StringIO()
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('nmap1 shard 1/3 started on testvm: 1 input records'))
+        self.assertTrue(lines[1].startswith('nmap1 shard 2/3 started on testvm2: 1 input records'))
+        self.assertTrue(lines[2].startswith('nmap1 shard 3/3 started on testvm: 1 input records'))
+        self.assertEqual([c[0][0] for c in client_mock.call_args_list], ['1.1.1.1', '2.2.2.2'])
+
+        run = models.ScanRun.objects.get()
+        self.assertEqual(run.scanner, self.scanner)
+        self.assertEqual(run.shards, 3)
+        names = [c[1]['name'] for c in client_mock.return_value.containers.create.call_args_list]
+        self.assertEqual(names, [f'scanner-test-{run.name}.{i}' for i in range(3)])
+
+    @mock.patch('scanners.utils.get_docker_client')
+    def test_run_scanner_skip_unchanged(self, client_mock):
+        self.scanner.input = 'IPS'
+        self.scanner.skip_unchanged_input = True
+        self.scanner.save()
+        tag = self._create_tag()
+        self._create_ipaddress(name='1.1.1.1').tags.add(tag)
+
+        management.call_command('run_scanner', self.scanner.scanner_name, stdout=StringIO(), stderr=StringIO())
+        labels = client_mock.return_value.containers.create.call_args[1]['labels']
+        digest = labels['surface.input_hash']
+        self.assertEqual(len(digest), 64)
+
+        # failed run, not skipped
+        log = models.ScanLog.objects.create(
+            name='1', scanner=self.scanner, state=models.ScanLog.States.EXITED, exit_code=1, input_hash=digest
+        )
+        self.assertFalse(self.scanner.input_unchanged(digest))
+        log.exit_code = 0
+        log.save()
+
+        out = StringIO()
+        management.call_command('run_scanner', self.scanner.scanner_name, stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue(), 'Skipping nmap1, input unchanged since last successful run\n')
+        self.assertEqual(client_mock.return_value.containers.create.call_count, 1)
+
+        self._create_ipaddress(name='2.2.2.2').tags.add(tag)
+        out = StringIO()
+        management.call_command('run_scanner', self.scanner.scanner_name, stdout=out, stderr=StringIO())
+        self.assertTrue(out.getvalue().startswith('nmap1 started on testvm: 2 input records'))
+        self.assertEqual(client_mock.return_value.containers.create.call_count, 2)
+
+    @mock.patch('django.db.close_old_connections')  # bad for test :P
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    def test_sync_running_shards(self, check_mock, *_):
+        check_mock.return_value = [
+            (
+                f'scanner-test-{self.scanner.pk}-wtv-12345.0',
+                mock.MagicMock(
+                    status=models.ScanLog.States.RUNNING.label, attrs={'Labels': {'surface.input_hash': 'abc'}}
+                ),
+            ),
+            (
+                f'scanner-test-{self.scanner.pk}-wtv-12345.1',
+                mock.MagicMock(status=models.ScanLog.States.RUNNING.label, attrs={}),
+            ),
+        ]
+        management.call_command('resync_rootbox', run_once=True, just='running', stdout=StringIO(), stderr=StringIO())
+
+        run = models.ScanRun.objects.get()
+        self.assertEqual(run.name, f'{self.scanner.pk}-wtv-12345')
+        self.assertEqual(run.scanner, self.scanner)
+        self.assertEqual(
+            sorted(run.scan_logs.values_list('name', flat=True)),
+            [f'{self.scanner.pk}-wtv-12345.0', f'{self.scanner.pk}-wtv-12345.1'],
+        )
+        self.assertEqual(models.ScanLog.objects.get(name=f'{self.scanner.pk}-wtv-12345.0').input_hash, 'abc')
+
+    @mock.patch('django.db.close_old_connections')  # bad for test :P
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    def test_sync_running_failed_box(self, check_mock, *_):
+        models.Rootbox.objects.create(name='testvm2', ip='2.2.2.2', dockerd_tls=False)
+        check_mock.side_effect = [ConnectionError('unreachable'), []]
+        out = StringIO()
+        with self.assertLogs(logger='surface.command.resync_rootbox', level='ERROR') as cm:
+            management.call_command('resync_rootbox', run_once=True, just='running', stdout=out, stderr=StringIO())
+        self.assertEqual(cm.output[0].splitlines()[0], 'ERROR:surface.command.resync_rootbox:failed processing testvm')
+        # second box still processed
+        self.assertEqual(check_mock.call_count, 2)
+        self.assertRegex(
+            out.getvalue(), r'^Resync loop took \d+\.\d\ds: testvm FAILED, testvm2 \d+\.\d\ds \(docker clients: .*\)\n$'
+        )
+
+    @mock.patch('django.db.close_old_connections')  # bad for test :P
+    @mock.patch('scanners.management.commands.parse_scanner_results.parse_results')
+    @mock.patch('scanners.utils.get_docker_client')
+    def test_sync_results(self, client_mock, parse_mock, *_):
+        sdir = f'/output/{self.scanner.pk}_nmap'
+        client_mock.return_value.containers.run.return_value = (
+            f'MARK\n1000\n5 900 {sdir}/1/done.txt\n4 999 {sdir}/1/partial.txt\n9 900 {sdir}/2/grown.txt\n'
+        ).encode()
+        archives = {
+            f'{sdir}/1': self._create_tar_file([('done\n', '1/done.txt'), ('part', '1/partial.txt')]),
+            f'{sdir}/2': self._create_tar_file([('grown since listing', '2/grown.txt')]),
+        }
+        container = client_mock.return_value.containers.create.return_value
+        # small chunks to exercise the stream
+        container.get_archive.side_effect = lambda path: (iter(lambda: archives[path].read(100), b''), {})
+        container.logs.return_value = b'MARK\n'
+        uploaded = BytesIO()
+        container.put_archive.side_effect = lambda path, data: [uploaded.write(chunk) for chunk in data]
+
+        results = {}
+
+        def _parse(res_dir, rootbox=None, stats=None):
+            for root, _, files in os.walk(res_dir):
+                for f in files:
+                    with open(os.path.join(root, f)) as fd:
+                        results[os.path.relpath(os.path.join(root, f), res_dir)] = fd.read()
+            return []
+
+        parse_mock.side_effect = _parse
+
+        management.call_command('resync_rootbox', run_once=True, just='results', stdout=StringIO(), stderr=StringIO())
+        # only settled file in first directory is downloaded, second one changed size
+        self.assertEqual(container.get_archive.call_count, 2)
+        self.assertEqual(results, {os.path.join('1', 'done.txt'): 'done\n'})
+        uploaded.seek(0)
+        with tarfile.open(fileobj=uploaded, mode='r:gz') as tar:
+            self.assertEqual(tar.extractfile('todel.txt').read(), f'{sdir}/1/done.txt\n'.encode())
+
     @mock.patch('django.db.close_old_connections')  # bad for test :P
     @mock.patch('scanners.utils.check_scanners_in_box')
     def test_sync_running(self, check_mock, *_):
         out = StringIO()
         err = StringIO()
         check_mock.return_value = [
-            (f'scanner-test-{self.scanner.pk}-wtv-12345', mock.MagicMock(status=models.ScanLog.States.RUNNING.label)),
-            ('scanner-test-99999999999-wtv-12345', mock.MagicMock(status=models.ScanLog.States.RUNNING.label)),
-            ('scanner-test-wtv-12345', mock.MagicMock(status=models.ScanLog.States.RUNNING.label)),
+            (
+                f'scanner-test-{self.scanner.pk}-wtv-12345',
+                mock.MagicMock(status=models.ScanLog.States.RUNNING.label, attrs={}),
+            ),
+            (
+                'scanner-test-99999999999-wtv-12345',
+                mock.MagicMock(status=models.ScanLog.States.RUNNING.label, attrs={}),
+            ),
+            ('scanner-test-wtv-12345', mock.MagicMock(status=models.ScanLog.States.RUNNING.label, attrs={})),
         ]
 
         management.call_command('resync_rootbox', run_once=True, just='running', stdout=out, stderr=err, verbosity=2)
@@ -52,7 +230,10 @@ class Test(ScannerTestMixin, TestCase):
         out = StringIO()
         err = StringIO()
         check_mock.return_value = [
-            (f'scanner-test-{self.scanner.pk}-wtv-12345', mock.MagicMock(status=models.ScanLog.States.RUNNING.label)),
+            (
+                f'scanner-test-{self.scanner.pk}-wtv-12345',
+                mock.MagicMock(status=models.ScanLog.States.RUNNING.label, attrs={}),
+            ),
         ]
 
         management.call_command('resync_rootbox', run_once=True, just='running', stdout=out, stderr=err, verbosity=2)
@@ -1,8 +1,12 @@
+from django.core import management
+from django.db import transaction
 from django.utils import timezone
 from django.test import TestCase
 
+from scanners import models
 from scanners.tests import ScannerTestMixin
 from dns_ips import models as ip_models
+from dns_ips.signals import bulk_changed
 from scanners.inputs.base import query as input_query
 
 
@@ -88,6 +92,51 @@ class TestLive(Base):
 
         self.assertEqual(self.generate_input(), ['https://w1.betfair.com'])
 
+    def test_inp_no_models(self):
+        d3 = self._create_dnsrecord(name='w3.betfair.com')
+        d3.tags.add(self.tag_ext)
+        expected = [
+            str(self._create_livehost(host=self.d1)),
+            str(self._create_livehost(host=self.ip1, port=80)),
+            str(self._create_livehost(host=d3)),
+            str(self._create_livehost(host=self.d1, port=80)),
+        ]
+        self.assertEqual(expected[1], 'http://1.1.1.1')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.generate_input(), expected)
+
+        # host no longer exists, same as str()
+        lh = models.LiveHost.objects.get(host_object_id=d3.pk, port=443)
+        models.LiveHost.objects.filter(pk=lh.pk).update(host_name=None, host_object_id=999999)
+        lh.refresh_from_db()
+        self.assertEqual(self.generate_input(), expected[:2] + [str(lh)] + expected[3:])
+
+    def baseline_output(self, tag='is_external'):
+        # LIVE output computed from the hosts themselves, without the copied fields
+        since = timezone.now() - timezone.timedelta(days=7)
+        qs = models.LiveHost.objects.filter(active=True, last_seen__gte=since, port__in=[80, 443]).order_by('pk')
+        return [
+            models.LiveHost.format_url(lh.host.name, lh.port)
+            for lh in qs
+            if lh.host is not None and lh.host.tags.filter(name=tag).exists()
+        ]
+
+    def test_deleted_host_or_tag(self):
+        gone = self._create_dnsrecord(name='gone.example.com')
+        gone.tags.add(self.tag_ext)
+        self._create_livehost(host=gone)
+        self._create_livehost(host=self.d1)
+        self.assertEqual(self.generate_input(), ['https://gone.example.com', 'https://w1.betfair.com'])
+        self.assertEqual(self.generate_input(), self.baseline_output())
+
+        gone.delete()
+        self.assertEqual(self.generate_input(), ['https://w1.betfair.com'])
+        self.assertEqual(self.generate_input(), self.baseline_output())
+
+        self.tag_ext.delete()
+        self.assertEqual(self.generate_input(), [])
+        self.assertEqual(self.generate_input(), self.baseline_output())
+
 
 class TestLiveInt(Base):
     INP = 'LIVEINT'
@@ -140,3 +189,112 @@ class TestTestIPs(Base):
         tag = self._create_tag(name='test')
         self.ip1.tags.add(tag)
         self.assertEqual(self.generate_input(), ['1.1.1.1'])
+
+
+class TestScanTargets(Base):
+    INP_IPS = True
+
+    def setUp(self):
+        super().setUp()
+        # as after refresh_scan_targets, targets kept up to date by the signals since
+        for kind in models.ScanTarget.Kinds.values:
+            models.ScanTargetBuild.objects.create(kind=kind, built_at=timezone.now())
+
+    def inputs(self):
+        return {x: sorted(self.generate_input_named(x)) for x in ('HOSTS', 'HOSTSINT', 'IPS', 'IPSINT', 'IPSHOSTSINT')}
+
+    def generate_input_named(self, name):
+        return list(input_query(name)().generate())
+
+    def legacy_inputs(self):
+        with transaction.atomic():
+            models.ScanTarget.objects.all().delete()
+            models.ScanTargetBuild.objects.all().delete()
+            inputs = self.inputs()
+            transaction.set_rollback(True)
+        return inputs
+
+    def test_incremental(self):
+        expected = {
+            'HOSTS': ['w1.betfair.com'],
+            'HOSTSINT': ['w1.prd.betfair'],
+            'IPS': ['1.1.1.1'],
+            'IPSINT': ['10.0.0.1'],
+            'IPSHOSTSINT': ['10.0.0.1', 'w1.prd.betfair'],
+        }
+        self.assertEqual(self.inputs(), expected)
+        self.assertEqual(self.legacy_inputs(), expected)
+        with self.assertNumQueries(2):
+            # build marker and the targets
+            self.generate_input_named('HOSTS')
+
+        # excluded, both sides of the relation
+        self.d1.tags.add(self.tag_exc)
+        self.tag_exc.ipaddress_set.add(self.ip2)
+        # no longer a web record
+        self.d2.dnsrecordvalue_set.update(rtype='TXT')
+        self.d2.save()
+        # inactive value
+        d3 = self._create_dnsrecord(name='w3.betfair.com')
+        d3.tags.add(self.tag_ext)
+        value = d3.dnsrecordvalue_set.create(rtype='LB')
+        # renamed
+        self.ip1.name = '1.1.1.2'
+        self.ip1.save()
+        expected = {
+            'HOSTS': ['w3.betfair.com'],
+            'HOSTSINT': [],
+            'IPS': ['1.1.1.2'],
+            'IPSINT': [],
+            'IPSHOSTSINT': [],
+        }
+        self.assertEqual(self.inputs(), expected)
+        self.assertEqual(self.legacy_inputs(), expected)
+
+        value.active = False
+        value.save()
+        self.tag_exc.delete()
+        self.tag_ext.name = 'was_external'
+        self.tag_ext.save()
+        expected = {
+            'HOSTS': [],
+            'HOSTSINT': [],
+            'IPS': [],
+            'IPSINT': ['10.0.0.1'],
+            'IPSHOSTSINT': ['10.0.0.1'],
+        }
+        self.assertEqual(self.inputs(), expected)
+        self.assertEqual(self.legacy_inputs(), expected)
+
+    def test_not_built(self):
+        models.ScanTargetBuild.objects.filter(kind=models.ScanTarget.Kinds.IP).delete()
+        # only the targets of the objects changed since deploy (signals), not used until a full refresh
+        models.ScanTarget.objects.filter(kind=models.ScanTarget.Kinds.IP).exclude(object_id=self.ip1.pk).delete()
+        self.assertEqual(self.inputs()['IPSINT'], ['10.0.0.1'])
+        self.assertEqual(self.inputs()['HOSTSINT'], ['w1.prd.betfair'])
+        models.ScanTarget.objects.filter(kind=models.ScanTarget.Kinds.HOST).delete()
+        self.assertEqual(self.inputs()['HOSTSINT'], [])
+
+        management.call_command('refresh_scan_targets', '--kind', 'ip')
+        self.assertTrue(models.ScanTarget.objects.built(models.ScanTarget.Kinds.IP))
+        self.assertEqual(self.inputs()['IPSINT'], ['10.0.0.1'])
+
+    def test_bulk_changed(self):
+        ip_models.IPAddress.objects.filter(pk=self.ip1.pk).update(name='1.1.1.2')
+        self.assertEqual(self.inputs()['IPS'], ['1.1.1.1'])
+        bulk_changed.send(sender=ip_models.IPAddress, pks=[self.ip1.pk])
+        self.assertEqual(self.inputs()['IPS'], ['1.1.1.2'])
+
+    def test_refresh_command(self):
+        expected = self.inputs()
+        # bulk changes, no signals
+        ip_models.IPAddress.objects.filter(pk=self.ip1.pk).update(name='1.1.1.2')
+        ip_models.DNSRecord.objects.filter(pk=self.d2.pk).delete()
+        models.ScanTarget.objects.all().delete()
+        models.ScanTarget.objects.create(kind='ip', object_id=999999, name='9.9.9.9', external=True)
+        self.assertEqual(self.inputs()['IPS'], ['9.9.9.9'])
+
+        management.call_command('refresh_scan_targets', '--batch-size', '1')
+        expected.update(IPS=['1.1.1.2'], HOSTSINT=[], IPSHOSTSINT=['10.0.0.1'])
+        self.assertEqual(self.inputs(), expected)
+        self.assertEqual(self.legacy_inputs(), expected)
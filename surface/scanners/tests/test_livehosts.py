@@ -1,7 +1,9 @@
+from django.core import management
 from django.test import TestCase
 
 from django.contrib.contenttypes import models as ct_models
 from dns_ips import models as dns_models
+from dns_ips.signals import bulk_changed
 from scanners import models
 
 
@@ -38,7 +40,12 @@ class Test(TestCase):
         with self.assertNumQueries(4):
             # without prefetch, 1 extra query for each record instead (3 livehosts = 3 extra queries)
             l = list(models.LiveHost.objects.all())
-            [str(ll) for ll in l]
+            [ll.host for ll in l]
+
+        with self.assertNumQueries(1):
+            # str() uses host_name, no need for host
+            livehosts = list(models.LiveHost.objects.all())
+            self.assertEqual(sorted(str(x) for x in livehosts), ['https://4.4.4.4', 'https://8.8.8.8', 'https://a.com'])
 
     def test_content_type_limit(self):
         # WTF!! only IPAddress and DNSRecord in limit_choices
@@ -142,3 +149,108 @@ class Test(TestCase):
 
         x = models.LiveHost.objects.filter(host__ip__name='a.com')
         self.assertEqual(x.count(), 0)
+
+    def test_host_fields(self):
+        ext = dns_models.Tag.objects.create(name='is_external')
+        third = dns_models.Tag.objects.create(name='is_third_party')
+        i1 = dns_models.IPAddress.objects.create(name='8.8.8.8')
+        d1 = dns_models.DNSRecord.objects.create(name='a.com')
+        d1.tags.add(ext)
+        lh1 = models.LiveHost.objects.create(host=i1)
+        lh2 = models.LiveHost.objects.create(host=d1)
+        lh3 = models.LiveHost.objects.create(host=d1, port=80)
+        self.assertEqual((lh1.host_name, lh1.host_external), ('8.8.8.8', False))
+        self.assertEqual((lh2.host_name, lh2.host_external, lh2.third_party), ('a.com', True, False))
+
+        # rename
+        d1.name = 'b.com'
+        d1.save()
+        self.assertEqual(set(models.LiveHost.objects.filter(host_name='b.com')), {lh2, lh3})
+        self.assertEqual(list(models.LiveHost.objects.filter(host__any__name='a.com')), [])
+
+        # tags, both sides of the relation
+        i1.tags.add(ext, third)
+        self.assertEqual(set(models.LiveHost.objects.filter(host_external=True)), {lh1, lh2, lh3})
+        self.assertEqual(list(models.LiveHost.objects.filter(third_party=True)), [lh1])
+        ext.dnsrecord_set.remove(d1)
+        self.assertEqual(list(models.LiveHost.objects.filter(host_external=True)), [lh1])
+        ext.ipaddress_set.clear()
+        self.assertFalse(models.LiveHost.objects.filter(host_external=True).exists())
+        third.ipaddress_set.add(i1)
+        i1.tags.clear()
+        self.assertFalse(models.LiveHost.objects.filter(third_party=True).exists())
+
+    def test_host_fields_lookups(self):
+        ext = dns_models.Tag.objects.create(name='is_external')
+        i1 = dns_models.IPAddress.objects.create(name='8.8.8.8')
+        d1 = dns_models.DNSRecord.objects.create(name='a.com')
+        d2 = dns_models.DNSRecord.objects.create(name='8.8.8.8')
+        d1.tags.add(ext)
+        i1.tags.add(ext)
+        lh1 = models.LiveHost.objects.create(host=i1)
+        lh2 = models.LiveHost.objects.create(host=d1)
+        lh3 = models.LiveHost.objects.create(host=d2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(models.LiveHost.objects.filter(host__any__name='8.8.8.8')), {lh1, lh3})
+        self.assertEqual(list(models.LiveHost.objects.filter(host__record__name='8.8.8.8')), [lh3])
+        self.assertEqual(list(models.LiveHost.objects.filter(host__any__name__startswith='a.')), [lh2])
+        self.assertEqual(set(models.LiveHost.objects.filter(host__any__name__in=['a.com', '8.8.8.8'])), {lh1, lh2, lh3})
+        self.assertEqual(set(models.LiveHost.objects.filter(host__any__tags__name='is_external')), {lh1, lh2})
+        self.assertEqual(list(models.LiveHost.objects.filter(host__ip__tags__name='is_external')), [lh1])
+        self.assertEqual(list(models.LiveHost.objects.exclude(host__any__tags__name='is_external')), [lh3])
+        # not copied, still a subquery
+        self.assertEqual(set(models.LiveHost.objects.filter(host__any__tags__name__startswith='is_ext')), {lh1, lh2})
+
+    def test_host_fields_deleted(self):
+        ext = dns_models.Tag.objects.create(name='is_external')
+        d1 = dns_models.DNSRecord.objects.create(name='gone.example.com')
+        i1 = dns_models.IPAddress.objects.create(name='8.8.8.8')
+        d1.tags.add(ext)
+        i1.tags.add(ext)
+        lh1 = models.LiveHost.objects.create(host=d1)
+        lh2 = models.LiveHost.objects.create(host=i1)
+
+        d1.delete()
+        self.assertFalse(models.LiveHost.objects.filter(host__any__name='gone.example.com').exists())
+        self.assertEqual(list(models.LiveHost.objects.filter(host__any__tags__name='is_external')), [lh2])
+        lh1.refresh_from_db()
+        self.assertEqual((lh1.host_name, lh1.host_external), (None, False))
+
+        # renamed flag tag
+        ext.name = 'was_external'
+        ext.save()
+        self.assertFalse(models.LiveHost.objects.filter(host__any__tags__name='is_external').exists())
+        ext.name = 'is_external'
+        ext.save()
+        self.assertEqual(list(models.LiveHost.objects.filter(host__any__tags__name='is_external')), [lh2])
+
+        # deleted flag tag
+        ext.delete()
+        self.assertFalse(models.LiveHost.objects.filter(host__any__tags__name='is_external').exists())
+
+    def test_host_fields_bulk_changed(self):
+        i1 = dns_models.IPAddress.objects.create(name='8.8.8.8')
+        lh1 = models.LiveHost.objects.create(host=i1)
+        # bulk import/sweep, then the signal
+        dns_models.IPAddress.objects.filter(pk=i1.pk).update(name='8.8.4.4')
+        bulk_changed.send(sender=dns_models.IPAddress, pks=[i1.pk])
+        self.assertEqual(list(models.LiveHost.objects.filter(host__any__name='8.8.4.4')), [lh1])
+        dns_models.IPAddress.objects.filter(pk=i1.pk).delete()
+        bulk_changed.send(sender=dns_models.IPAddress, pks=[i1.pk])
+        self.assertFalse(models.LiveHost.objects.filter(host__any__name='8.8.4.4').exists())
+
+    def test_sync_command(self):
+        ext = dns_models.Tag.objects.create(name='is_external')
+        i1 = dns_models.IPAddress.objects.create(name='8.8.8.8')
+        d1 = dns_models.DNSRecord.objects.create(name='a.com')
+        lh1 = models.LiveHost.objects.create(host=i1)
+        lh2 = models.LiveHost.objects.create(host=d1)
+        # bulk changes, no signals
+        dns_models.DNSRecord.objects.filter(pk=d1.pk).update(name='b.com')
+        dns_models.IPAddress.tags.through.objects.create(ipaddress=i1, tag=ext)
+        management.call_command('sync_livehost_hosts', '--batch-size', '1')
+        lh1.refresh_from_db()
+        lh2.refresh_from_db()
+        self.assertEqual((lh1.host_name, lh1.host_external), ('8.8.8.8', True))
+        self.assertEqual((lh2.host_name, lh2.host_external), ('b.com', False))
@@ -0,0 +1,353 @@
+import asyncio
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.core import management
+from django.test import TestCase, override_settings
+from docker.errors import APIError, ImageNotFound
+
+from scanners import models, utils
+from scanners.tests import ScannerTestMixin
+
+
+@mock.patch('scanners.utils._docker.OurDockerClient')
+class TestDockerClientRegistry(TestCase):
+    def setUp(self):
+        self.registry = utils.DockerClientRegistry()
+
+    def test_cached(self, client_mock):
+        c1 = self.registry.get('1.1.1.1', 80, use_tls=False)
+        c2 = self.registry.get('1.1.1.1', '80', use_tls=False)
+        c3 = self.registry.get('1.1.1.1', 81, use_tls=False)
+        self.assertIs(c1, c2)
+        self.assertEqual(client_mock.call_count, 2)
+        self.assertEqual(c3, client_mock.return_value)
+        self.assertEqual(
+            self.registry.stats(), {'hits': 1, 'creations': 2, 'failures': 0, 'evictions': 0, 'clients': 2}
+        )
+
+    @override_settings(SCANNERS_DOCKER_CLIENT_HEALTH_CHECK=-1)
+    def test_health_check(self, client_mock):
+        c1 = self.registry.get('1.1.1.1', 80, use_tls=False)
+        self.registry.get('1.1.1.1', 80, use_tls=False)
+        c1.ping.assert_called_once_with()
+
+        c1.ping.side_effect = Exception('dead')
+        self.registry.get('1.1.1.1', 80, use_tls=False)
+        self.assertEqual(client_mock.call_count, 2)
+        self.assertEqual(
+            self.registry.stats(), {'hits': 1, 'creations': 2, 'failures': 1, 'evictions': 1, 'clients': 1}
+        )
+
+    @override_settings(SCANNERS_DOCKER_CLIENT_IDLE_TIMEOUT=-1)
+    def test_idle(self, client_mock):
+        self.registry.get('1.1.1.1', 80, use_tls=False)
+        self.registry.get('2.2.2.2', 80, use_tls=False)
+        self.assertEqual(
+            self.registry.stats(), {'hits': 0, 'creations': 2, 'failures': 0, 'evictions': 1, 'clients': 1}
+        )
+
+
+class TestLogCollector(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.scan_log = models.ScanLog.objects.create(name='1-wtv-12345')
+
+    def test_follow(self):
+        container = mock.MagicMock()
+        container.logs.return_value = iter(
+            [
+                b'2021-05-24T14:55:51.000000001Z line 1\n2021-05-24T14:55:52.000000001Z li',
+                b'ne 2\n',
+                b'invalid\n2021-05-24T14:55:53.000000001Z line 3',
+            ]
+        )
+        echoed = []
+        collector = utils.LogCollector(echo=lambda *a: echoed.append(a))
+        with self.assertLogs(logger='scanners.utils._logs', level='ERROR') as cm:
+            self.assertTrue(collector.follow(container, self.scan_log))
+            collector.wait(self.scan_log)
+        self.assertEqual(cm.output, ["ERROR:scanners.utils._logs:invalid time string: b'invalid'"])
+        container.logs.assert_called_once_with(stream=True, follow=True, timestamps=True, since=None)
+        self.assertEqual(
+            [x.line for x in self.scan_log.iter_output()],
+            ['line 1', 'line 2', 'line 3'],
+        )
+        self.assertEqual([x[2] for x in echoed], ['line 1', 'line 2', 'line 3'])
+
+        # resumes from last stored line
+        container.logs.return_value = iter([])
+        collector.follow(container, self.scan_log)
+        collector.wait(self.scan_log)
+        self.assertEqual(
+            container.logs.call_args[1]['since'],
+            datetime(2021, 5, 24, 14, 55, 53, 1, tzinfo=timezone.utc),
+        )
+
+    def test_due(self):
+        collector = utils.LogCollector(batch_size=2, flush_interval=60)
+        self.assertFalse(collector.due())
+        collector._add(self.scan_log, [b'2021-05-24T14:55:51.000000001Z line 1'])
+        self.assertFalse(collector.due())
+        collector._add(self.scan_log, [b'2021-05-24T14:55:52.000000001Z line 2'])
+        self.assertTrue(collector.due())
+        self.assertEqual(collector.flush(), 2)
+        self.assertFalse(collector.due())
+        self.assertEqual(len(list(self.scan_log.iter_output())), 2)
+
+
+class TestHostIndex(ScannerTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.record = self._create_dnsrecord(name='www.example.com')
+        # duplicated record, first one wins
+        self._create_dnsrecord(name='www.example.com')
+        self.ip = self._create_ipaddress(name='1.1.1.1')
+        self.expected = {
+            'www.example.com': (ContentType.objects.get_for_model(self.record).pk, self.record.pk),
+            '1.1.1.1': (ContentType.objects.get_for_model(self.ip).pk, self.ip.pk),
+        }
+
+    def test_lazy(self):
+        index = utils.HostIndex()
+        self.assertEqual(index.resolve(['www.example.com', '1.1.1.1', 'missing.example.com']), self.expected)
+        # cached, including the misses
+        with self.assertNumQueries(0):
+            self.assertEqual(index.get('missing.example.com'), None)
+            self.assertEqual(index.get('1.1.1.1'), self.expected['1.1.1.1'])
+        stats = index.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses']), (2, 3, 2))
+        self.assertEqual(stats['hit_rate'], 0.6)
+
+    def test_load(self):
+        for compact_size in (100, 0):
+            index = utils.HostIndex(compact_size=compact_size).load()
+            with self.assertNumQueries(0):
+                self.assertEqual(index.resolve(['www.example.com', '1.1.1.1', 'missing.example.com']), self.expected)
+            self.assertEqual(index.stats()['compact'], compact_size == 0)
+            self.assertEqual(len(index), 2)
+            self.assertGreater(index.memory_usage(), 0)
+
+
+class TestScanOutputSegment(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.scan_log = models.ScanLog.objects.create(name='1-wtv-12345')
+        self.base = datetime(2021, 5, 24, 14, 55, 51, 1, tzinfo=timezone.utc)
+
+    def _lines(self, start, end):
+        return [(self.base + timedelta(seconds=i), f'line {i}') for i in range(start, end)]
+
+    @override_settings(SCANNERS_OUTPUT_SEGMENT_LINES=3, SCANNERS_OUTPUT_SEGMENT_SECONDS=60)
+    def test_append(self):
+        models.ScanOutputSegment.objects.append(self.scan_log, self._lines(0, 2))
+        # appended to the open segment
+        models.ScanOutputSegment.objects.append(self.scan_log, self._lines(2, 5))
+        self.assertEqual(
+            list(self.scan_log.output_segments.order_by('pk').values_list('lines', flat=True)),
+            [3, 2],
+        )
+        # time limit starts a new segment
+        models.ScanOutputSegment.objects.append(self.scan_log, [(self.base + timedelta(seconds=100), 'late')])
+        self.assertEqual(self.scan_log.output_segments.count(), 3)
+
+        self.assertEqual([x.line for x in self.scan_log.iter_output()], [f'line {i}' for i in range(5)] + ['late'])
+        self.assertEqual(
+            [x.line for x in self.scan_log.iter_output(since=self.base + timedelta(seconds=3))], ['line 4', 'late']
+        )
+        self.assertEqual([x.line for x in self.scan_log.tail_output(3)], ['late', 'line 4', 'line 3'])
+        self.assertEqual(self.scan_log.last_output_timestamp(), self.base + timedelta(seconds=100))
+        self.assertEqual(self.scan_log.iter_output().__next__().timestamp, self.base)
+
+    @override_settings(SCANNERS_OUTPUT_SEGMENT_LINES=2)
+    def test_convert(self):
+        models.ScanOutput.objects.bulk_create(
+            [models.ScanOutput(log=self.scan_log, timestamp=ts, line=text) for ts, text in self._lines(0, 5)]
+        )
+        self.assertEqual([x.line for x in self.scan_log.tail_output(2)], ['line 4', 'line 3'])
+        out = StringIO()
+        management.call_command('convert_scan_output', stdout=out)
+        self.assertEqual(out.getvalue(), 'Converted 5 lines into 3 segments\n')
+        self.assertEqual(self.scan_log.output_lines.count(), 0)
+        self.assertEqual([x.line for x in self.scan_log.iter_output()], [f'line {i}' for i in range(5)])
+
+
+class TestOutputBroadcaster(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.scan_log = models.ScanLog.objects.create(name='1-wtv-12345', state=models.ScanLog.States.RUNNING)
+        self.base = datetime(2021, 5, 24, 14, 55, 51, 1, tzinfo=timezone.utc)
+        models.ScanOutputSegment.objects.append(self.scan_log, [(self.base, 'line 0')])
+
+    async def _collect(self, broadcaster, events, cursor=None):
+        async for event in broadcaster.subscribe(self.scan_log, cursor=cursor):
+            events.append(event)
+
+    async def test_fan_out(self):
+        broadcaster = utils.OutputBroadcaster(interval=0.01)
+        first, second = [], []
+        tasks = [
+            asyncio.ensure_future(self._collect(broadcaster, first)),
+            asyncio.ensure_future(self._collect(broadcaster, second, cursor=self.base)),
+        ]
+        await asyncio.sleep(0.05)
+        # both on the same channel
+        self.assertEqual(broadcaster.stats(), {self.scan_log.pk: 2})
+
+        def _write():
+            models.ScanOutputSegment.objects.append(self.scan_log, [(self.base + timedelta(seconds=1), 'line 1')])
+            models.ScanLog.objects.filter(pk=self.scan_log.pk).update(state=models.ScanLog.States.EXITED)
+
+        await sync_to_async(_write)()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+        self.assertEqual([x[1].line for x in first if x[0] == 'line'], ['line 0', 'line 1'])
+        self.assertEqual([x[1].line for x in second if x[0] == 'line'], ['line 1'])
+        self.assertEqual(first[-2:], [('state', 'Exited'), ('end', 'Exited')])
+        self.assertEqual(broadcaster.stats(), {})
+
+
+class TestFleetSnapshot(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.setUpScanner()
+        self.box2 = models.Rootbox.objects.create(name='testvm2', ip='1.1.1.2', location='local')
+
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    def test_cached(self, check_mock):
+        check_mock.side_effect = lambda box: [self._container(f'scanner-test-1-docker_image-{box.name}')]
+        out = utils.check_scanners()
+        self.assertEqual([x.name for x in out], ['testvm', 'testvm2'])
+        self.assertEqual(
+            [x.containers[0]['name'] for x in out],
+            ['scanner-test-1-docker_image-testvm', 'scanner-test-1-docker_image-testvm2'],
+        )
+        self.assertEqual(out[0].containers[0]['state'], 'running')
+        self.assertIsNone(out[0].error)
+        self.assertEqual(check_mock.call_count, 2)
+
+        # stored, shared with other processes
+        self.assertEqual(models.FleetSnapshot.objects.count(), 2)
+        check_mock.reset_mock()
+        self.assertEqual(utils.check_scanners(['testvm2']), out[1:])
+        check_mock.assert_not_called()
+
+        # fresh
+        self.assertEqual(utils.check_scanners(['testvm2'], max_age=0)[0].containers, out[1].containers)
+        check_mock.assert_called_once_with(self.box2)
+
+    @mock.patch('scanners.utils.check_scanners_in_box')
+    def test_partial(self, check_mock):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def _check(box):
+            if box == self.rootbox:
+                raise Exception('connection refused')
+            if box == self.box2:
+                # dead rootbox
+                release.wait(5)
+            return []
+
+        check_mock.side_effect = _check
+        box3 = models.Rootbox.objects.create(name='testvm3', ip='1.1.1.3', location='local')
+        with override_settings(SCANNERS_FLEET_CHECK_TIMEOUT=0.2):
+            out = utils.check_scanners()
+        self.assertEqual([x.name for x in out], ['testvm', 'testvm2', 'testvm3'])
+        self.assertEqual(out[0].error, 'connection refused')
+        self.assertEqual(out[1].error, 'timed out after 0.2 seconds')
+        # still running, does not block the interpreter exit
+        self.assertTrue([t for t in threading.enumerate() if t.name == 'fleet-testvm2' and t.daemon])
+        self.assertIsNone(out[2].error)
+        self.assertEqual(check_mock.call_count, 3)
+        # failures are stored too
+        self.assertEqual(utils.check_scanners([box3, self.box2]), [out[2], out[1]])
+        self.assertEqual(check_mock.call_count, 3)
+
+
+class TestEnsureImage(ScannerTestMixin, TestCase):
+    def setUp(self):
+        self.setUpScanner()
+        self.client = mock.MagicMock()
+        self.client.images.get_registry_data.return_value.id = 'sha256:abc'
+
+    def test_current(self):
+        self.client.images.get.return_value.attrs = {'RepoDigests': ['registry.com/test/docker_image@sha256:abc']}
+        self.assertEqual(utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image'), 'current')
+        self.client.images.get_registry_data.assert_called_once_with('registry.com/test/docker_image:latest')
+        self.client.images.pull.assert_not_called()
+        # checked recently
+        self.client.images.get_registry_data.reset_mock()
+        self.assertEqual(utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image'), 'cached')
+        self.client.images.get_registry_data.assert_not_called()
+        # other tag is not
+        self.assertEqual(
+            utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image', tag='v2'), 'current'
+        )
+
+    def test_pulled(self):
+        self.client.images.get.return_value.attrs = {'RepoDigests': ['registry.com/test/docker_image@sha256:old']}
+        self.assertEqual(utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image'), 'pulled')
+        self.client.images.pull.assert_called_once_with('registry.com/test/docker_image', 'latest')
+
+        # not there yet
+        self.client.images.pull.reset_mock()
+        self.client.images.get.side_effect = ImageNotFound('nope')
+        self.assertEqual(
+            utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image', ttl=0), 'pulled'
+        )
+        self.client.images.pull.assert_called_once_with('registry.com/test/docker_image', 'latest')
+        self.assertEqual(
+            utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image', ttl=0), 'pulled'
+        )
+
+    def test_no_digest(self):
+        self.client.images.get_registry_data.side_effect = APIError('not supported')
+        self.assertEqual(utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image'), 'pulled')
+        self.client.images.pull.assert_called_once_with('registry.com/test/docker_image', 'latest')
+        self.client.images.get.assert_not_called()
+
+        # pull errors are raised
+        self.client.images.pull.side_effect = APIError('registry down')
+        with self.assertRaises(APIError):
+            utils.ensure_image(self.client, self.rootbox, 'registry.com/test/docker_image', tag='v2')
+
+
+class TestInputSnapshot(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_private(self):
+        with override_settings(SCANNERS_INPUT_SNAPSHOT_DIR=self.tmp.name):
+            snapshot = utils.input_snapshot('IPS', lambda: iter(['1.1.1.1', '2.2.2.2']))
+        with snapshot:
+            self.assertEqual(list(snapshot), [b'1.1.1.1\n', b'2.2.2.2\n'])
+            self.assertEqual(snapshot.count, 2)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_shared(self):
+        generate = mock.Mock(side_effect=[['1.1.1.1'], ['1.1.1.1'], ['2.2.2.2']])
+        with override_settings(SCANNERS_INPUT_SNAPSHOT_DIR=self.tmp.name, SCANNERS_INPUT_SNAPSHOT_TTL=60):
+            with utils.input_snapshot('IPS', generate) as first:
+                pass
+            # re-used within TTL
+            with utils.input_snapshot('IPS', generate) as second:
+                self.assertEqual(list(second), [b'1.1.1.1\n'])
+            self.assertEqual(generate.call_count, 1)
+            self.assertEqual(first.digest, second.digest)
+            self.assertTrue(os.path.exists(second.path))
+
+            # expired, same content gets the same digest
+            with utils.input_snapshot('IPS', generate, ttl=-1) as third:
+                self.assertEqual(third.digest, first.digest)
+            # old file replaced
+            with utils.input_snapshot('IPS', generate, ttl=-1) as fourth:
+                self.assertEqual(list(fourth), [b'2.2.2.2\n'])
+            self.assertNotEqual(fourth.digest, first.digest)
+            self.assertFalse(os.path.exists(first.path))
+            # different params, different snapshot
+            with utils.input_snapshot('IPS', lambda: [], params={'x': 1}) as other:
+                self.assertEqual(other.count, 0)
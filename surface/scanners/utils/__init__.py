@@ -1,13 +1,29 @@
 import base64
+import logging
 import os
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
 import docker
 
 from django.conf import settings
 from django.db.models.query import QuerySet
+from django.utils import timezone
 
 from . import _docker
+from ._archive import IterStream, TarGzStream, byte_range, gzip_chunks  # noqa: F401
+from ._hosts import HostIndex  # noqa: F401
+from ._images import ensure_image  # noqa: F401
+from ._logs import LogCollector, last_log_cursor, parse_log_line  # noqa: F401
+from ._snapshots import INPUT_HASH_LABEL, InputSnapshot, input_snapshot  # noqa: F401
+from ._tail import OutputBroadcaster, output_broadcaster  # noqa: F401
 from scanners import models
 
+logger = logging.getLogger(__name__)
+
 
 def settings_to_file(b64content, filepath, mode=0o600):
     if b64content is None or not filepath:
@@ -20,7 +36,26 @@ def settings_to_file(b64content, filepath, mode=0o600):
     return False
 
 
-def get_docker_client(ip, port=80, use_tls=True):
+# shard index is appended to the run name (container name timestamp) with a dot
+# the run name itself never has a dot followed only by digits at the end
+SHARD_RE = re.compile(r'^(.*)\.(\d+)$')
+
+
+def shard_name(name, index):
+    return f'{name}.{index}'
+
+
+def split_shard(name):
+    """
+    :return: tuple with run name and shard index (None if `name` is not a shard)
+    """
+    m = SHARD_RE.match(name)
+    if m is None:
+        return name, None
+    return m.group(1), int(m.group(2))
+
+
+def new_docker_client(ip, port=80, use_tls=True):
     if use_tls:
         settings_to_file(settings.SCANNERS_DOCKER_CA_CERT, settings.SCANNERS_DOCKER_CA_CERT_PATH)
         settings_to_file(settings.SCANNERS_DOCKER_CLIENT_KEY, settings.SCANNERS_DOCKER_CLIENT_KEY_PATH)
@@ -42,6 +77,89 @@ def get_docker_client(ip, port=80, use_tls=True):
     return client
 
 
+class DockerClientRegistry:
+    """
+    process-wide cache of docker clients, keyed by (ip, port, tls)
+    re-using the client keeps its HTTP connection pool (keep-alive) and skips the TLS files check
+
+    clients re-used after SCANNERS_DOCKER_CLIENT_HEALTH_CHECK seconds are pinged first (and re-created if that fails)
+    clients not used for SCANNERS_DOCKER_CLIENT_IDLE_TIMEOUT seconds are evicted
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key => [client, last_used, last_checked]
+        self._clients = {}
+        self._stats = {'hits': 0, 'creations': 0, 'failures': 0, 'evictions': 0}
+
+    def _evict(self, key):
+        # not closed explicitly as it might still be in use by another thread (such as a long download)
+        # connection pool is closed once the client is garbage collected
+        self._clients.pop(key)
+        self._stats['evictions'] += 1
+
+    def _evict_idle(self, now):
+        for key, (_, last_used, _) in list(self._clients.items()):
+            if now - last_used > settings.SCANNERS_DOCKER_CLIENT_IDLE_TIMEOUT:
+                self._evict(key)
+
+    def get(self, ip, port=80, use_tls=True):
+        key = (ip, int(port), bool(use_tls))
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._clients.get(key)
+
+        if entry is not None:
+            if now - entry[2] > settings.SCANNERS_DOCKER_CLIENT_HEALTH_CHECK:
+                try:
+                    entry[0].ping()
+                    entry[2] = now
+                except Exception:
+                    with self._lock:
+                        self._stats['failures'] += 1
+                        if self._clients.get(key) is entry:
+                            self._evict(key)
+                    entry = None
+            if entry is not None:
+                with self._lock:
+                    self._stats['hits'] += 1
+                    entry[1] = now
+                return entry[0]
+
+        try:
+            client = new_docker_client(ip, port=port, use_tls=use_tls)
+        except Exception:
+            with self._lock:
+                self._stats['failures'] += 1
+            raise
+        with self._lock:
+            self._stats['creations'] += 1
+            entry = self._clients.get(key)
+            if entry is not None:
+                # another thread got here first, keep that one
+                entry[1] = now
+                return entry[0]
+            self._clients[key] = [client, now, now]
+        return client
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'clients': len(self._clients)}
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._clients):
+                self._evict(key)
+
+
+docker_clients = DockerClientRegistry()
+
+
+def get_docker_client(ip, port=80, use_tls=True):
+    return docker_clients.get(ip, port=port, use_tls=use_tls)
+
+
 def check_scanners_in_box(box, all=False, sparse=True):
     client = get_docker_client(box.ip, port=box.dockerd_port, use_tls=box.dockerd_tls)
     for c in client.containers.list(sparse=sparse, all=all):
@@ -49,10 +167,100 @@ def check_scanners_in_box(box, all=False, sparse=True):
         yield name, c
 
 
-def check_scanners(rootboxes=None):
+FleetBox = namedtuple('FleetBox', 'name containers error checked_at')
+
+
+def _container_info(c_name, c):
+    return {
+        'id': c.short_id,
+        'name': c_name,
+        'image': c.attrs.get('Image'),
+        'created_at': c.attrs.get('Created'),
+        'status': c.attrs.get('Status'),
+        'state': c.status,
+    }
+
+
+def _check_box(box):
+    return [_container_info(c_name, c) for c_name, c in check_scanners_in_box(box)]
+
+
+def fleet_snapshot(rootboxes, max_age=None, timeout=None):
+    """
+    running containers in each rootbox, checked concurrently
+
+    results (including failures) are stored (FleetSnapshot) and re-used for SCANNERS_FLEET_SNAPSHOT_TTL seconds
+    so admin, slack and run_scanners_continuously share them instead of each one running "docker ps"
+
+    :param rootboxes: Rootbox list (or queryset)
+    :param max_age: re-check rootboxes with stored results older than this (seconds), 0 to always check
+    :param timeout: seconds to wait for the rootboxes (default is SCANNERS_FLEET_CHECK_TIMEOUT),
+                    the ones not done by then are reported with an error (partial results)
+    :return: list of FleetBox, in the same order as `rootboxes`
+    """
+    boxes = list(rootboxes)
+    if max_age is None:
+        max_age = settings.SCANNERS_FLEET_SNAPSHOT_TTL
+    if timeout is None:
+        timeout = settings.SCANNERS_FLEET_CHECK_TIMEOUT
+
+    stored = {}
+    if max_age:
+        since = timezone.now() - timedelta(seconds=max_age)
+        stored = models.FleetSnapshot.objects.filter(rootbox__in=[box.pk for box in boxes], checked_at__gte=since)
+        stored = {x.rootbox_id: x for x in stored}
+    result = {}
+    stale = []
+    for box in boxes:
+        entry = stored.get(box.pk)
+        if entry is not None:
+            result[box.pk] = FleetBox(box.name, entry.containers, entry.error, entry.checked_at)
+        else:
+            stale.append(box)
+
+    if stale:
+        # box pk => (containers, exception)
+        checked = {}
+
+        def _run(box):
+            try:
+                checked[box.pk] = (_check_box(box), None)
+            except Exception as e:
+                checked[box.pk] = (None, e)
+
+        # daemon threads: the ones still running (dead rootboxes) are not waited for, not even at exit
+        threads = [threading.Thread(target=_run, args=(box,), name=f'fleet-{box.name}', daemon=True) for box in stale]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        done = dict(checked)
+        checked_at = timezone.now()
+        for box in stale:
+            if box.pk in done:
+                containers, error = done[box.pk]
+                if error is None:
+                    entry = FleetBox(box.name, containers, None, checked_at)
+                else:
+                    logger.warning('failed checking %s: %s', box.name, error)
+                    entry = FleetBox(box.name, [], str(error) or error.__class__.__name__, checked_at)
+            else:
+                logger.warning('timed out checking %s', box.name)
+                entry = FleetBox(box.name, [], f'timed out after {timeout} seconds', checked_at)
+            result[box.pk] = entry
+            models.FleetSnapshot.objects.update_or_create(
+                rootbox=box, defaults={'containers': entry.containers, 'error': entry.error, 'checked_at': checked_at}
+            )
+
+    return [result[box.pk] for box in boxes]
+
+
+def check_scanners(rootboxes=None, max_age=None):
     """
     :param rootboxes: show scanners only for the rootboxes in this list. Default is every rootbox.
-    :return: tuple with box name and running scanner list
+    :param max_age: see `fleet_snapshot`
+    :return: list of FleetBox (box name, running scanner list, error and when it was checked)
     """
     if isinstance(rootboxes, QuerySet):
         boxes = rootboxes
@@ -65,21 +273,4 @@ def check_scanners(rootboxes=None):
             else:
                 boxes = boxes.filter(name__in=rootboxes)
 
-    out = []
-
-    for box in boxes:
-        cs = []
-        for c_name, c in check_scanners_in_box(box):
-            cs.append(
-                {
-                    'id': c.short_id,
-                    'name': c_name,
-                    'image': c.attrs.get('Image'),
-                    'created_at': c.attrs.get('Created'),
-                    'status': c.attrs.get('Status'),
-                    'state': c.status,
-                }
-            )
-        out.append((box.name, cs))
-
-    return out
+    return fleet_snapshot(boxes, max_age=max_age)
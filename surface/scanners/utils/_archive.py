@@ -0,0 +1,123 @@
+import io
+import tarfile
+import time
+import zlib
+
+
+class TarGzStream:
+    """
+    iterable that produces a gzipped tarball in chunks, without writing the tarball to disk
+    meant to be passed directly to `Container.put_archive` (requests will use chunked transfer encoding)
+
+    tar headers require the file size upfront, so each file object must be seekable (such as
+    the SpooledTemporaryFile used by run_scanner)
+    """
+
+    def __init__(self, files, chunk_size=64 * 1024, compresslevel=6):
+        """
+        :param files: dict of {arcname: fileobj}
+        :param chunk_size: size of each read from the file objects
+        :param compresslevel: gzip compression level
+        """
+        self.files = files
+        self.chunk_size = chunk_size
+        self.compresslevel = compresslevel
+        # stats, updated as the stream is consumed
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self.elapsed = 0
+
+    def _tar_chunks(self):
+        mtime = int(time.time())
+        for arcname, fileobj in self.files.items():
+            size = fileobj.seek(0, 2)
+            fileobj.seek(0)
+            info = tarfile.TarInfo(name=arcname)
+            info.size = size
+            info.mtime = mtime
+            yield info.tobuf(format=tarfile.GNU_FORMAT)
+            while True:
+                data = fileobj.read(self.chunk_size)
+                if not data:
+                    break
+                self.bytes_read += len(data)
+                yield data
+            _, remainder = divmod(size, tarfile.BLOCKSIZE)
+            if remainder:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - remainder)
+        # end-of-archive marker, padded to a full record (same as tarfile.TarFile.close)
+        yield tarfile.NUL * tarfile.RECORDSIZE
+
+    def __iter__(self):
+        started = time.monotonic()
+        # wbits=31 (16 + MAX_WBITS) for gzip header and trailer
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+        for data in self._tar_chunks():
+            out = compressor.compress(data)
+            if out:
+                self.bytes_sent += len(out)
+                yield out
+        out = compressor.flush()
+        self.bytes_sent += len(out)
+        self.elapsed = time.monotonic() - started
+        yield out
+
+
+class IterStream(io.RawIOBase):
+    """
+    read-only file object over an iterable of bytes chunks (such as the stream from `Container.get_archive`)
+    so it can be used with tarfile stream mode (`r|`) without saving the tarball to disk first
+    """
+
+    def __init__(self, iterable):
+        self._iter = iter(iterable)
+        self._buf = b''
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._iter)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        self.bytes_read += n
+        return n
+
+
+def gzip_chunks(chunks, compresslevel=6):
+    """
+    gzip compress an iterable of bytes, chunk by chunk
+
+    output only depends on the input (no timestamp or file name in the gzip header),
+    so the same content always produces the same bytes (such as for Range requests)
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 31)
+    for data in chunks:
+        out = compressor.compress(data)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def byte_range(chunks, start, end=None):
+    """
+    bytes `start` to `end` (included) of an iterable of bytes
+    """
+    pos = 0
+    for data in chunks:
+        size = len(data)
+        if pos + size > start:
+            data = data[max(start - pos, 0) :]
+            if end is not None:
+                data = data[: end + 1 - max(start, pos)]
+            if data:
+                yield data
+        pos += size
+        if end is not None and pos > end:
+            return
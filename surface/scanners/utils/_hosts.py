@@ -0,0 +1,156 @@
+import sys
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+
+
+class HostIndex:
+    """
+    hostname => (content_type_id, object_id) of the DNSRecord or IPAddress with that name,
+    meant to be built once per parse run instead of querying every result file
+
+    DNSRecord takes precedence over IPAddress and, for duplicated names, the lowest pk is used
+    (same as `DNSRecord.objects.filter(name=hostname).first()`)
+
+    without `load()` names are resolved (in bulk) when requested and cached.
+    `load()` preloads the whole inventory: a dict, or sorted name list with pk/content type arrays
+    if there are more than SCANNERS_HOST_INDEX_COMPACT_SIZE names (lookups with bisect, fraction of the memory)
+    """
+
+    # resolution order, first model with the name wins
+    MODELS = ('dns_ips.DNSRecord', 'dns_ips.IPAddress')
+
+    def __init__(self, compact_size=None):
+        self.compact_size = settings.SCANNERS_HOST_INDEX_COMPACT_SIZE if compact_size is None else compact_size
+        self.loaded = False
+        # name => (content_type_id, object_id), None for names known not to exist (lazy mode)
+        self._map = {}
+        # compact mode
+        self._names = None
+        self._pks = None
+        self._cts = None
+        self._ct_ids = []
+        self.hits = 0
+        self.misses = 0
+
+    def _models(self):
+        from django.apps import apps
+
+        return [apps.get_model(x) for x in self.MODELS]
+
+    def _query(self, model, names=None):
+        qs = model.objects.exclude(name=None)
+        if names is not None:
+            qs = qs.filter(name__in=names)
+        # highest pk first so the lowest ends up in the index
+        return qs.order_by('-pk').values_list('name', 'pk').iterator(chunk_size=10000)
+
+    def load(self):
+        """
+        preload every name
+        """
+        entries = {}
+        # reversed so the first model overwrites the others
+        for model in reversed(self._models()):
+            ct = ContentType.objects.get_for_model(model).pk
+            for name, pk in self._query(model):
+                entries[name] = (ct, pk)
+
+        self._map = {}
+        self._names = self._pks = self._cts = None
+        if len(entries) > self.compact_size:
+            self._ct_ids = sorted({v[0] for v in entries.values()})
+            ct_index = {ct: i for i, ct in enumerate(self._ct_ids)}
+            self._names = sorted(entries)
+            self._pks = array('Q', (entries[x][1] for x in self._names))
+            self._cts = array('B', (ct_index[entries[x][0]] for x in self._names))
+        else:
+            self._map = entries
+        self.loaded = True
+        return self
+
+    def _get(self, name):
+        if self._names is None:
+            return self._map.get(name)
+        i = bisect_left(self._names, name)
+        if i < len(self._names) and self._names[i] == name:
+            return self._ct_ids[self._cts[i]], self._pks[i]
+        return None
+
+    def _fetch(self, names):
+        from scanners.models import LiveHostQS
+
+        missing = set(names)
+        for model in self._models():
+            query_names = missing
+            if model._meta.label == 'dns_ips.IPAddress':
+                # do not query IP field with hostnames (invalid input on some backends)
+                query_names = {x for x in missing if LiveHostQS.valid_ip(x)}
+            if not query_names:
+                continue
+            ct = ContentType.objects.get_for_model(model).pk
+            found = {}
+            for name, pk in self._query(model, names=query_names):
+                found[name] = (ct, pk)
+            self._map.update(found)
+            missing.difference_update(found)
+        for name in missing:
+            self._map[name] = None
+
+    def resolve(self, names):
+        """
+        :return: dict of {name: (content_type_id, object_id)} for the names in `names` that exist
+        """
+        names = set(names)
+        if not self.loaded:
+            new = [x for x in names if x not in self._map]
+            if new:
+                self._fetch(new)
+        res = {}
+        for name in names:
+            v = self._get(name)
+            if v is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                res[name] = v
+        return res
+
+    def get(self, name):
+        """
+        :return: (content_type_id, object_id) or None
+        """
+        return self.resolve([name]).get(name)
+
+    def memory_usage(self):
+        """
+        approximate memory used by the index (bytes)
+        """
+        if self._names is not None:
+            return (
+                sys.getsizeof(self._names)
+                + sum(sys.getsizeof(x) for x in self._names)
+                + sys.getsizeof(self._pks)
+                + sys.getsizeof(self._cts)
+            )
+        return sys.getsizeof(self._map) + sum(
+            sys.getsizeof(k) + (sys.getsizeof(v) if v is not None else 0) for k, v in self._map.items()
+        )
+
+    def __len__(self):
+        if self._names is not None:
+            return len(self._names)
+        return sum(1 for v in self._map.values() if v is not None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'compact': self._names is not None,
+            'memory': self.memory_usage(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,75 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from docker.errors import APIError, ImageNotFound
+
+logger = logging.getLogger(__name__)
+
+# image is up to date, image was pulled
+CURRENT = 'current'
+PULLED = 'pulled'
+# not checked, verified less than SCANNERS_IMAGE_DIGEST_TTL seconds ago
+CACHED = 'cached'
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock(key):
+    with _locks_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _cache_key(box, image, tag):
+    return f'scanners:image:{box.ip}:{box.dockerd_port}:{image}:{tag}'
+
+
+def _local_digests(client, ref):
+    """
+    :return: set of manifest digests of local image `ref` (RepoDigests without the repository)
+    """
+    try:
+        repo_digests = client.images.get(ref).attrs.get('RepoDigests') or []
+    except ImageNotFound:
+        return set()
+    return {x.rpartition('@')[2] for x in repo_digests}
+
+
+def ensure_image(client, box, image, tag='latest', ttl=None):
+    """
+    make sure `box` has the latest `image:tag`, pulling it only if the registry digest changed
+
+    the remote manifest digest (`get_registry_data`, no layers downloaded) is compared to the local RepoDigests.
+    Once verified, `box` is not checked again for SCANNERS_IMAGE_DIGEST_TTL seconds (django cache).
+    That is only shared by every process with a shared CACHES backend, with the default (local memory)
+    each process checks on its own, and the lock below only serializes checks within a process.
+
+    :param client: docker client for `box`
+    :param ttl: override SCANNERS_IMAGE_DIGEST_TTL, 0 to always check
+    :return: CACHED, CURRENT or PULLED
+    """
+    if ttl is None:
+        ttl = settings.SCANNERS_IMAGE_DIGEST_TTL
+    key = _cache_key(box, image, tag)
+    # same image in the same rootbox, one at a time (such as prewarm_images and run_scanner)
+    with _lock(key):
+        if ttl and cache.get(key):
+            return CACHED
+
+        ref = f'{image}:{tag}'
+        try:
+            digest = client.images.get_registry_data(ref).id
+        except APIError as e:
+            # registry might not support it (or be down), just pull as before
+            logger.debug('failed to get digest of %s: %s', ref, e)
+            digest = None
+        if digest is not None and digest in _local_digests(client, ref):
+            status = CURRENT
+        else:
+            client.images.pull(image, tag)
+            status = PULLED
+        if ttl:
+            cache.set(key, True, timeout=ttl)
+        return status
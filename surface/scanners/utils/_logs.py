@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django import db
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_log_line(line):
+    """
+    parse a docker log line (requested with timestamps=True)
+
+    :return: tuple with timestamp (datetime) and text, None if timestamp is not valid
+    """
+    if isinstance(line, bytes):
+        line = line.decode(errors='replace')
+    sep = line.find(' ')
+    _time = line[:sep]
+    text = line[sep + 1 :]
+    if not _time or _time[-1] != 'Z' or len(_time) != 30:
+        return None
+    # python datetime only supports microseconds, drop nanoseconds
+    return datetime.fromisoformat(_time[:-4] + '+00:00'), text
+
+
+def last_log_cursor(scan_log):
+    """
+    :return: `since` to use for container logs to resume after the last stored line (None if nothing stored)
+    """
+    last = scan_log.last_output_timestamp()
+    if last is not None:
+        # slight bump to avoid repeated (last) line
+        last += timedelta(microseconds=1)
+    return last
+
+
+class LogCollector:
+    """
+    keeps one follow=True log stream per running container (each in its own thread)
+    instead of polling (and querying last stored line) every loop
+
+    lines are kept in memory and written as output segments in batches, once SCANNERS_LOG_BATCH_SIZE lines are pending
+    or the oldest pending line is older than SCANNERS_LOG_FLUSH_INTERVAL seconds (see `start`).
+    A stream is resumed from the last stored line when first followed (such as after a restart)
+    and from the in-memory cursor when re-followed (such as after a connection drop)
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, echo=None):
+        """
+        :param echo: optional callable receiving (scan_log, timestamp, text) for each line written
+        """
+        self.batch_size = batch_size or settings.SCANNERS_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.SCANNERS_LOG_FLUSH_INTERVAL
+        self.echo = echo
+        # scan_log pk => follower thread
+        self._followers = {}
+        # scan_log pk => timestamp of last line received
+        self._cursors = {}
+        self._pending = []
+        self._pending_since = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer = None
+
+    def following(self, scan_log):
+        t = self._followers.get(scan_log.pk)
+        return t is not None and t.is_alive()
+
+    def follow(self, container, scan_log):
+        """
+        start following `container` logs (into `scan_log`), if not already
+        """
+        if self.following(scan_log):
+            return False
+        since = self._cursors.get(scan_log.pk)
+        if since is None:
+            since = last_log_cursor(scan_log)
+        else:
+            since += timedelta(microseconds=1)
+        t = threading.Thread(
+            target=self._follow, args=(container, scan_log, since), name=f'logs-{scan_log.name}', daemon=True
+        )
+        self._followers[scan_log.pk] = t
+        t.start()
+        return True
+
+    def wait(self, scan_log, timeout=None):
+        """
+        wait for the log stream to end (container exited) and write everything that is pending
+        """
+        t = self._followers.pop(scan_log.pk, None)
+        if t is not None:
+            t.join(timeout)
+        self._cursors.pop(scan_log.pk, None)
+        self.flush()
+
+    def _follow(self, container, scan_log, since):
+        buf = b''
+        try:
+            for chunk in container.logs(stream=True, follow=True, timestamps=True, since=since):
+                buf += chunk
+                *lines, buf = buf.split(b'\n')
+                self._add(scan_log, lines)
+            if buf:
+                self._add(scan_log, [buf])
+        except Exception:
+            # follow() will be called again in next loop (if still running)
+            logger.exception('log stream failed for %s', scan_log.name)
+
+    def _add(self, scan_log, lines):
+        parsed = []
+        for line in lines:
+            p = parse_log_line(line)
+            if p is None:
+                logger.error('invalid time string: %s', line)
+                continue
+            parsed.append((scan_log, p[0], p[1]))
+        if not parsed:
+            return
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.extend(parsed)
+            self._cursors[scan_log.pk] = parsed[-1][1]
+
+    def due(self):
+        with self._lock:
+            if not self._pending:
+                return False
+            return (
+                len(self._pending) >= self.batch_size or time.monotonic() - self._pending_since >= self.flush_interval
+            )
+
+    def flush(self):
+        """
+        write pending lines
+
+        :return: number of lines written
+        """
+        from scanners.models import ScanOutputSegment
+
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            by_log = {}
+            for scan_log, ts, text in pending:
+                by_log.setdefault(scan_log.pk, (scan_log, []))[1].append((ts, text))
+            written = set()
+            try:
+                for pk, (scan_log, lines) in by_log.items():
+                    ScanOutputSegment.objects.append(scan_log, lines)
+                    written.add(pk)
+            except Exception:
+                # put the ones not written back for next flush
+                with self._lock:
+                    self._pending[:0] = [x for x in pending if x[0].pk not in written]
+                raise
+        if self.echo is not None:
+            for scan_log, ts, text in pending:
+                self.echo(scan_log, ts, text)
+        return len(pending)
+
+    def _run_writer(self):
+        try:
+            while not self._stop.wait(0.5):
+                if self.due():
+                    try:
+                        self.flush()
+                    except Exception:
+                        logger.exception('failed to write scan output')
+            self.flush()
+        finally:
+            db.connections.close_all()
+
+    def start(self):
+        """
+        start background writer thread, otherwise `flush` needs to be called explicitly
+        """
+        self._writer = threading.Thread(target=self._run_writer, name='logs-writer', daemon=True)
+        self._writer.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+        else:
+            self.flush()
@@ -0,0 +1,155 @@
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+# container label with the input digest, stored in ScanLog.input_hash
+INPUT_HASH_LABEL = 'surface.input_hash'
+
+
+class InputSnapshot:
+    """
+    generated input, one item per line, stored gzipped with its content hash (sha256) and row count
+
+    shared snapshots (SCANNERS_INPUT_SNAPSHOT_TTL) are stored in SCANNERS_INPUT_SNAPSHOT_DIR as
+    KEY-DIGEST.gz plus KEY.json pointing to the current one, so a snapshot being read is never modified
+    (a new one is written next to it and the old one removed, still readable by whoever has it open)
+    """
+
+    def __init__(self, path, digest, count, created, shared=True):
+        self.path = path
+        self.digest = digest
+        self.count = count
+        self.created = created
+        self.shared = shared
+        self._file = open(path, 'rb')
+
+    def __iter__(self):
+        """
+        lines (bytes, including new line)
+        """
+        self._file.seek(0)
+        with gzip.GzipFile(fileobj=self._file, mode='rb') as f:
+            yield from f
+
+    def age(self):
+        return time.time() - self.created
+
+    def close(self):
+        self._file.close()
+        # private (not shared) snapshots are removed once used
+        if not self.shared:
+            _unlink(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @classmethod
+    def write(cls, items, base, key=None):
+        """
+        write `items` (strings) as a new snapshot in `base` directory
+
+        :param key: snapshot key for shared snapshots, None for a private one
+        """
+        digest = hashlib.sha256()
+        count = 0
+        fd, tmp = tempfile.mkstemp(dir=base, prefix='.tmp-')
+        try:
+            # mtime=0 so the same content produces the same file
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0) as f:
+                for item in items:
+                    data = item.encode() + b'\n'
+                    f.write(data)
+                    digest.update(data)
+                    count += 1
+        except BaseException:
+            _unlink(tmp)
+            raise
+        digest = digest.hexdigest()
+        created = time.time()
+        if key is None:
+            return cls(tmp, digest, count, created, shared=False)
+
+        path = os.path.join(base, f'{key}-{digest}.gz')
+        os.replace(tmp, path)
+        previous = _read_meta(base, key)
+        with open(os.path.join(base, f'.tmp-{key}.json'), 'w') as f:
+            json.dump({'digest': digest, 'count': count, 'created': created}, f)
+        os.replace(f.name, os.path.join(base, f'{key}.json'))
+        if previous is not None and previous['digest'] != digest:
+            _unlink(os.path.join(base, f'{key}-{previous["digest"]}.gz'))
+        return cls(path, digest, count, created)
+
+    @classmethod
+    def load(cls, base, key):
+        """
+        :return: current snapshot for `key` or None if there is none
+        """
+        meta = _read_meta(base, key)
+        if meta is None:
+            return None
+        try:
+            return cls(os.path.join(base, f'{key}-{meta["digest"]}.gz'), meta['digest'], meta['count'], meta['created'])
+        except FileNotFoundError:
+            # replaced in the meantime
+            return None
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_meta(base, key):
+    try:
+        with open(os.path.join(base, f'{key}.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def snapshot_key(input_name, params=None):
+    return hashlib.sha256(json.dumps([input_name, params or {}], sort_keys=True).encode()).hexdigest()
+
+
+def input_snapshot(input_name, generate, params=None, ttl=None):
+    """
+    snapshot of input `input_name`, re-using the one for the same `params` if newer than `ttl` seconds
+
+    :param generate: callable returning the input items, only called if the snapshot needs to be (re)generated
+    :param ttl: override SCANNERS_INPUT_SNAPSHOT_TTL, 0 not to share (always generated, removed on `close()`)
+    :return: InputSnapshot, to be closed once used
+    """
+    if ttl is None:
+        ttl = settings.SCANNERS_INPUT_SNAPSHOT_TTL
+    base = settings.SCANNERS_INPUT_SNAPSHOT_DIR or os.path.join(tempfile.gettempdir(), 'surface_inputs')
+    os.makedirs(base, exist_ok=True)
+
+    if not ttl:
+        return InputSnapshot.write(generate(), base)
+
+    key = snapshot_key(input_name, params)
+    snapshot = InputSnapshot.load(base, key)
+    if snapshot is not None:
+        if snapshot.age() < ttl:
+            return snapshot
+        snapshot.close()
+    # one process generates it, the others wait and re-use it
+    with open(os.path.join(base, f'{key}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshot = InputSnapshot.load(base, key)
+        if snapshot is not None:
+            if snapshot.age() < ttl:
+                return snapshot
+            snapshot.close()
+        return InputSnapshot.write(generate(), base, key=key)
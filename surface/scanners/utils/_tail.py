@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Channel:
+    def __init__(self, scan_log, cursor):
+        self.scan_log = scan_log
+        self.cursor = cursor
+        self.subscribers = set()
+        self.task = None
+
+
+class OutputBroadcaster:
+    """
+    fan out new output lines (and state changes) of a ScanLog to every viewer (live tail)
+
+    a single task per ScanLog (per event loop) checks for new lines every SCANNERS_OUTPUT_STREAM_INTERVAL seconds
+    and pushes them to the subscribed queues, instead of one query per viewer.
+    The task stops once there are no subscribers left or the ScanLog is no longer running.
+
+    events are tuples: ('line', OutputLine), ('state', state display), ('end', state display)
+    and ('ping', None) when nothing happened for `keepalive` seconds
+    """
+
+    def __init__(self, interval=None, keepalive=15):
+        self.interval = interval
+        self.keepalive = keepalive
+        # event loop => {scan_log pk => _Channel}
+        self._channels = weakref.WeakKeyDictionary()
+
+    def _loop_channels(self):
+        return self._channels.setdefault(asyncio.get_running_loop(), {})
+
+    @staticmethod
+    def _fetch(scan_log, cursor):
+        scan_log.refresh_from_db(fields=['state', 'exit_code'])
+        return list(scan_log.iter_output(since=cursor)), scan_log.state, scan_log.get_state_display()
+
+    def _publish(self, channel, event):
+        for queue in channel.subscribers:
+            queue.put_nowait(event)
+
+    async def _run(self, channel):
+        from scanners.models import ScanLog
+
+        state = channel.scan_log.state
+        try:
+            while channel.subscribers:
+                await asyncio.sleep(self.interval or settings.SCANNERS_OUTPUT_STREAM_INTERVAL)
+                try:
+                    lines, new_state, display = await sync_to_async(self._fetch)(channel.scan_log, channel.cursor)
+                except Exception:
+                    logger.exception('failed fetching output for %s', channel.scan_log)
+                    continue
+                for line in lines:
+                    self._publish(channel, ('line', line))
+                if lines:
+                    channel.cursor = lines[-1].timestamp
+                if new_state != state:
+                    state = new_state
+                    self._publish(channel, ('state', display))
+                if state != ScanLog.States.RUNNING:
+                    self._publish(channel, ('end', display))
+                    break
+        finally:
+            channels = self._loop_channels()
+            if channels.get(channel.scan_log.pk) is channel:
+                channels.pop(channel.scan_log.pk)
+
+    async def subscribe(self, scan_log, cursor=None):
+        """
+        async generator of events for `scan_log`, starting after `cursor` (timestamp)
+        """
+        from scanners.models import ScanLog
+
+        queue = asyncio.Queue()
+        channels = self._loop_channels()
+        channel = channels.get(scan_log.pk)
+        if channel is None:
+            channel = channels[scan_log.pk] = _Channel(scan_log, None)
+        channel.subscribers.add(queue)
+        try:
+            # catch up on what this viewer is missing, then follow the shared channel (skipping repeated lines)
+            lines, state, display = await sync_to_async(self._fetch)(scan_log, cursor)
+            last = cursor
+            for line in lines:
+                yield 'line', line
+                last = line.timestamp
+            if state != ScanLog.States.RUNNING:
+                yield 'end', display
+                return
+            if channel.task is None:
+                channel.cursor = last
+                channel.task = asyncio.ensure_future(self._run(channel))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield 'ping', None
+                    continue
+                if event[0] == 'line':
+                    if last is not None and event[1].timestamp <= last:
+                        continue
+                    last = event[1].timestamp
+                yield event
+                if event[0] == 'end':
+                    return
+        finally:
+            channel.subscribers.discard(queue)
+            if not channel.subscribers and channel.task is None and channels.get(scan_log.pk) is channel:
+                # left before following
+                channels.pop(scan_log.pk)
+
+    def stats(self):
+        try:
+            channels = self._loop_channels()
+        except RuntimeError:
+            # no running loop
+            return {}
+        return {pk: len(c.subscribers) for pk, c in channels.items()}
+
+
+output_broadcaster = OutputBroadcaster()
@@ -213,6 +213,12 @@ SIDEBAR = {
                     "link": reverse_lazy("admin:scanners_scanlog_changelist"),
                     "permission": check_permission("scanners.view_scanlog"),
                 },
+                {
+                    "title": "Scanners Runs",
+                    "icon": "call_split",
+                    "link": reverse_lazy("admin:scanners_scanrun_changelist"),
+                    "permission": check_permission("scanners.view_scanrun"),
+                },
                 {
                     "title": "Rootboxes",
                     "icon": "dns",